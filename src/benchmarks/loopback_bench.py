@@ -0,0 +1,293 @@
+"""
+Purpose:
+
+End-to-end loopback benchmark for the streaming pipeline. Everything
+runs on localhost against a synthetic MJPEG file, each stage on its own
+and then together:
+
+    - VideoStream.nextFrame read rate, from the file and from the
+      shared FrameStore mapping;
+    - RtpPacket encode (encapsulate) and decode ops/s, and
+      RtpPacketizer.packetize frames/s, also from a HintTrack;
+    - the server (ServerLauncher in a child process) at 1, 10, 100 and
+      1000 sessions driven by the LoadGenerator: packets/s delivered,
+      loss, frame rate, server CPU per session and the SETUP to first
+      frame latency.
+
+With --hinted the movie gets a hint track before the server runs, so 
+the server levels measure the hinted send path; compare such a run 
+with a plain one through --compare. 
+
+Results are written as JSON. Given an earlier result file, --compare
+flags every metric that got worse by more than --threshold and exits
+with status 1, so the suite can gate a change.
+
+The load generator is a single process on the same machine; when its
+client_cpu_pct nears 100 the numbers describe the generator, not the
+server. The 1000 session level needs about 5000 file descriptors; the soft
+open file limit is raised to the hard limit where allowed.
+
+Usage (from src/):
+    python benchmarks/loopback_bench.py [--sessions 1,10,100,1000] [--modes threaded,async]
+        [--hinted] [--output results.json] [--compare baseline.json] [--threshold 0.1]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "main")
+sys.path.insert(0, MAIN)
+
+from VideoStream import VideoStream
+from FrameStore import FrameStore
+from RtpPacket import RtpPacket
+from RtpPacketizer import RtpPacketizer
+from LoadGenerator import LoadGenerator
+from HintTrack import HintTrack, HINT_EXT
+
+# Metrics where a smaller value is better; for everything else bigger is better
+LOWER_IS_BETTER = ("_ms", "cpu_pct", "loss_pct")
+
+
+def write_movie(path, frames, frameSize, seed=0):
+    """Writes an MJPEG file of frames that start with SOI and end with EOI."""
+    rng = random.Random(seed)
+    with open(path, "wb") as file:
+        for _ in range(frames):
+            size = max(4, int(frameSize * rng.uniform(0.8, 1.2)))
+            frame = b"\xff\xd8" + rng.randbytes(size - 4) + b"\xff\xd9"
+            file.write(b"%05d" % len(frame) + frame)
+
+
+def rate(function, number):
+    """Returns calls of function per second, best of three runs."""
+    return number / min(timeit.repeat(function, number=number, repeat=3))
+
+
+def bench_video_stream(movie):
+    results = {}
+    for name, store in (("file", None), ("mmap", FrameStore())):
+        frames = 0
+        nbytes = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < 1.0:
+            stream = VideoStream(movie, store=store)
+            while True:
+                data = stream.nextFrame()
+                if not data:
+                    break
+                frames += 1
+                nbytes += len(data)
+            stream.close()
+        elapsed = time.perf_counter() - start
+        results["video_stream.next_frame." + name] = {
+            "frames_per_s": frames / elapsed, "mb_per_s": nbytes / elapsed / 1e6}
+    return results
+
+
+def bench_rtp_packet(movie, frameSize, number):
+    payload = bytes(1400 - 12)
+    packet = RtpPacket()
+    packet.encapsulate(2, 0, 0, 0, 0, 26, 4242, 0x1234, payload, 0)
+    data = packet.get_packet()
+    frame = b"\xff\xd8" + bytes(frameSize - 4) + b"\xff\xd9"
+    packetizer = RtpPacketizer(ssrc=0x1234)
+    # The movie's first frame, hinted
+    track = HintTrack.build(movie)
+    stream = VideoStream(movie)
+    first = stream.nextFrame()
+    stream.close()
+
+    def encode():
+        packet.encapsulate(2, 0, 0, 0, 0, 26, 4242, 0x1234, payload, 0)
+        packet.get_packet()
+
+    def decode():
+        RtpPacket().decode(data)
+
+    return {
+        "rtp_packet.encode": {"ops_per_s": rate(encode, number)},
+        "rtp_packet.decode": {"ops_per_s": rate(decode, number)},
+        "rtp_packetizer.packetize": {"frames_per_s": rate(lambda: packetizer.packetize(frame, 0), number // 10)},
+        "rtp_packetizer.packetize_first_frame": {
+            "frames_per_s": rate(lambda: packetizer.packetize(first, 0), number // 10)},
+        "rtp_packetizer.packetize_hinted": {
+            "frames_per_s": rate(lambda: packetizer.packetize_hinted(track.templates(0), track.fragments(0, first), 0),
+                                 number // 10)},
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_server(port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError("server did not start listening on port %d" % port)
+
+
+def process_cpu(pid):
+    """Returns the CPU seconds process pid has used so far, or None where /proc is not available."""
+    try:
+        with open("/proc/%d/stat" % pid) as file:
+            # utime and stime are the 14th and 15th fields; the command name before them may hold spaces
+            fields = file.read().rpartition(")")[2].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def bench_server(movie, mode, sessions, ramp, duration):
+    """Runs the server in a child process under LoadGenerator sessions and returns its metrics."""
+    port = free_port()
+    server = subprocess.Popen([sys.executable, "ServerLauncher.py", "--host", "127.0.0.1",
+                               "--port", str(port), "--mode", mode],
+                              cwd=MAIN, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_server(port)
+        # A run too short to see a whole ramp would only measure the ramp
+        ramp = min(ramp, duration)
+        generator = LoadGenerator("127.0.0.1", port, movie, sessions, ramp, duration, seed=sessions)
+        # Only the CPU used under load: not the server's start-up or the wait for it to listen
+        serverCpu = process_cpu(server.pid)
+        wall = time.perf_counter()
+        clientCpu = time.process_time()
+        report = asyncio.run(generator.run())
+        clientCpu = time.process_time() - clientCpu
+        wall = time.perf_counter() - wall
+        if serverCpu is not None:
+            serverCpu = process_cpu(server.pid) - serverCpu
+    finally:
+        server.terminate()
+        # wait4() reaps the child with its resource usage; tell Popen it is gone
+        _, _, usage = os.wait4(server.pid, 0)
+        server.returncode = -1
+    # Without /proc, the child's whole lifetime is all there is
+    cpu = serverCpu if serverCpu is not None else usage.ru_utime + usage.ru_stime
+
+    summaries = report["per_session"]
+    packets = sum(summary["packets"] / summary["playing_s"] for summary in summaries if summary["playing_s"])
+    firstFrame = report["latency"]["first_frame"]
+    return {
+        "sessions": sessions,
+        "failed": sum(report["errors"].values()),
+        "packets_per_s": packets,
+        "fps_p50": report["fps"]["p50"],
+        "loss_pct": report["loss_pct"],
+        "server_cpu_pct": 100 * cpu / wall,
+        "server_cpu_pct_per_session": 100 * cpu / wall / sessions,
+        "first_frame_p50_ms": firstFrame["p50_ms"],
+        "first_frame_p99_ms": firstFrame["p99_ms"],
+        "setup_p50_ms": report["latency"]["SETUP"]["p50_ms"],
+        # Near 100% the load generator, not the server, is the bottleneck
+        "client_cpu_pct": 100 * clientCpu / wall,
+    }
+
+
+def raise_file_limit():
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard if hard != resource.RLIM_INFINITY else 65536, hard))
+
+
+def compare(results, baseline, threshold):
+    """Returns (metric, old, new) for every metric worse than baseline by more than threshold."""
+    regressions = []
+    for stage, metrics in results.items():
+        for name, new in metrics.items():
+            old = baseline.get(stage, {}).get(name)
+            if name == "sessions" or not isinstance(old, (int, float)) or not old:
+                continue
+            change = (new - old) / abs(old)
+            if name == "failed" or any(marker in name for marker in LOWER_IS_BETTER):
+                change = -change
+            if change < -threshold:
+                regressions.append(("%s.%s" % (stage, name), old, new))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end loopback benchmark")
+    parser.add_argument("--sessions", default="1,10,100,1000", help="comma separated session counts")
+    parser.add_argument("--modes", default="threaded,async", help="comma separated server modes")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds of streaming per level")
+    parser.add_argument("--ramp", type=float, default=2.0, help="seconds over which sessions start")
+    parser.add_argument("--frames", type=int, default=200, help="frames in the synthetic movie")
+    parser.add_argument("--frame-size", type=int, default=4000, help="average frame size in bytes")
+    parser.add_argument("--number", type=int, default=100000, help="calls per microbenchmark run")
+    parser.add_argument("--hinted", action="store_true", help="serve the movie from a hint track")
+    parser.add_argument("--output", default="loopback_bench.json", help="where to write the results")
+    parser.add_argument("--compare", metavar="BASELINE", help="earlier result file to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="relative change counted as a regression (default 0.10)")
+    args = parser.parse_args()
+
+    raise_file_limit()
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        movie = os.path.join(tmp, "bench.Mjpeg")
+        write_movie(movie, args.frames, args.frame_size)
+        results.update(bench_video_stream(movie))
+        results.update(bench_rtp_packet(movie, args.frame_size, args.number))
+        if args.hinted:
+            HintTrack.build(movie).save(movie + HINT_EXT)
+        for stage in sorted(results):
+            print("%-34s %s" % (stage, "  ".join("%s %.0f" % item for item in results[stage].items())))
+
+        for mode in args.modes.split(","):
+            for sessions in [int(count) for count in args.sessions.split(",")]:
+                stage = "server.%s.%d" % (mode, sessions)
+                results[stage] = bench_server(movie, mode, sessions, args.ramp, args.duration)
+                metrics = results[stage]
+                print("%-34s %8.0f pkt/s  %5.1f fps  loss %5.2f%%  cpu/session %6.2f%%  first frame p50 %6.1f ms"
+                      "  client cpu %3.0f%%  failed %d" % (stage, metrics["packets_per_s"], metrics["fps_p50"], metrics["loss_pct"],
+                      metrics["server_cpu_pct_per_session"], metrics["first_frame_p50_ms"], metrics["client_cpu_pct"], metrics["failed"]))
+
+    document = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as file:
+        json.dump(document, file, indent=2)
+    print("results written to", args.output)
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for metric, old, new in regressions:
+            print("REGRESSION %s: %.2f -> %.2f" % (metric, old, new))
+        if regressions:
+            sys.exit(1)
+        print("no regressions beyond %.0f%%" % (100 * args.threshold))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Purpose:
+
+Microbenchmark for RtpPacket.encapsulate. It times the struct based 
+header encoder against the original bitstring based encoder (kept here 
+as legacy_encapsulate so it is no longer on the server hot path) and 
+checks that both produce byte-identical packets before timing them.
+
+Usage (from src/):
+    python benchmarks/rtp_packet_bench.py [--number N]
+
+The legacy path needs the `bitstring` package; if it is missing only the
+new encoder is timed.
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "main"))
+
+from RtpPacket import RtpPacket, HEADER_SIZE, MAX_LENGTHS
+
+PAYLOAD = bytes(range(256)) * 40   # ~10 KB, about one 320x240 MJPEG frame
+FIELDS = (2, 0, 0, 0, 0, 26, 4242, 0)
+
+
+def legacy_encapsulate(version, padding, extension, contr_sources, marker,
+                       payload_type, seq_num, sync_source_id, payload, timestamp):
+    """The pre-struct encoder: every field goes through a BitArray."""
+    from bitstring import BitArray
+
+    def to_bin(num, length):
+        return BitArray(uint=num, length=length).bin
+
+    def to_uint(bits):
+        return BitArray(bin=bits).uint
+
+    header = bytearray(HEADER_SIZE)
+    byte_0 = (to_bin(version, MAX_LENGTHS["version"]) + to_bin(padding, MAX_LENGTHS["padding"]) +
+              to_bin(extension, MAX_LENGTHS["extension"]) +
+              to_bin(contr_sources, MAX_LENGTHS["contr_sources"]))
+    byte_1 = to_bin(marker, MAX_LENGTHS["marker"]) + to_bin(payload_type, MAX_LENGTHS["payload_type"])
+    bytes_2_3 = to_bin(seq_num, MAX_LENGTHS["seq_num"])
+    bytes_4_7 = to_bin(timestamp, MAX_LENGTHS["timestamp"])
+    bytes_8_11 = to_bin(sync_source_id, MAX_LENGTHS["sync_source_id"])
+
+    header[0] = to_uint(byte_0)
+    header[1] = to_uint(byte_1)
+    header[2] = to_uint(bytes_2_3[0:8])
+    header[3] = to_uint(bytes_2_3[8:])
+    for i in range(4):
+        header[4 + i] = to_uint(bytes_4_7[i * 8:(i + 1) * 8])
+        header[8 + i] = to_uint(bytes_8_11[i * 8:(i + 1) * 8])
+    return header + payload
+
+
+def have_bitstring():
+    try:
+        import bitstring  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def check_identical():
+    """Encodes a spread of field values with both encoders and compares."""
+    packet = RtpPacket()
+    for seq_num in (0, 1, 255, 256, 4242, 65535):
+        for marker in (0, 1):
+            fields = (2, 0, 0, 0, marker, 26, seq_num, 0xDEADBEEF)
+            packet.encapsulate(*fields, PAYLOAD)
+            expected = legacy_encapsulate(*fields, PAYLOAD, packet.timestamp)
+            if packet.get_packet() != expected:
+                raise AssertionError("encoders differ for %r" % (fields,))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--number", type=int, default=20000, help="packets per timing run")
+    args = parser.parse_args()
+
+    packet = RtpPacket()
+
+    def encode():
+        packet.encapsulate(*FIELDS, PAYLOAD)
+        return packet.get_packet()
+
+    new = min(timeit.repeat(encode, number=args.number, repeat=3))
+    print("struct encoder:    %10.0f packets/s" % (args.number / new))
+
+    if not have_bitstring():
+        print("bitstring not installed, skipping legacy encoder")
+        return
+
+    check_identical()
+    legacy_number = max(1, args.number // 10)
+    legacy = min(timeit.repeat(lambda: legacy_encapsulate(*FIELDS, PAYLOAD, 0),
+                               number=legacy_number, repeat=3))
+    print("bitstring encoder: %10.0f packets/s" % (legacy_number / legacy))
+    print("speedup:           %10.1fx" % ((legacy / legacy_number) / (new / args.number)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Purpose:
+
+Parse-throughput benchmark for RtspCodec. It feeds a stream of typical 
+client requests to RtspParser in chunks of different sizes (to mimic 
+TCP splitting and coalescing) and reports messages/s and MB/s, then 
+times RtspRequest.encode() and RtspRequest.fromMessage().
+
+Usage (from src/):
+    python benchmarks/rtsp_codec_bench.py [--messages N]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "main"))
+
+from RtspCodec import RtspParser
+import RtspRequest as rq
+
+CHUNK_SIZES = (1, 64, 1460, 65536)
+
+
+def request_stream(count):
+    requests = []
+    for seq in range(1, count + 1):
+        reqType = ("SETUP", "PLAY", "PAUSE", "TEARDOWN")[seq % 4]
+        requests.append(rq.RtspRequest(reqType, seq, "./movie.Mjpeg", 1025, session=123456)
+                        .encode("127.0.0.1:8000"))
+    return b"".join(requests)
+
+
+def time_parse(data, chunk, expected):
+    parser = RtspParser()
+    parsed = 0
+    start = time.perf_counter()
+    for offset in range(0, len(data), chunk):
+        parsed += len(parser.feed(data[offset:offset + chunk]))
+    elapsed = time.perf_counter() - start
+    if parsed != expected:
+        raise AssertionError("parsed %d of %d messages" % (parsed, expected))
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=20000, help="requests in the stream")
+    args = parser.parse_args()
+
+    data = request_stream(args.messages)
+    for chunk in CHUNK_SIZES:
+        # byte-at-a-time is slow by nature, keep it to a tenth of the stream
+        sample = data if chunk > 1 else request_stream(args.messages // 10)
+        count = args.messages if chunk > 1 else args.messages // 10
+        elapsed = time_parse(sample, chunk, count)
+        print("parse, %5d-byte reads: %9.0f msgs/s %7.1f MB/s"
+              % (chunk, count / elapsed, len(sample) / elapsed / 1e6))
+
+    request = rq.RtspRequest("PLAY", 1, "./movie.Mjpeg", 1025, session=123456)
+    start = time.perf_counter()
+    for _ in range(args.messages):
+        request.encode("127.0.0.1:8000")
+    print("RtspRequest.encode:          %9.0f msgs/s" % (args.messages / (time.perf_counter() - start)))
+
+    messages = RtspParser().feed(data)
+    start = time.perf_counter()
+    for message in messages:
+        rq.RtspRequest.fromMessage(message)
+    print("RtspRequest.fromMessage:     %9.0f msgs/s" % (len(messages) / (time.perf_counter() - start)))
+
+
+if __name__ == "__main__":
+    main()
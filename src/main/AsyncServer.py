@@ -0,0 +1,239 @@
+"""
+Purpose: 
+
+The AsyncServer runs every RTSP session of the server on one asyncio 
+event loop instead of a recvRtspRequest thread per connection. RTSP 
+requests are read from a StreamReader and replies written to the 
+StreamWriter; RTP leaves through one datagram 
+transport shared by all sessions. With no thread stacks and no GIL
+handoffs per session, one process can hold thousands of sessions. 
+
+AsyncSession is a ServerWorker: it keeps the same INIT/READY/PLAYING 
+state machine (processRtspRequest) and only overrides how replies are 
+written and how RTP sending is started, stopped and torn down. The 
+threaded ServerWorker remains the default server mode; ServerLauncher 
+selects this one with --mode async. 
+
+RTP packets are written straight to the shared UDP socket with a 
+vectored send; only when the socket would block does a packet fall back
+to the transport, which copies and queues it. RTCP also shares one 
+socket: receiver reports and NACKs are routed to the session whose SSRC
+they are about. 
+"""
+import asyncio
+import logging
+import socket
+from time import time, perf_counter
+
+from ServerWorker import ServerWorker, SEND_TIME
+from Profiler import PROFILER
+from PacingScheduler import PacingClock, PacingStats, CATCH_UP
+from RtpPacketizer import send_packet
+from RtcpPacket import parse_rtcp
+from PacketHistory import DEFAULT_BUDGET
+from SessionTable import SessionTable
+from SampledLogger import SampledLogger
+from RtspCodec import RtspParser, RtspError
+
+log = logging.getLogger(__name__)
+sampledLog = SampledLogger(__name__)
+
+LISTEN_BACKLOG = 1024
+
+class AsyncSession(ServerWorker): 
+
+    def __init__(self, server, reader, writer):
+        ServerWorker.__init__(self, {'rtspSocket': (writer, writer.get_extra_info('peername')),
+                                     'frameRates': server.frameRates,
+                                     'historyBytes': server.historyBytes,
+                                     'rateControl': server.rateControl, 
+                                     'liveSources': server.liveSources,
+                                     'variantCache': server.variantCache})
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.rtpTask = None
+
+    async def run(self) -> None: 
+        """ Serve RTSP requests until the client disconnects."""
+        self.server.sessions.add(self)
+        parser = RtspParser()
+        try: 
+            while True: 
+                data = await self.reader.read(4096)
+                if not data: 
+                    break
+                for message in parser.feed(data): 
+                    self.processRtspMessage(message)
+        except (ConnectionError, RtspError): 
+            pass
+        finally: 
+            self.server.sessions.remove(self)
+            self.stopRtp()
+            self.closeRtp()
+            self.writer.close()
+
+    def writeRtsp(self, data) -> None: 
+        """ Write serialized RTSP data through the stream writer."""
+        self.writer.write(data)
+
+    def startRtp(self) -> None: 
+        self.rtpTask = asyncio.ensure_future(self.streamRtp())
+
+    def stopRtp(self) -> None: 
+        if self.rtpTask is not None: 
+            self.rtpTask.cancel()
+            self.rtpTask = None
+
+    def openRtp(self) -> tuple: 
+        # RTP and RTCP sockets are shared, RTCP finds this session by its SSRC.
+        self.server.rtcpSessions[self.packetizer.ssrc] = self
+        return self.server.rtpSocket.getsockname()[1], self.server.rtcpSocket.getsockname()[1]
+
+    def sendRtcp(self, data) -> None: 
+        if self.clientInfo.get('rtpPort') is not None: 
+            self.server.sendRtcp(data, (self.clientInfo['rtspSocket'][1][0], self.clientInfo['rtpPort'] + 1))
+
+    def resendRtp(self, packet) -> None: 
+        address = (self.clientInfo['rtspSocket'][1][0], self.clientInfo['rtpPort'])
+        self.server.sendRtp(packet, b"", address)
+
+    def closeRtp(self) -> None: 
+        # The RTP transport is shared, only the media goes back to the store.
+        if 'videoStream' in self.clientInfo: 
+            self.clientInfo.pop('videoStream').close()
+        if self.server.rtcpSessions.get(self.packetizer.ssrc) is self: 
+            del self.server.rtcpSessions[self.packetizer.ssrc]
+            if self.rtcpStats: 
+                log.info("Session %s RTCP: %s", self.clientInfo.get('session'), self.rtcpStats)
+
+    async def streamRtp(self) -> None: 
+        """ Send one frame per deadline until cancelled by PAUSE or TEARDOWN."""
+        address = (self.clientInfo['rtspSocket'][1][0], self.clientInfo['rtpPort'])
+        loop = asyncio.get_running_loop()
+        pacing = PacingClock(self.frameRate, loop.time(), self.server.pacingPolicy)
+        while True: 
+            await asyncio.sleep(pacing.deadline - loop.time())
+            error, skip = pacing.due(loop.time())
+            self.server.pacingStats.record(error, skip)
+            timer = PROFILER.timer(self) if PROFILER.enabled else None
+            try: 
+                self.streamFrame(address, skip, timer)
+            except Exception as e: 
+                # One bad frame must not end the stream
+                sampledLog.warning("stream", "Pacing: send failed: %s", e)
+            if timer is not None: 
+                timer.finish()
+
+    def streamFrame(self, address, skip=0, timer=None) -> None: 
+        """ Read, send and record the next frame for streamRtp."""
+        packets = self.nextPackets(skip, timer)
+        if not packets: 
+            return
+        start = perf_counter()
+        for header, payload in packets: 
+            self.server.sendRtp(header, payload, address)
+        if timer is not None: 
+            timer.mark("send")
+        for header, payload in self.protect(packets): 
+            self.server.sendRtp(header, payload, address)
+        if timer is not None: 
+            timer.mark("fec")
+        SEND_TIME.observe(perf_counter() - start)
+        self.recordSent(packets)
+        if timer is not None: 
+            timer.mark("record")
+
+class RtcpProtocol(asyncio.DatagramProtocol): 
+
+    def __init__(self, server):
+        self.server = server
+
+    def datagram_received(self, data, address) -> None: 
+        self.server.receiveRtcp(data, address)
+
+class AsyncServer: 
+
+    def __init__(self, host: str, port: int, frameRates: dict = None, pacingPolicy: str = CATCH_UP, 
+                 sessions: SessionTable = None, historyBytes: int = DEFAULT_BUDGET, 
+                 rateControl: bool = True, liveSources=None, variantCache=None):
+        self.host = host
+        self.port = port
+        self.frameRates = frameRates or {}
+        self.pacingPolicy = pacingPolicy
+        self.historyBytes = historyBytes
+        self.rateControl = rateControl
+        self.liveSources = liveSources
+        self.variantCache = variantCache
+        self.pacingStats = PacingStats()
+        self.sessions = sessions if sessions is not None else SessionTable()
+        self.rtpSocket = None
+        self.rtpTransport = None
+        self.rtcpSocket = None
+        self.rtcpTransport = None
+        self.rtcpSessions = {}
+
+    def sendRtp(self, header, payload, address) -> None: 
+        # Once packets wait in the transport, later ones queue behind them to keep their order
+        if not self.rtpTransport.get_write_buffer_size(): 
+            try: 
+                send_packet(self.rtpSocket, header, payload, address)
+                return
+            except BlockingIOError: 
+                pass
+            except OSError as e: 
+                # e.g. ENOBUFS or ENETUNREACH: the packet is lost, as it would be on the network
+                sampledLog.warning("send", "RTP send to %s failed: %s", address, e)
+                return
+        self.rtpTransport.sendto(bytes(header) + bytes(payload), address)
+
+    def sendRtcp(self, data, address) -> None: 
+        self.rtcpTransport.sendto(data, address)
+
+    def receiveRtcp(self, data, address) -> None: 
+        """ Hands an RTCP datagram to the sessions its report blocks are about."""
+        try: 
+            packets = parse_rtcp(data)
+        except ValueError as e: 
+            log.warning("RTCP: bad packet from %s: %s", address, e)
+            return
+        now = time()
+        ssrcs = {getattr(packet, 'media_ssrc', None) for packet in packets}
+        ssrcs.update(block.ssrc for packet in packets for block in getattr(packet, 'reports', ()))
+        for ssrc in ssrcs: 
+            session = self.rtcpSessions.get(ssrc)
+            if session is not None: 
+                session.processRtcp(packets, now)
+
+    async def handle(self, reader, writer) -> None: 
+        await AsyncSession(self, reader, writer).run()
+
+    async def serve(self, sock=None) -> None: 
+        """ 
+            Serve RTSP until cancelled, on sock if given (an already bound 
+            socket, e.g. from the ServerSupervisor) or else on host:port. 
+        """
+        loop = asyncio.get_running_loop()
+        self.rtpSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.rtpSocket.bind((self.host, 0))
+        self.rtpSocket.setblocking(False)
+        self.rtpTransport, _ = await loop.create_datagram_endpoint(
+            asyncio.DatagramProtocol, sock=self.rtpSocket)
+        self.rtcpSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.rtcpSocket.bind((self.host, 0))
+        self.rtcpTransport, _ = await loop.create_datagram_endpoint(
+            lambda: RtcpProtocol(self), sock=self.rtcpSocket)
+        if sock is None: 
+            server = await asyncio.start_server(self.handle, self.host, self.port, 
+                                                backlog=LISTEN_BACKLOG)
+        else: 
+            server = await asyncio.start_server(self.handle, sock=sock, backlog=LISTEN_BACKLOG)
+        try: 
+            async with server: 
+                await server.serve_forever()
+        finally: 
+            self.rtpTransport.close()
+            self.rtcpTransport.close()
+
+    def run(self, sock=None) -> None: 
+        asyncio.run(self.serve(sock))
@@ -0,0 +1,128 @@
+"""
+Purpose: 
+
+A BroadcastChannel streams one media file to every session watching it
+in sync. A single producer, paced by the PacingScheduler like any 
+session, reads each frame once and packetizes it once; the resulting 
+header and payload buffers are then sent to every subscribed session. 
+Only the per-session header fields, sequence number, timestamp and 
+SSRC, are patched in place before each session's sends, so the per-viewer cost is
+little more than the sendmsg() calls. 
+
+The channel runs while it has subscribers. A session that joins (PLAY) 
+or rejoins after PAUSE starts at the channel's current frame; when the 
+last session leaves, the channel stops and is dropped from the registry. 
+ServerLauncher enables channels with --broadcast (threaded mode). A 
+channel for a live:NAME source reads the source's ring through a single
+cursor, so a live camera is packetized once however many watch it. 
+"""
+import threading
+
+from VideoStream import VideoStream
+from LiveSource import is_live
+from FrameStore import FRAME_STORE
+from PacingScheduler import PACING_SCHEDULER
+from RtpPacketizer import RtpPacketizer, CLOCK_RATE, patch_header
+from Profiler import PROFILER
+
+class BroadcastChannel: 
+
+    def __init__(self, filename: str, frameRate: float, store=FRAME_STORE, 
+                 scheduler=PACING_SCHEDULER, liveSources=None):
+        self.filename = filename
+        self.frameRate = frameRate
+        self.scheduler = scheduler
+        if liveSources is not None and is_live(filename): 
+            self.videoStream = liveSources.attach(filename, frameRate)
+        else: 
+            self.videoStream = VideoStream(filename, frameRate, store=store)
+        self.packetizer = RtpPacketizer()
+        self.lock = threading.Lock()
+        self.subscribers = []
+
+    def subscribe(self, session) -> None: 
+        with self.lock: 
+            if session not in self.subscribers: 
+                self.subscribers.append(session)
+            first = len(self.subscribers) == 1
+        if first: 
+            self.scheduler.add(self, self.frameRate)
+
+    def unsubscribe(self, session) -> bool: 
+        """ Removes session. Returns true if the channel has no subscribers left."""
+        with self.lock: 
+            if session in self.subscribers: 
+                self.subscribers.remove(session)
+            empty = not self.subscribers
+        if empty: 
+            self.scheduler.remove(self)
+        return empty
+
+    def sendFrame(self, skip: int = 0) -> None: 
+        """ Called by the scheduler: packetize the next frame once and fan it out."""
+        timer = PROFILER.timer("channel:" + self.filename) if PROFILER.enabled else None
+        if skip: 
+            self.videoStream.skip(skip)
+        data = self.videoStream.nextFrame()
+        if timer is not None: 
+            timer.mark("read")
+        if not data: 
+            if timer is not None: 
+                timer.finish()
+            return
+
+        timestamp = int(self.videoStream.frameNbr() * CLOCK_RATE / self.frameRate)
+        packets = self.packetizer.packetize(data, timestamp)
+        if timer is not None: 
+            timer.mark("packetize")
+        with self.lock: 
+            subscribers = list(self.subscribers)
+
+        for session in subscribers: 
+            if not session.wantsFrame(): 
+                # Thinned out by the session's rate controller
+                continue
+            packetizer = session.packetizer
+            seq_num = packetizer.seq_num
+            # Each session keeps its own random timestamp offset
+            sessionTimestamp = timestamp + packetizer.timestamp_offset
+            for header, _ in packets: 
+                patch_header(header, seq_num, packetizer.ssrc, sessionTimestamp)
+                seq_num += 1
+            packetizer.seq_num = seq_num & 0xFFFF
+            session.sendPackets(packets, timer)
+        if timer is not None: 
+            timer.finish()
+
+    def close(self) -> None: 
+        self.videoStream.close()
+
+class ChannelRegistry: 
+
+    def __init__(self, store=FRAME_STORE, scheduler=PACING_SCHEDULER, liveSources=None):
+        self.store = store
+        self.scheduler = scheduler
+        self.liveSources = liveSources
+        self.lock = threading.Lock()
+        self.channels = {}
+
+    def join(self, filename: str, frameRate: float, session) -> BroadcastChannel: 
+        """ Subscribes session to the channel of filename, starting it if needed."""
+        with self.lock: 
+            channel = self.channels.get(filename)
+            if channel is None: 
+                channel = self.channels[filename] = BroadcastChannel(filename, frameRate, self.store, 
+                                                                   self.scheduler, self.liveSources)
+            channel.subscribe(session)
+        return channel
+
+    def leave(self, channel: BroadcastChannel, session) -> None: 
+        """ Unsubscribes session, stopping the channel once nobody watches it."""
+        with self.lock: 
+            if channel.unsubscribe(session) and self.channels.get(channel.filename) is channel: 
+                del self.channels[channel.filename]
+                channel.close()
+
+    def __len__(self) -> int: 
+        with self.lock: 
+            return len(self.channels)
@@ -1,5 +1,6 @@
 import sys
 import socket
+import logging
 
 # Author(s): Zak Hussain, Cat Smith
 # Credit: Kurose lab 6 code 
@@ -18,23 +19,50 @@ It does the following:
 """
 from tkinter import Tk
 from ClientWorker import ClientWorker
+from Metrics import MetricsServer
+from SampledLogger import configure_logging
+
+log = logging.getLogger(__name__)
+
 class ClientLauncher: 
 
     def main(self):
 
-        print("Client application is launching")
+        # DEBUG also logs a sample of the received sequence numbers
+        configure_logging("INFO")
+        log.info("Client application is launching")
         # In an actual application, these inputs would be read in from the 
         # command line. 
         serverAddr = '127.0.0.1'
         serverPort = 8000
         rtpPort = '1025'
         fileName = "./movie.Mjpeg"  
+        # Let the JPEG decoder scale frames down to the size of the window
+        downscale = False
+        # Playout delay bounds of the jitter buffer (seconds). A higher minimum 
+        # smooths playback on links with bursty delay at the cost of latency.
+        minDelay = 0.05
+        maxDelay = 0.5
+        # XOR parity FEC as (group size, interleaving depth), e.g. (5, 2) for 
+        # 20% overhead that survives bursts of two lost packets. None disables it.
+        fec = None
+        # Ask the server to resend lost packets that can still be played in time
+        nack = True
+        # Quality tier offered by the server (e.g. "small"), transcoded to a lower 
+        # resolution and JPEG quality. None plays the original.
+        tier = None
+        # Serve receive, loss and render metrics on http://127.0.0.1:<port>/metrics; None disables it
+        metricsPort = None
         
         # Set the root tKinter object to controll GUI Handles 
         root = Tk()
         
         # Create a new client
-        app = ClientWorker(root, serverAddr, serverPort, rtpPort, fileName)
+        app = ClientWorker(root, serverAddr, serverPort, rtpPort, fileName, downscale,
+                           minDelay, maxDelay, fec, nack, tier)
+
+        if metricsPort:
+            MetricsServer(metricsPort).start()
 
         app.master.title("RTPClient")   
         root.mainloop()
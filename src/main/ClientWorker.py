@@ -21,6 +21,10 @@ ClientWorker's responsibility include the following:
     - Changes client state upon receiving server's OK.
     - Opens sockets (for RTP, RTSP) as appropriate.
     - Listens for RTP packets and depacketizes.
+    - Keeps RTP reception statistics and reports them to the server in RTCP receiver reports.
+    - Optionally negotiates XOR parity FEC and repairs lost packets before reassembly.
+    - Optionally NACKs lost packets so the server resends them before their playout deadline.
+    - Counts packets and bytes received, loss, render latency and RTSP request latency in METRICS.
 
 - Cat Smith, 7 August 2020
 
@@ -28,49 +32,90 @@ ClientWorker's responsibility include the following:
 
 from tkinter import *
 import tkinter.messagebox as tkMessageBox
-from PIL import Image, ImageTk
-import socket, threading, sys, traceback, os
-import pickle
+import socket, threading, queue, sys, traceback, os, logging
+from random import getrandbits
+from time import monotonic
 from socket import *
 from RtpPacket import RtpPacket
-import RtspRequest as rq
-
-CACHE_FILE_NAME = "cache-"
-CACHE_FILE_EXT = ".jpg"
+from FrameReassembler import FrameReassembler
+from FrameDecoder import FrameDecoder
+from PIL import ImageTk
+from JitterBuffer import JitterBuffer, DEFAULT_MIN_DELAY, DEFAULT_MAX_DELAY
+from RtpReceiverStats import RtpReceiverStats
+from RtcpPacket import (RTCP_INTERVAL, FEEDBACK_HEADER_NAME, FEEDBACK_NACK, SenderReport,
+                        pack_receiver_report, pack_nack_request, parse_rtcp)
+from NackTracker import NackTracker
+from XorFec import FecDecoder, FEC_HEADER_NAME, format_fec_params, parse_fec_params
+from VariantCache import TIER_HEADER
+from RtspCodec import RtspParser, RtspError
+from RtspClient import RtspClient
+from Metrics import METRICS
+from SampledLogger import SampledLogger
+
+RTP_RECV_SIZE = 65536
+RTCP_RECV_SIZE = 2048
+RENDER_INTERVAL_MS = 5      # how often the Tk thread looks for decoded frames
+
+log = logging.getLogger(__name__)
+sampledLog = SampledLogger(__name__)
+
+PACKETS_RECEIVED = METRICS.counter("client_rtp_packets_received_total", "RTP packets received (FEC repairs included)")
+BYTES_RECEIVED = METRICS.counter("client_rtp_bytes_received_total", "RTP bytes received")
+PACKETS_LOST = METRICS.gauge("client_rtp_packets_lost", "RTP packets lost so far (RFC 3550 cumulative loss)")
+PLAYOUT_DELAY = METRICS.gauge("client_playout_delay_seconds", "Current jitter buffer playout delay")
+FRAMES_RENDERED = METRICS.counter("client_frames_rendered_total", "Frames shown in the window")
+RENDER_LATENCY = METRICS.histogram("client_render_latency_seconds", "Time from playout to the frame being shown")
+REQUEST_LATENCY = METRICS.histogram("client_rtsp_request_seconds", "Time from an RTSP request to its reply", 
+                                    ("method",))
 
 """
 
 Design of ClientWorker class is based on finite state machine diagram. States are INIT, READY, or PLAYING. 
 Transitions between states are triggered by events (button clicks) which mirror their associated RTSP requests,
-namely SETUP, PLAY, PAUSE, and TEARDOWN.
+namely SETUP, PLAY, PAUSE, and TEARDOWN. The state machine itself lives in RtspClient, which the headless
+LoadGenerator shares.
 
 """
-class ClientWorker:
-    INIT = 0
-    READY = 1
-    PLAYING = 2
-    state = INIT
-
-    SETUP = 0
-    PLAY = 1
-    PAUSE = 2
-    TEARDOWN = 3
+class ClientWorker(RtspClient):
 
     # Initiation..
-    def __init__(self, master, serveraddr, serverport, rtpport, filename):
+    def __init__(self, master, serveraddr, serverport, rtpport, filename, downscale=False,
+                 minDelay=DEFAULT_MIN_DELAY, maxDelay=DEFAULT_MAX_DELAY, fec=None, nack=False, tier=None):
+        RtspClient.__init__(self, filename, rtpport)
         self.master = master
         self.master.protocol("WM_DELETE_WINDOW", self.handler)
         self.createWidgets()
         self.serverAddr = serveraddr
         self.serverPort = int(serverport)
-        self.rtpPort = int(rtpport)
-        self.fileName = filename
-        self.rtspSeq = 0
-        self.sessionId = 0
-        self.requestSent = -1
         self.teardownAcked = 0
         self.connectToServer()
         self.frameNbr = 0
+        # Frames may complete out of order, the jitter buffer reorders them and paces playout
+        self.reassembler = FrameReassembler(reorder=True)
+        self.jitterBuffer = JitterBuffer(minDelay, maxDelay)
+        # RTCP: our own SSRC for receiver reports, and the server's RTCP port from SETUP
+        self.receiverStats = RtpReceiverStats()
+        self.rtcpSsrc = getrandbits(32)
+        self.serverRtcpPort = None
+        # FEC (group size, interleaving depth) to ask for, and the decoder once the server agreed
+        self.fec = fec
+        self.fecDecoder = None
+        # NACK retransmission, if asked for and accepted by the server
+        self.nack = nack
+        self.nackTracker = None
+        # Quality tier to ask the server for, if any
+        self.tier = tier
+        # Frames are decoded in memory on the decoder's own thread, then wait
+        # here for the Tk thread, the only one that may touch Tk images and widgets
+        self.decodedFrames = queue.Queue()
+        self.decoder = FrameDecoder(self.frameDecoded)
+        self.decoder.start()
+        self.master.after(RENDER_INTERVAL_MS, self.renderFrames)
+        self.requestTime = None
+        PACKETS_LOST.function = self.packetsLost
+        PLAYOUT_DELAY.function = self.jitterBuffer.delay
+        if downscale:
+            self.label.bind("<Configure>", self.resizeMovie)
 
     """
     Build GUI with buttons that mirror associated RTSP requests: SETUP, PLAY, PAUSE, and TEARDOWN.
@@ -116,8 +161,12 @@ class ClientWorker:
         """Teardown button handler."""
         self.sendRtspRequest(self.TEARDOWN)
         self.master.destroy()  # Close the gui window
-        self.rtspSocket.close()        
-        os.remove(CACHE_FILE_NAME + str(self.sessionId) + CACHE_FILE_EXT)  # Delete the cache image from video
+        self.rtspSocket.close()
+        self.decoder.stop()
+        if self.fecDecoder is not None:
+            log.info("FEC: recovered %d, unrecoverable %d", self.fecDecoder.recovered, self.fecDecoder.unrecoverable)
+        if self.nackTracker is not None:
+            log.info("NACK: %s", self.nackTracker.stats())
 
     def pauseMovie(self):
         """Pause button handler."""
@@ -127,33 +176,58 @@ class ClientWorker:
     def playMovie(self):
         """Play button handler."""
         if self.state == self.READY:
+            # Timestamps jump across a pause, so playout timing starts over
+            self.jitterBuffer.reset()
             # Create a new thread to listen for RTP packets
             threading.Thread(target=self.listenRtp).start()
             self.playEvent = threading.Event()
             self.playEvent.clear()
+            threading.Thread(target=self.playout).start()
             self.sendRtspRequest(self.PLAY)
 
     """
-    Listen for RTP packets arriving from the server. Call decoding method on packets, parse sequence
-    number, and update movie cache with new frame unless arriving packet is out of order.
+    Listen for RTP packets arriving from the server. With FEC, media packets are also kept by the
+    FEC decoder, and FEC packets hand back any packet they recover. With NACK, duplicates are dropped
+    and gaps are reported to the server. Call decoding method on packets and hand the fragments to
+    the reassembler. Once a frame is complete, queue it in the jitter
+    buffer, which drops it if it arrives too late to be shown.
 
     @raise exception if PAUSE or TEARDOWN requested, or if socket error
     """
     def listenRtp(self):
         while True:
             try:
-                data = self.rtpSocket.recv(20480)
+                data = self.rtpSocket.recv(RTP_RECV_SIZE)
                 if data:
-
-                    rtpPacket = RtpPacket()
-                    rtpPacket.decode(data)
-
-                    currFrameNbr = rtpPacket.get_seq_num()
-                    print("Current Seq Num: " + str(currFrameNbr))
-
-                    if currFrameNbr > self.frameNbr:  # Discard the late packet
-                        self.frameNbr = currFrameNbr
-                        self.updateMovie(self.writeFrame(rtpPacket.get_payload()))
+                    BYTES_RECEIVED.inc(len(data))
+                    if self.fecDecoder is not None and self.fecDecoder.is_fec(data):
+                        packets = self.fecDecoder.add_fec(data)
+                    else:
+                        packets = [data]
+                        if self.fecDecoder is not None:
+                            packets += self.fecDecoder.add_media(data)
+
+                    for packet in packets:
+                        rtpPacket = RtpPacket()
+                        rtpPacket.decode(packet)
+
+                        currSeqNum = rtpPacket.get_seq_num()
+                        PACKETS_RECEIVED.inc()
+                        sampledLog.debug("seq", "Current Seq Num: %d", currSeqNum)
+                        if (self.nackTracker is not None and
+                                not self.nackTracker.received(currSeqNum, self.jitterBuffer.delay())):
+                            # Duplicate, e.g. a retransmission racing the late original
+                            continue
+                        if packet is data:
+                            # Reception statistics count what arrived, not what FEC repaired
+                            self.receiverStats.update(rtpPacket.get_ssrc(), currSeqNum, rtpPacket.get_timestamp())
+
+                        frame = self.reassembler.add(rtpPacket)
+                        if frame is not None:
+                            self.jitterBuffer.push(*frame)
+
+                    if self.nackTracker is not None:
+                        self.sendNack()
             except:
                 # Stop listening upon requesting PAUSE or TEARDOWN
                 if self.playEvent.isSet():
@@ -167,29 +241,67 @@ class ClientWorker:
                     break
 
     """
-    Write raw RTP payload to cached image file for immediate display by the GUI.
+    Release frames from the jitter buffer to the decoder at their playout time. self.frameNbr holds
+    the RTP timestamp of the frame played last.
+    """
+    def playout(self):
+        while not self.playEvent.isSet() and not self.teardownAcked:
+            frame = self.jitterBuffer.get(0.5)
+            if frame is not None:
+                self.frameNbr, payload = frame
+                self.decoder.submit(self.frameNbr, payload)
+        log.info("Jitter buffer: %s", self.jitterBuffer.stats())
 
-    @param data: raw RTP payload (bytes) which is then written to JPEG file
     """
-    def writeFrame(self, data):
-        """Write the received frame to a temp image file. Return the image file."""
-        cachename = CACHE_FILE_NAME + str(self.sessionId) + CACHE_FILE_EXT
-        
-        try: 
-            file = open(cachename, "wb")
-            file.write(data)
-            file.close()
-        except Exception as e: 
-            print("Cache not found", str(e))
-        return cachename
+    Hand a decoded frame to the Tk thread. Called from the decoder thread.
+
+    @param image: the decoded frame as a PIL image
+    @param timestamp: RTP timestamp of the frame
+    @param received: monotonic time at which the frame was complete
+    """
+    def frameDecoded(self, image, timestamp=None, received=None):
+        self.decodedFrames.put((image, timestamp, received))
+
+    """
+    Show the newest decoded frame, if any, and look again shortly. Runs on the Tk thread.
+    """
+    def renderFrames(self):
+        frame = None
+        while True:
+            try:
+                frame = self.decodedFrames.get_nowait()
+            except queue.Empty:
+                break
+        if frame is not None:
+            self.updateMovie(*frame)
+        self.master.after(RENDER_INTERVAL_MS, self.renderFrames)
 
     """
-    Update the image file as video frame in the GUI.
+    Show a decoded frame in the GUI. Called on the Tk thread.
+
+    @param image: the decoded frame as a PIL image
+    @param timestamp: RTP timestamp of the frame
+    @param received: monotonic time at which the frame was complete
     """
-    def updateMovie(self, imageFile):
-        photo = ImageTk.PhotoImage(Image.open(imageFile))
+    def updateMovie(self, image, timestamp=None, received=None):
+        photo = ImageTk.PhotoImage(image)
         self.label.configure(image=photo, height=288)
         self.label.image = photo
+        FRAMES_RENDERED.inc()
+        if received is not None:
+            RENDER_LATENCY.observe(monotonic() - received)
+
+    def packetsLost(self):
+        """Cumulative packets lost, for the PACKETS_LOST gauge."""
+        return self.receiverStats.lost() if self.receiverStats.ssrc is not None else 0
+
+    """
+    Keep the decoder's target size in step with the label, so that large frames are
+    scaled down by the JPEG decoder instead of being decoded at full size.
+    """
+    def resizeMovie(self, event):
+        if event.width > 1 and event.height > 1:
+            self.decoder.size = (event.width, event.height)
 
     """
     Use TCP to create RTSP connection to server. Connection attempted upon SETUP and closes with TEARDOWN.
@@ -202,85 +314,60 @@ class ClientWorker:
         self.rtspSocket = socket(AF_INET, SOCK_STREAM)
         try:
             self.rtspSocket.connect((self.serverAddr, self.serverPort))
-            print("Connected to server... RTSP connection successful.")
+            log.info("Connected to server... RTSP connection successful.")
         except:
-            print("Connection to server address failed.")
+            log.error("Connection to server address failed.")
             tkMessageBox.showwarning('Connection Failed', 'Connection to \'%s\' failed.' % self.serverAddr)
 
     """
     Send RTSP requests to server to coordinate change in client state. GUI buttons directly initiate 
     RTSP requests. Any changes in client state must be vetted against current state (for instance, this 
-    method will not request PAUSE unless current state is PLAYING). Once a request is vetted, pickle and
-    send data via RTSP socket.
+    method will not request PAUSE unless current state is PLAYING). Once a request is vetted, serialize it
+    as an RTSP/1.0 message and send it via RTSP socket.
 
     @param requestCode represents integer associated with request type 
     """
     def sendRtspRequest(self, requestCode):
         """Send RTSP request to the server."""
 
-        # Setup request
-        if requestCode == self.SETUP and self.state == self.INIT:
+        if requestCode == self.SETUP and self.allowed(requestCode):
             threading.Thread(target=self.recvRtspReply).start()
-
-            # Update RTSP sequence number.
-            self.rtspSeq += 1
-
-            # Write the RTSP request to be sent.
-            request = rq.RtspRequest("SETUP", self.rtspSeq, self.fileName, self.rtpPort)
-            print("Setup request has been sent from sendRtspRequest()")
-            # Keep track of the sent request.
-            self.requestSent = self.SETUP
-
-        # Play request
-        elif requestCode == self.PLAY and self.state == self.READY:
-            # Update RTSP sequence number.
-            self.rtspSeq += 1
-
-            # Write the RTSP request to be sent.
-            request = rq.RtspRequest("PLAY", self.rtspSeq, self.fileName, self.rtpPort)
-
-            # Keep track of the sent request.
-            self.requestSent = self.PLAY
-
-        # Pause request
-        elif requestCode == self.PAUSE and self.state == self.PLAYING:
-            # Update RTSP sequence number.
-            self.rtspSeq += 1
-
-            # Write the RTSP request to be sent.
-            request = rq.RtspRequest("PAUSE", self.rtspSeq, self.fileName, self.rtpPort)
-
-            # Keep track of the sent request.
-            self.requestSent = self.PAUSE
-
-        # Teardown request
-        elif requestCode == self.TEARDOWN and not self.state == self.INIT:
-            # Update RTSP sequence number.
-            self.rtspSeq += 1
-
-            # Write the RTSP request to be sent.
-            request = rq.RtspRequest("TEARDOWN", self.rtspSeq, self.fileName, self.rtpPort)
-
-            # Keep track of the sent request.
-            self.requestSent = self.TEARDOWN
-        else:
+            if self.fec:
+                self.setupHeaders[FEC_HEADER_NAME] = format_fec_params(*self.fec)
+            if self.nack:
+                self.setupHeaders[FEEDBACK_HEADER_NAME] = FEEDBACK_NACK
+            if self.tier:
+                self.setupHeaders[TIER_HEADER] = self.tier
+
+        # Write the RTSP request to be sent, if the current state allows it.
+        request = self.makeRequest(requestCode)
+        if request is None:
             return
+        if requestCode == self.SETUP:
+            log.debug("Setup request has been sent from sendRtspRequest()")
 
         # Send the RTSP request using rtspSocket.
-        outgoing = pickle.dumps(request)
-        self.rtspSocket.send(outgoing)
+        outgoing = request.encode("%s:%d" % (self.serverAddr, self.serverPort))
+        self.requestTime = monotonic()
+        self.rtspSocket.sendall(outgoing)
 
-        print('\nData sent.')
+        log.debug('Data sent.')
 
     """
     Receive RTSP reply from the server. Close RTSP socket if TEARDOWN is requested.
     """
     def recvRtspReply(self):
+        parser = RtspParser()
         while True:
             reply = self.rtspSocket.recv(1024)
 
             if reply:
-                self.parseRtspReply(reply.decode("utf-8"))
+                try:
+                    # A recv() may hold part of a reply or several of them
+                    for message in parser.feed(reply):
+                        self.parseRtspReply(message)
+                except RtspError as e:
+                    log.warning("Bad RTSP reply: %s", e)
 
             # Close the RTSP socket upon requesting Teardown
             if self.requestSent == self.TEARDOWN:
@@ -292,39 +379,38 @@ class ClientWorker:
     """
     Parse the RTSP reply from the server.
     
-    @param data is the raw server reply
+    @param reply is the server reply as an RtspMessage
     """
-    def parseRtspReply(self, data):
-        lines = data.split('\n')
-        seqNum = int(lines[1].split(' ')[1])
-
-        # Process only if the server reply's sequence number is the same as the request's
-        if seqNum == self.rtspSeq:
-            session = int(lines[2].split(' ')[1])
-            # New RTSP session ID
-            if self.sessionId == 0:
-                self.sessionId = session
-            # Process only if the session ID is the same
-            if self.sessionId == session:
-                if int(lines[0].split(' ')[1]) == 200:
-                    if self.requestSent == self.SETUP:
-                        # Update RTSP state.
-                        self.state = self.READY
-                        # Open RTP port.
-                        self.openRtpPort()
-                    elif self.requestSent == self.PLAY:
-                        self.state = self.PLAYING
-                    elif self.requestSent == self.PAUSE:
-                        self.state = self.READY
-                        # The play thread exits. A new thread is created on resume.
-                        self.playEvent.set()
-                    elif self.requestSent == self.TEARDOWN:
-                        self.state = self.INIT
-                        # Flag the teardownAcked to close the socket.
-                        self.teardownAcked = 1
+    def parseRtspReply(self, reply):
+        acked = self.processReply(reply)
+        if acked is not None and self.requestTime is not None:
+            REQUEST_LATENCY.observe(monotonic() - self.requestTime, (self.REQUEST_TYPES[acked],))
+        if acked == self.SETUP:
+            # The server's RTCP port, for receiver reports
+            if self.serverPorts:
+                self.serverRtcpPort = self.serverPorts[1]
+            # The server echoes X-FEC if it will send FEC packets
+            fec = reply.header(FEC_HEADER_NAME)
+            if fec:
+                try:
+                    self.fecDecoder = FecDecoder(parse_fec_params(fec)[2])
+                except ValueError as e:
+                    log.warning("Ignoring FEC offer: %s", e)
+            # ... and X-RTCP-FB if it will answer NACKs
+            if FEEDBACK_NACK in reply.header(FEEDBACK_HEADER_NAME, ''):
+                self.nackTracker = NackTracker()
+            # ... and X-Tier if it will send the quality tier asked for
+            if self.tier and reply.header(TIER_HEADER) != self.tier:
+                log.info("Server does not offer tier %r, playing the original", self.tier)
+            # Open RTP port.
+            self.openRtpPort()
+        elif acked == self.PAUSE:
+            # The play thread exits. A new thread is created on resume.
+            self.playEvent.set()
+        elif acked == self.TEARDOWN:
+            # Flag the teardownAcked to close the socket.
+            self.teardownAcked = 1
 
-    
-    
     """
     Open RTP socket binded to a specified port.
 
@@ -340,11 +426,61 @@ class ClientWorker:
         try:
         # Bind the socket to the address using the RTP port given by the client user
             self.rtpSocket.bind((self.serverAddr, self.rtpPort))
-            print('port is bound via the openRtpPort()')
+            log.debug('port is bound via the openRtpPort()')
         except:
-            print("Unable to bind to port")
+            log.error("Unable to bind to port")
             tkMessageBox.showwarning('Unable to Bind', 'Unable to bind PORT=%d' % self.rtpPort)
 
+        # RTCP goes to and from the port above the RTP port
+        self.rtcpSocket = socket(AF_INET, SOCK_DGRAM)
+        try:
+            self.rtcpSocket.bind((self.serverAddr, self.rtpPort + 1))
+            threading.Thread(target=self.listenRtcp, daemon=True).start()
+        except OSError:
+            log.warning("Unable to bind RTCP port %d, no receiver reports will be sent", self.rtpPort + 1)
+
+    """
+    Receive the server's RTCP sender reports and send a receiver report about once a second,
+    until TEARDOWN is acknowledged.
+    """
+    def listenRtcp(self):
+        nextReport = monotonic() + RTCP_INTERVAL
+        while not self.teardownAcked:
+            self.rtcpSocket.settimeout(max(0.01, nextReport - monotonic()))
+            try:
+                for packet in parse_rtcp(self.rtcpSocket.recv(RTCP_RECV_SIZE)):
+                    if isinstance(packet, SenderReport):
+                        self.receiverStats.on_sender_report(packet)
+            except ValueError as e:
+                log.warning("Bad RTCP packet: %s", e)
+            except OSError:
+                pass
+            if monotonic() >= nextReport:
+                nextReport += RTCP_INTERVAL
+                self.sendReceiverReport()
+        self.rtcpSocket.close()
+
+    def sendNack(self):
+        """NACK the lost packets that are due, with the time left until they are played out."""
+        lost, deadline = self.nackTracker.due()
+        if not lost or self.receiverStats.ssrc is None or self.serverRtcpPort is None:
+            return
+        nack = pack_nack_request(self.rtcpSsrc, self.receiverStats.ssrc, lost, deadline)
+        try:
+            self.rtcpSocket.sendto(nack, (self.serverAddr, self.serverRtcpPort))
+        except OSError as e:
+            log.warning("RTCP send failed: %s", e)
+
+    def sendReceiverReport(self):
+        """Send an RTCP receiver report about the stream received so far."""
+        if self.receiverStats.ssrc is None or self.serverRtcpPort is None:
+            return
+        report = pack_receiver_report(self.rtcpSsrc, [self.receiverStats.report_block()])
+        try:
+            self.rtcpSocket.sendto(report, (self.serverAddr, self.serverRtcpPort))
+        except OSError as e:
+            log.warning("RTCP send failed: %s", e)
+
 
     """
     Pause movie and check if user wants to quit if user presses GUI window exit button. 
@@ -0,0 +1,95 @@
+"""
+Purpose: 
+
+The FrameDecoder turns received JPEG frames into PIL images on its own
+worker thread, straight from the payload bytes. Previously every frame 
+was written to cache-<session>.jpg by the network thread and opened 
+again through PIL, so each frame cost two rounds of file I/O before it 
+could be shown. 
+
+The network thread only calls submit(). The queue between the two 
+threads is short and drops the oldest frame when full: if decoding 
+falls behind, showing the newest frame is better than showing every 
+frame late. When a target size is set, Pillow's draft mode lets the JPEG
+decoder itself scale the image down (by 1/2, 1/4 or 1/8), which is much
+cheaper than decoding at full size and resizing afterwards. 
+
+onFrame is called on the worker thread with the decoded PIL image. Tk is
+not thread-safe, so the caller hands the image over to the Tk thread 
+and makes the Tk image there. 
+"""
+import io
+import queue
+import threading
+from time import monotonic
+
+from PIL import Image
+
+from SampledLogger import SampledLogger
+
+sampledLog = SampledLogger(__name__)
+
+DEFAULT_QUEUE_SIZE = 2
+
+class FrameDecoder: 
+
+    def __init__(self, onFrame, size: tuple = None, queueSize: int = DEFAULT_QUEUE_SIZE):
+        self.onFrame = onFrame
+        self.size = size
+        self.queue = queue.Queue(queueSize)
+        self.decoded = 0
+        self.dropped = 0
+        self.errors = 0
+        self.thread = None
+
+    def start(self) -> None: 
+        if self.thread is None: 
+            self.thread = threading.Thread(target=self.run, name="FrameDecoder", daemon=True)
+            self.thread.start()
+
+    def stop(self) -> None: 
+        if self.thread is not None: 
+            self.submit(None, None)
+            self.thread = None
+
+    def submit(self, timestamp, data) -> None: 
+        """ Queues a frame for decoding, dropping the oldest queued frame if full."""
+        item = (timestamp, data, monotonic())
+        while True: 
+            try: 
+                self.queue.put_nowait(item)
+                return
+            except queue.Full: 
+                try: 
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty: 
+                    pass
+
+    def decode(self, data): 
+        """ Returns the decoded (and possibly downscaled) PIL image of a JPEG frame."""
+        image = Image.open(io.BytesIO(data))
+        size = self.size
+        if size: 
+            image.draft("RGB", size)
+            image.load()
+            if image.width > size[0] or image.height > size[1]: 
+                image.thumbnail(size)
+        else: 
+            image.load()
+        return image
+
+    def run(self) -> None: 
+        while True: 
+            timestamp, data, received = self.queue.get()
+            if data is None: 
+                return
+            try: 
+                image = self.decode(data)
+            except (OSError, ValueError) as e: 
+                # A corrupt frame is skipped, the next one may be fine.
+                self.errors += 1
+                sampledLog.warning("decode", "Could not decode frame: %s", e)
+                continue
+            self.decoded += 1
+            self.onFrame(image, timestamp, received)
@@ -0,0 +1,145 @@
+"""
+Purpose: 
+
+The FrameIndex records where every frame of an .Mjpeg file lives, so a
+VideoStream can jump straight to frame N instead of reading every frame
+before it. An .Mjpeg file is a sequence of frames, each preceded by its
+length as 5 ASCII digits; the index keeps the offset of each frame's data
+and its length in two compact arrays. 
+
+Building the index is one pass over the length prefixes (frame data is 
+skipped with seek, not read). The result is saved next to the media file
+as <file>.idx and reloaded as long as the file's size and mtime match, 
+so the pass only runs once per version of a file. 
+
+Sidecar layout (little-endian): 
+
+    magic "MJIX" | version (2) | pad (2) | mtime_ns (8) | size (8) | count (4)
+    offsets: count x uint64
+    lengths: count x uint32
+"""
+import os
+import struct
+import sys
+from array import array
+
+INDEX_EXT = ".idx"
+MAGIC = b"MJIX"
+VERSION = 1
+HEADER = struct.Struct("<4sH2xqqI")
+LENGTH_PREFIX_SIZE = 5
+
+class FrameIndex: 
+
+    def __init__(self, offsets: array, lengths: array, mtime_ns: int, size: int):
+        self.offsets = offsets
+        self.lengths = lengths
+        self.mtime_ns = mtime_ns
+        self.size = size
+
+    def __len__(self) -> int: 
+        return len(self.offsets)
+
+    def offset(self, frame: int) -> int: 
+        """ Returns the file offset of the data of frame (0-based)."""
+        return self.offsets[frame]
+
+    def length(self, frame: int) -> int: 
+        """ Returns the length in bytes of frame (0-based)."""
+        return self.lengths[frame]
+
+    def matches(self, stat: os.stat_result) -> bool: 
+        """ Returns true if the index was built for a file with this stat."""
+        return stat.st_mtime_ns == self.mtime_ns and stat.st_size == self.size
+
+    @classmethod
+    def for_file(cls, filename: str, save: bool = True) -> "FrameIndex": 
+        """
+            Returns the index of filename, reusing the sidecar file when it is
+            still valid and otherwise building (and, if save is set, writing)
+            a new one. 
+        """
+        stat = os.stat(filename)
+        index = cls.load(filename + INDEX_EXT)
+        if index is not None and index.matches(stat): 
+            return index
+
+        index = cls.build(filename)
+        if save: 
+            try: 
+                index.save(filename + INDEX_EXT)
+            except OSError: 
+                # A read-only media directory only costs us the reuse.
+                pass
+        return index
+
+    @classmethod
+    def build(cls, filename: str) -> "FrameIndex": 
+        """
+            Scans the length prefixes of filename. A truncated or malformed 
+            trailing frame ends the index, the same place nextFrame() would
+            stop.
+        """
+        offsets = array("Q")
+        lengths = array("I")
+        with open(filename, "rb") as file: 
+            stat = os.fstat(file.fileno())
+            position = 0
+            while True: 
+                prefix = file.read(LENGTH_PREFIX_SIZE)
+                if len(prefix) < LENGTH_PREFIX_SIZE or not prefix.strip().isdigit(): 
+                    break
+                length = int(prefix)
+                position += LENGTH_PREFIX_SIZE
+                if position + length > stat.st_size: 
+                    break
+                offsets.append(position)
+                lengths.append(length)
+                position += length
+                file.seek(position)
+        return cls(offsets, lengths, stat.st_mtime_ns, stat.st_size)
+
+    @classmethod
+    def load(cls, path: str) -> "FrameIndex": 
+        """ Returns the index stored at path, or None if it is missing or unreadable."""
+        try: 
+            with open(path, "rb") as file: 
+                data = file.read()
+        except OSError: 
+            return None
+
+        if len(data) < HEADER.size: 
+            return None
+        magic, version, mtime_ns, size, count = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION: 
+            return None
+
+        offsets = array("Q")
+        lengths = array("I")
+        start = HEADER.size
+        middle = start + count * offsets.itemsize
+        end = middle + count * lengths.itemsize
+        if len(data) != end: 
+            return None
+        offsets.frombytes(data[start:middle])
+        lengths.frombytes(data[middle:end])
+        if sys.byteorder != "little": 
+            offsets.byteswap()
+            lengths.byteswap()
+        return cls(offsets, lengths, mtime_ns, size)
+
+    def save(self, path: str) -> None: 
+        """ Writes the index to path, replacing any previous index atomically."""
+        offsets = array("Q", self.offsets)
+        lengths = array("I", self.lengths)
+        if sys.byteorder != "little": 
+            offsets.byteswap()
+            lengths.byteswap()
+
+        # Per process: supervisor workers may index the same file at once
+        temp = "%s.%d.tmp" % (path, os.getpid())
+        with open(temp, "wb") as file: 
+            file.write(HEADER.pack(MAGIC, VERSION, self.mtime_ns, self.size, len(self)))
+            file.write(offsets.tobytes())
+            file.write(lengths.tobytes())
+        os.replace(temp, path)
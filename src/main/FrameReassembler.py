@@ -0,0 +1,114 @@
+"""
+Purpose: 
+
+The FrameReassembler is used by the client to rebuild MJPEG frames from 
+the RTP fragments produced by RtpPacketizer. Fragments are grouped by 
+their RTP timestamp and placed by their fragment offset, so they may 
+arrive in any order. A frame is complete once the fragment carrying the
+marker bit has arrived and every byte before it is covered. 
+
+Partial frames are dropped when they time out, or as soon as a newer 
+frame completes (they can no longer be shown in order anyway). With 
+reorder=True frames may complete out of order and only time out; a 
+JitterBuffer downstream then puts them back in order. 
+"""
+from time import monotonic
+
+from RtpPacketizer import parse_jpeg_header
+
+DEFAULT_TIMEOUT = 0.5   # seconds a partial frame may wait for fragments
+
+def timestamp_newer(a: int, b: int) -> bool: 
+    """ Returns true if RTP timestamp a is after b, allowing for wrap-around."""
+    return a != b and ((a - b) & 0xFFFFFFFF) < 0x80000000
+
+class PartialFrame: 
+
+    def __init__(self, arrival: float):
+        self.arrival = arrival
+        self.fragments = {}
+        self.received = 0
+        self.size = None
+
+    def add(self, offset: int, fragment, last: bool) -> None: 
+        if offset in self.fragments: 
+            return
+        self.fragments[offset] = fragment
+        self.received += len(fragment)
+        if last: 
+            self.size = offset + len(fragment)
+
+    def is_complete(self) -> bool: 
+        return self.size is not None and self.received >= self.size
+
+    def assemble(self): 
+        """ Returns the frame bytes, or None if the fragments leave a gap."""
+        parts = []
+        position = 0
+        for offset in sorted(self.fragments): 
+            if offset != position: 
+                return None
+            parts.append(self.fragments[offset])
+            position += len(self.fragments[offset])
+        return b"".join(parts)
+
+class FrameReassembler: 
+
+    def __init__(self, timeout: float = DEFAULT_TIMEOUT, clock=monotonic, reorder: bool = False):
+        self.timeout = timeout
+        self.reorder = reorder
+        self.clock = clock
+        self.partial = {}
+        self.last_timestamp = None
+        self.completed = 0
+        self.dropped = 0
+        self.late = 0
+
+    def add(self, rtpPacket) -> tuple: 
+        """
+            Adds one decoded RtpPacket. Returns (timestamp, frame) when the 
+            packet completes a frame, otherwise None. 
+        """
+        now = self.clock()
+        self.expire(now)
+
+        timestamp = rtpPacket.get_timestamp()
+        if (not self.reorder and self.last_timestamp is not None 
+                and not timestamp_newer(timestamp, self.last_timestamp)): 
+            self.late += 1
+            return None
+
+        try: 
+            offset, fragment = parse_jpeg_header(rtpPacket.get_payload())
+        except ValueError: 
+            return None
+
+        frame = self.partial.get(timestamp)
+        if frame is None: 
+            frame = self.partial[timestamp] = PartialFrame(now)
+        frame.add(offset, fragment, rtpPacket.get_marker() == 1)
+        if not frame.is_complete(): 
+            return None
+
+        del self.partial[timestamp]
+        data = frame.assemble()
+        if data is None: 
+            self.dropped += 1
+            return None
+
+        self.completed += 1
+        if self.reorder: 
+            return timestamp, data
+        self.last_timestamp = timestamp
+        # Anything older than the frame we just finished is now useless.
+        for stale in [ts for ts in self.partial if not timestamp_newer(ts, timestamp)]: 
+            del self.partial[stale]
+            self.dropped += 1
+        return timestamp, data
+
+    def expire(self, now: float) -> None: 
+        """ Drops partial frames that have waited longer than the timeout."""
+        for timestamp in [ts for ts, frame in self.partial.items() 
+                          if now - frame.arrival > self.timeout]: 
+            del self.partial[timestamp]
+            self.dropped += 1
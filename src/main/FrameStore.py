@@ -0,0 +1,119 @@
+"""
+Purpose: 
+
+The FrameStore shares media files between sessions. Each file is memory
+mapped once per process and every session watching it gets zero-copy 
+memoryview slices of its frames, located through the file's FrameIndex. 
+Fifty viewers of one movie therefore cost one mapping and the kernel's 
+page cache, instead of fifty file handles and fifty copies of each frame.
+
+Mappings are reference counted: acquire() for every session that opens 
+a file and release() when the session ends. A mapping that nobody uses
+stays open in a small LRU so the next viewer does not pay for mmap and
+the index again; the least recently used idle mappings beyond max_idle 
+are closed. 
+
+A mapping also carries the file's HintTrack, if an up-to-date one has 
+been written; a track written later is picked up once the file is 
+mapped again. 
+"""
+import mmap
+import os
+import threading
+from collections import OrderedDict
+
+from FrameIndex import FrameIndex
+from HintTrack import HintTrack
+
+DEFAULT_MAX_IDLE = 8
+
+class MappedMedia: 
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.refs = 0
+        with open(filename, "rb") as file: 
+            stat = os.fstat(file.fileno())
+            self.key = (os.path.realpath(filename), stat.st_mtime_ns, stat.st_size)
+            if stat.st_size: 
+                self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                self.view = memoryview(self.map)
+            else: 
+                self.map = None
+                self.view = memoryview(b"")
+        self.index = FrameIndex.for_file(filename)
+        if not self.index.matches(stat): 
+            # The file changed between stat and indexing; index what we mapped.
+            self.index = FrameIndex.build(filename)
+        self.hints = HintTrack.for_file(filename)
+
+    def __len__(self) -> int: 
+        return len(self.index)
+
+    def frame(self, frame: int) -> memoryview: 
+        """ Returns a read-only view of frame (0-based) without copying it."""
+        offset = self.index.offset(frame)
+        return self.view[offset:offset + self.index.length(frame)]
+
+    def close(self) -> None: 
+        if self.hints is not None: 
+            self.hints.close()
+        self.view.release()
+        if self.map is not None: 
+            try: 
+                self.map.close()
+            except BufferError: 
+                # Frames still in flight keep the mapping alive; it is
+                # unmapped when the last of their views is dropped.
+                pass
+
+class FrameStore: 
+
+    def __init__(self, max_idle: int = DEFAULT_MAX_IDLE):
+        self.max_idle = max_idle
+        self.lock = threading.Lock()
+        self.active = {}
+        self.idle = OrderedDict()
+
+    def acquire(self, filename: str) -> MappedMedia: 
+        """
+            Returns the shared mapping of filename and takes a reference on 
+            it. Raises OSError if the file cannot be opened. 
+        """
+        stat = os.stat(filename)
+        key = (os.path.realpath(filename), stat.st_mtime_ns, stat.st_size)
+        with self.lock: 
+            # Compared with None: a mapping of an empty file has no frames, so it is falsy
+            media = self.active.get(key)
+            if media is None: 
+                media = self.idle.pop(key, None)
+            if media is None: 
+                media = MappedMedia(filename)
+                key = media.key
+            media.refs += 1
+            self.active[key] = media
+            return media
+
+    def release(self, media: MappedMedia) -> None: 
+        """ Drops a reference taken by acquire()."""
+        evicted = []
+        with self.lock: 
+            media.refs -= 1
+            if media.refs > 0: 
+                return
+            if self.active.get(media.key) is media: 
+                del self.active[media.key]
+            self.idle[media.key] = media
+            while len(self.idle) > self.max_idle: 
+                evicted.append(self.idle.popitem(last=False)[1])
+        for media in evicted: 
+            media.close()
+
+    def stats(self) -> dict: 
+        """ Returns the number of active and idle mappings and active references."""
+        with self.lock: 
+            return {"active": len(self.active), "idle": len(self.idle),
+                    "refs": sum(media.refs for media in self.active.values())}
+
+# Process-wide store shared by every ServerWorker.
+FRAME_STORE = FrameStore()
@@ -0,0 +1,205 @@
+"""
+Purpose:
+
+A HintTrack holds the RTP packetization of an .Mjpeg file worked out in
+advance, so that a server streaming the same movie many times does not
+packetize every frame again for every viewer. HintTrack.py run as a
+script writes it next to the media file as <file>.hint:
+
+    python HintTrack.py movie.Mjpeg [--frame-rate 20] [--mtu 1400]
+
+For every packet the track stores the ready-made 20-byte RTP and JPEG
+header, with sequence number, timestamp and SSRC left zero, and where
+its fragment lies in the frame; for every frame, its first packet and
+its media timestamp (the timing table). At stream time the server
+copies a frame's headers into the session's buffer, patches the three
+per-session fields of each and sends them with fragments sliced
+straight out of the frame (see RtpPacketizer.packetize_hinted()).
+
+The track is memory mapped, and with the FrameStore shared by every
+session of the file. It is only used while it matches the media file
+(size and mtime, as for the FrameIndex) and the session's MTU and frame
+rate; otherwise the server packetizes as before.
+
+File layout (little-endian):
+
+    magic "MJHT" | version (2) | pad (2) | mtime_ns (8) | size (8) | frame_rate (8 double)
+        | mtu (4) | frames (4) | packets (4) | pad (4)
+    first packet of each frame: (frames + 1) x uint32, the last one = packets
+    media timestamp of each frame (90 kHz, from the start): frames x uint32
+    fragment offset within its frame: packets x uint32
+    fragment length: packets x uint32
+    headers: packets x 20 bytes
+"""
+import argparse
+import logging
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from FrameIndex import FrameIndex
+from RtpPacket import CLOCK_RATE
+from RtpPacketizer import RtpPacketizer, MTU, PACKET_HEADER_SIZE, MAX_FRAGMENT_OFFSET, patch_header
+from VideoStream import VideoStream
+
+log = logging.getLogger(__name__)
+
+HINT_EXT = ".hint"
+MAGIC = b"MJHT"
+VERSION = 1
+HEADER = struct.Struct("<4sH2xqqdIII4x")
+OFFSET_FIELD = struct.Struct("!I")      # fragment offset, bytes 12-15 of a packet header
+
+class HintTrack:
+
+    def __init__(self, firsts, timing, offsets, lengths, headers, frameRate: float, mtu: int,
+                 mtime_ns: int, size: int, map=None):
+        self.firsts = firsts
+        self.timing = timing
+        self.offsets = offsets
+        self.lengths = lengths
+        self.headers = headers
+        self.frameRate = frameRate
+        self.mtu = mtu
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.map = map
+
+    def __len__(self) -> int:
+        return len(self.timing)
+
+    def matches(self, stat: os.stat_result) -> bool:
+        """ Returns true if the track was made for a media file with this stat."""
+        return stat.st_mtime_ns == self.mtime_ns and stat.st_size == self.size
+
+    def templates(self, frame: int):
+        """ Returns the packed headers of frame (0-based), PACKET_HEADER_SIZE bytes per packet."""
+        return self.headers[self.firsts[frame] * PACKET_HEADER_SIZE:self.firsts[frame + 1] * PACKET_HEADER_SIZE]
+
+    def fragments(self, frame: int, data) -> list:
+        """ Returns the fragments of frame, sliced out of its data."""
+        view = data if isinstance(data, memoryview) else memoryview(data)
+        offsets, lengths = self.offsets, self.lengths
+        return [view[offsets[packet]:offsets[packet] + lengths[packet]]
+                for packet in range(self.firsts[frame], self.firsts[frame + 1])]
+
+    def timestamp(self, frame: int) -> int:
+        """ Returns the media timestamp of frame (0-based), in 90 kHz units from the start."""
+        return self.timing[frame]
+
+    @classmethod
+    def for_file(cls, filename: str) -> "HintTrack":
+        """ Returns the hint track of filename, or None if it has none that is up to date."""
+        track = cls.load(filename + HINT_EXT)
+        if track is None:
+            return None
+        if not track.matches(os.stat(filename)):
+            log.warning("Ignoring %s%s: made for another version of the file", filename, HINT_EXT)
+            track.close()
+            return None
+        return track
+
+    @classmethod
+    def build(cls, filename: str, frameRate: float = VideoStream.DEFAULT_FRAME_RATE,
+              mtu: int = MTU) -> "HintTrack":
+        """ Packetizes every frame of filename once, as RtpPacketizer would for a session."""
+        index = FrameIndex.for_file(filename)
+        packetizer = RtpPacketizer(mtu=mtu)
+        firsts, timing = array("I", [0]), array("I")
+        offsets, lengths = array("I"), array("I")
+        headers = bytearray()
+        with open(filename, "rb") as file:
+            for frame in range(len(index)):
+                file.seek(index.offset(frame))
+                data = file.read(index.length(frame))
+                for header, fragment in packetizer.packetize(data, 0):
+                    patch_header(header, 0, 0, 0)
+                    headers += header
+                    offsets.append(OFFSET_FIELD.unpack_from(header, 12)[0] & MAX_FRAGMENT_OFFSET)
+                    lengths.append(len(fragment))
+                firsts.append(len(offsets))
+                # The same timestamps the server computes for an unhinted file
+                timing.append(int((frame + 1) * CLOCK_RATE / frameRate) & 0xFFFFFFFF)
+        return cls(firsts, timing, offsets, lengths, bytes(headers), frameRate, mtu, index.mtime_ns, index.size)
+
+    @classmethod
+    def load(cls, path: str) -> "HintTrack":
+        """ Maps the track stored at path. Returns None if it is missing or unreadable."""
+        try:
+            with open(path, "rb") as file:
+                map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+        view = memoryview(map)
+        if len(view) < HEADER.size:
+            view.release()
+            map.close()
+            return None
+        magic, version, mtime_ns, size, frameRate, mtu, frames, packets = HEADER.unpack_from(view, 0)
+        sizes = ((frames + 1) * 4, frames * 4, packets * 4, packets * 4, packets * PACKET_HEADER_SIZE)
+        if magic != MAGIC or version != VERSION or len(view) != HEADER.size + sum(sizes):
+            view.release()
+            map.close()
+            return None
+
+        tables = []
+        start = HEADER.size
+        for length in sizes[:4]:
+            table = view[start:start + length]
+            if sys.byteorder != "little":
+                table = array("I", table.tobytes())
+                table.byteswap()
+            else:
+                # Read in place, without copying out of the mapping
+                table = table.cast("I")
+            tables.append(table)
+            start += length
+        headers = view[start:]
+        return cls(*tables, headers, frameRate, mtu, mtime_ns, size, map)
+
+    def save(self, path: str) -> None:
+        """ Writes the track to path, replacing any previous one atomically."""
+        tables = [array("I", table) for table in (self.firsts, self.timing, self.offsets, self.lengths)]
+        if sys.byteorder != "little":
+            for table in tables:
+                table.byteswap()
+
+        temp = path + ".tmp"
+        with open(temp, "wb") as file:
+            file.write(HEADER.pack(MAGIC, VERSION, self.mtime_ns, self.size, self.frameRate, self.mtu,
+                                   len(self.timing), len(self.offsets)))
+            for table in tables:
+                file.write(table.tobytes())
+            file.write(self.headers)
+        os.replace(temp, path)
+
+    def close(self) -> None:
+        if self.map is None:
+            return
+        for table in (self.firsts, self.timing, self.offsets, self.lengths, self.headers):
+            if isinstance(table, memoryview):
+                table.release()
+        try:
+            self.map.close()
+        except BufferError:
+            # Headers still being sent keep the mapping alive until they are dropped
+            pass
+        self.map = None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write the RTP hint track of .Mjpeg files")
+    parser.add_argument("files", nargs="+", help=".Mjpeg files to hint")
+    parser.add_argument("--frame-rate", type=float, default=VideoStream.DEFAULT_FRAME_RATE,
+                        help="frame rate the file is served at (default %d)" % VideoStream.DEFAULT_FRAME_RATE)
+    parser.add_argument("--mtu", type=int, default=MTU, help="bytes of UDP payload per packet (default %d)" % MTU)
+    args = parser.parse_args(argv)
+    for filename in args.files:
+        track = HintTrack.build(filename, args.frame_rate, args.mtu)
+        track.save(filename + HINT_EXT)
+        print("Wrote %s%s: %d frames, %d packets" % (filename, HINT_EXT, len(track), len(track.offsets)))
+
+if __name__ == "__main__":
+    main()
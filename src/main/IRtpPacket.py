@@ -14,6 +14,12 @@ Special Notes:
 (2) Log: Zak Hussain - 08/04/2020
     + In this MVP, the 32-bit Contributing Source Idenfier is non-existent
       since the CC field is set to zero. 
+(3) Log: 10/18/2026
+    + The Marker (M) bit is now used: RtpPacketizer sets it on the last 
+      RTP fragment of each frame. 
+(4) Log: 10/18/2026
+    + Timestamps run on the 90 kHz media clock, and the server picks a 
+      random initial sequence number, SSRC and timestamp offset per session. 
 '''
 
 '''
@@ -79,7 +85,7 @@ class IRtpPacket:
 
     def encapsulate(self, version: int, padding: int, extension: int, 
                     contr_sources: int, marker: int, payload_type: int, 
-                seq_num: int, sync_source_id: int, payload: str) -> None:
+                seq_num: int, sync_source_id: int, payload: str, timestamp: int = None) -> None:
         """For the inputs, apply them to the RTP packet fields.""" 
         pass
     
@@ -87,6 +93,10 @@ class IRtpPacket:
         """ For use by the client to de-packetize the data"""
         pass 
 
+    def get_marker(self) -> int: 
+        """ Returns the marker bit of the RTP packet."""
+        pass 
+
     def get_seq_num(self) -> int: 
         """ Returns the rtp packet sequence number (frame number)."""
         pass 
@@ -95,6 +105,10 @@ class IRtpPacket:
         """ Returns the timestamp for this RTP packet."""
         pass 
 
+    def get_ssrc(self) -> int: 
+        """ Returns the synchronization source identifier of the stream."""
+        pass 
+
     def get_payload(self) -> bytes: 
         """ Return the payload content from the RTP packet."""
         pass 
@@ -103,6 +117,10 @@ class IRtpPacket:
         """ Returns the contents (header + payload) of the packet itself"""
         pass  
 
+    def get_buffers(self) -> tuple: 
+        """ Returns the header and payload of the packet as separate buffers"""
+        pass 
+
 
 
     
@@ -0,0 +1,178 @@
+"""
+Purpose: 
+
+The JitterBuffer sits between the FrameReassembler and the FrameDecoder 
+on the client. Without it a frame is shown the moment its last fragment 
+arrives, so any variation in network delay shows up directly as stutter.
+
+Complete frames are held in timestamp order and released at their 
+playout time: 
+
+    playout = base + timestamp / clock rate + delay
+
+base is the smallest transit time (arrival - timestamp / clock rate) 
+seen since the last reset, so frames that arrived unusually fast are not
+held back. delay follows the interarrival jitter J, estimated as in 
+RFC 3550 section 6.4.1: 
+
+    D = (arrival_i - arrival_j) - (timestamp_i - timestamp_j) / clock rate
+    J = J + (|D| - J) / 16
+
+and is kept between a minimum and a maximum delay. The minimum is the 
+latency that is always paid; raising it buys smoother playback on links
+with bursty delay such as Wi-Fi. 
+
+Frames that arrive after a newer frame was already played are dropped 
+and counted as late. An underrun is counted when the buffer runs empty 
+past the time the next frame was expected. 
+"""
+import heapq
+import threading
+from time import monotonic
+
+from RtpPacketizer import CLOCK_RATE
+
+DEFAULT_MIN_DELAY = 0.05   # seconds
+DEFAULT_MAX_DELAY = 0.5    # seconds
+DEFAULT_JITTER_FACTOR = 3  # delay target in multiples of the jitter estimate
+DEFAULT_MAX_FRAMES = 64
+
+class JitterBuffer: 
+
+    def __init__(self, minDelay: float = DEFAULT_MIN_DELAY, maxDelay: float = DEFAULT_MAX_DELAY, 
+                 jitterFactor: float = DEFAULT_JITTER_FACTOR, maxFrames: int = DEFAULT_MAX_FRAMES, 
+                 clockRate: int = CLOCK_RATE, clock=monotonic):
+        if minDelay < 0 or maxDelay < minDelay: 
+            raise ValueError("need 0 <= minDelay <= maxDelay")
+        self.minDelay = minDelay
+        self.maxDelay = maxDelay
+        self.jitterFactor = jitterFactor
+        self.maxFrames = maxFrames
+        self.clockRate = clockRate
+        self.clock = clock
+        self.cond = threading.Condition()
+        self.jitter = 0.0
+        self.pushed = 0
+        self.played = 0
+        self.late = 0
+        self.duplicates = 0
+        self.overflows = 0
+        self.underruns = 0
+        self.reset()
+
+    def reset(self) -> None: 
+        """ Forgets queued frames and timing, e.g. when playback resumes after PAUSE."""
+        with self.cond: 
+            self.heap = []
+            self.queued = set()
+            self.base = None
+            self.lastRaw = None      # last RTP timestamp seen, for unwrapping
+            self.lastExt = None
+            self.lastArrival = None
+            self.lastTransit = None
+            self.playedExt = None    # extended timestamp of the frame played last
+            self.interval = None     # media time between the last two frames played
+            self.starved = False
+            self.cond.notify_all()
+
+    def delay(self) -> float: 
+        return min(self.maxDelay, max(self.minDelay, self.jitterFactor * self.jitter))
+
+    def unwrap(self, timestamp: int) -> int: 
+        """ Extends a 32-bit RTP timestamp so that ordering survives wrap-around."""
+        if self.lastRaw is None: 
+            self.lastRaw, self.lastExt = timestamp, timestamp
+            return timestamp
+        delta = ((timestamp - self.lastRaw + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+        extended = self.lastExt + delta
+        if delta > 0: 
+            self.lastRaw, self.lastExt = timestamp, extended
+        return extended
+
+    def playoutTime(self, extended: int) -> float: 
+        return self.base + extended / self.clockRate + self.delay()
+
+    def push(self, timestamp: int, frame, arrival: float = None) -> bool: 
+        """ Queues a complete frame. Returns false if it was dropped."""
+        with self.cond: 
+            if arrival is None: 
+                arrival = self.clock()
+            extended = self.unwrap(timestamp)
+            transit = arrival - extended / self.clockRate
+
+            if self.lastTransit is not None: 
+                d = abs(transit - self.lastTransit)
+                self.jitter += (d - self.jitter) / 16
+            self.lastTransit = transit
+            if self.base is None or transit < self.base: 
+                self.base = transit
+
+            if self.playedExt is not None and extended <= self.playedExt: 
+                self.late += 1
+                return False
+            if extended in self.queued: 
+                self.duplicates += 1
+                return False
+
+            self.pushed += 1
+            heapq.heappush(self.heap, (extended, timestamp, frame))
+            self.queued.add(extended)
+            if len(self.heap) > self.maxFrames: 
+                # Far behind: give up on the oldest frame rather than grow without bound
+                dropped = heapq.heappop(self.heap)
+                self.queued.discard(dropped[0])
+                self.overflows += 1
+            self.cond.notify_all()
+            return True
+
+    def pop(self, now: float = None): 
+        """ Returns (timestamp, frame) for the next frame due at now, or None."""
+        with self.cond: 
+            if now is None: 
+                now = self.clock()
+            if not self.heap: 
+                if (not self.starved and self.playedExt is not None and self.interval
+                        and now > self.playoutTime(self.playedExt + self.interval)): 
+                    self.starved = True
+                    self.underruns += 1
+                return None
+            extended, timestamp, frame = self.heap[0]
+            if now < self.playoutTime(extended): 
+                return None
+            heapq.heappop(self.heap)
+            self.queued.discard(extended)
+            if self.playedExt is not None: 
+                self.interval = extended - self.playedExt
+            self.playedExt = extended
+            self.starved = False
+            self.played += 1
+            return timestamp, frame
+
+    def get(self, timeout: float = None): 
+        """ Blocks until a frame is due and returns it, or None after timeout seconds."""
+        with self.cond: 
+            end = None if timeout is None else self.clock() + timeout
+            while True: 
+                now = self.clock()
+                item = self.pop(now)
+                if item is not None: 
+                    return item
+                wait = None
+                if self.heap: 
+                    wait = max(0.0, self.playoutTime(self.heap[0][0]) - now)
+                if end is not None: 
+                    if now >= end: 
+                        return None
+                    wait = end - now if wait is None else min(wait, end - now)
+                self.cond.wait(wait)
+
+    def __len__(self) -> int: 
+        return len(self.heap)
+
+    def stats(self) -> dict: 
+        with self.cond: 
+            return {"buffered": len(self.heap), "delay_ms": self.delay() * 1000, 
+                    "jitter_ms": self.jitter * 1000, "pushed": self.pushed, 
+                    "played": self.played, "late": self.late, 
+                    "duplicates": self.duplicates, "overflows": self.overflows, 
+                    "underruns": self.underruns}
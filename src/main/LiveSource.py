@@ -0,0 +1,447 @@
+"""
+Purpose:
+
+A LiveSource takes MJPEG from a camera, or anything standing in for
+one, and lets any number of RTSP sessions watch it live. Input is a
+plain stream of JPEG frames (what `ffmpeg -f mjpeg` writes) from one of:
+
+    pipe:PATH           a named pipe or stdin ("pipe:-"), reopened
+                        whenever the writer goes away
+    unix:PATH           a UNIX stream socket the source listens on, one
+                        writer at a time
+    udp:HOST:PORT       datagrams on a UDP port; a datagram starting a
+                        new frame resynchronises after loss
+
+Frames are cut out of the byte stream by JpegScanner, which walks the
+marker segments up to the start of scan and then looks for EOI, so
+EXIF thumbnails cannot end a frame early. The ingest thread appends
+each frame to a LiveRing, which keeps the last `seconds` of frames
+within a byte budget, dropping the oldest ones first. Appending takes
+a short lock and never waits for a viewer, so the producer never blocks.
+
+Each session reads the ring through a LiveStream cursor, which looks
+like a VideoStream to the ServerWorker. A cursor starts at the newest
+frame, or at the one `delay` seconds behind it when the name asks for 
+it (live:cam?delay=2). A viewer whose cursor falls more than MAX_LAG
+seconds behind its place, or behind the oldest frame kept, skips ahead
+to it rather than holding frames back. Live streams cannot be
+positioned or played at another Scale.
+
+ServerLauncher starts sources with --live NAME=SPEC; clients then ask
+for live:NAME. Their frame rate is set like a file's, with
+--frame-rate live:NAME=FPS. Run this module to feed an .Mjpeg file to a
+source as a camera stand-in:
+
+    python LiveSource.py movie.Mjpeg udp:127.0.0.1:5004 [--fps 30] [--loop]
+"""
+import argparse
+import logging
+import os
+import socket
+import stat
+import sys
+import threading
+import time
+from collections import deque
+from time import monotonic
+from urllib.parse import parse_qsl
+
+from Metrics import METRICS
+
+log = logging.getLogger(__name__)
+
+LIVE_PREFIX = "live:"
+DEFAULT_SECONDS = 10.0
+DEFAULT_BUDGET = 64 * 1024 * 1024   # bytes of frames kept per source
+MAX_LAG = 1.0                       # seconds a viewer may fall behind before skipping ahead
+MAX_FRAME_SIZE = 8 * 1024 * 1024    # anything longer is garbage, not a frame
+READ_SIZE = 65536
+
+SOI = b"\xff\xd8"
+EOI = b"\xff\xd9"
+SOS = 0xDA
+
+LIVE_FRAMES = METRICS.counter("live_frames_total", "Frames ingested by a live source", ("source",))
+LIVE_BYTES = METRICS.counter("live_bytes_total", "Frame bytes ingested by a live source", ("source",))
+LIVE_DISCARDED = METRICS.counter("live_discarded_bytes_total",
+                                 "Input bytes of a live source that were not part of a whole frame", ("source",))
+LIVE_SKIPS = METRICS.counter("live_viewer_skips_total", "Times a viewer fell behind and skipped ahead",
+                             ("source",))
+LIVE_SKIPPED = METRICS.counter("live_viewer_skipped_frames_total", "Frames viewers skipped to catch up",
+                               ("source",))
+
+def is_live(filename: str) -> bool:
+    return filename.startswith(LIVE_PREFIX)
+
+class JpegScanner:
+
+    def __init__(self, maxFrameSize: int = MAX_FRAME_SIZE):
+        self.maxFrameSize = maxFrameSize
+        self.buffer = bytearray()
+        self.discarded = 0
+        self.reset()
+
+    def reset(self) -> None:
+        """ Drops any partial frame; scanning starts again at the next SOI."""
+        self.discarded += len(self.buffer)
+        self.buffer.clear()
+        self.inFrame = False
+        # Where to look next: the next marker segment, or for EOI once in the scan data
+        self.position = 0
+        self.inScan = False
+
+    def resync(self) -> None:
+        """ The frame being cut out is not one: look for an SOI after its first byte."""
+        del self.buffer[:1]
+        self.discarded += 1
+        self.inFrame = False
+
+    def feed(self, data) -> list:
+        """ Adds input bytes. Returns the whole frames (SOI to EOI) they completed."""
+        buffer = self.buffer
+        buffer += data
+        frames = []
+        while True:
+            if not self.inFrame:
+                start = buffer.find(SOI)
+                if start < 0:
+                    # Keep a trailing 0xFF, it may start the next SOI
+                    keep = 1 if buffer[-1:] == b"\xff" else 0
+                    self.discarded += len(buffer) - keep
+                    del buffer[:len(buffer) - keep]
+                    return frames
+                self.discarded += start
+                del buffer[:start]
+                self.inFrame = True
+                self.inScan = False
+                self.position = 2
+            if not self.inScan and not self.scanHeader():
+                if not self.inFrame:
+                    continue
+                break
+            end = buffer.find(EOI, self.position)
+            if end < 0:
+                # Only the last byte can be the start of an EOI still to come
+                self.position = max(self.position, len(buffer) - 1)
+                break
+            frames.append(bytes(buffer[:end + 2]))
+            del buffer[:end + 2]
+            self.inFrame = False
+        if len(buffer) > self.maxFrameSize:
+            log.warning("Live input: no EOI within %d bytes, dropping them", len(buffer))
+            self.reset()
+        return frames
+
+    def scanHeader(self) -> bool:
+        """ Walks the marker segments to the start of scan. Returns true once there."""
+        buffer = self.buffer
+        position = self.position
+        while position + 4 <= len(buffer):
+            if buffer[position] != 0xFF:
+                self.resync()
+                return False
+            marker = buffer[position + 1]
+            if marker == 0xFF:
+                # Fill byte before a marker
+                position += 1
+                continue
+            if 0xD0 <= marker <= 0xD7 or marker == 0x01:
+                position += 2
+                continue
+            if marker in (0xD8, 0xD9):
+                # A new SOI or an EOI inside the header: the frame was cut short
+                self.resync()
+                return False
+            position += 2 + ((buffer[position + 2] << 8) | buffer[position + 3])
+            if marker == SOS:
+                self.position = position
+                self.inScan = True
+                return True
+        self.position = position
+        return False
+
+class LiveRing:
+
+    def __init__(self, name: str, seconds: float = DEFAULT_SECONDS, budget: int = DEFAULT_BUDGET,
+                 clock=monotonic):
+        self.name = name
+        self.seconds = seconds
+        self.budget = budget
+        self.clock = clock
+        self.lock = threading.Lock()
+        # (arrival time, frame) for frame numbers first .. first + len - 1
+        self.frames = deque()
+        self.first = 0
+        self.bytes = 0
+
+    def append(self, frame: bytes) -> None:
+        """ Adds the newest frame, dropping the oldest ones past the time or byte limit."""
+        now = self.clock()
+        with self.lock:
+            self.frames.append((now, frame))
+            self.bytes += len(frame)
+            frames = self.frames
+            # The newest frame is always kept, whatever its size
+            while len(frames) > 1 and (self.bytes > self.budget or frames[0][0] < now - self.seconds):
+                self.bytes -= len(frames.popleft()[1])
+                self.first += 1
+        LIVE_FRAMES.inc(1, (self.name,))
+        LIVE_BYTES.inc(len(frame), (self.name,))
+
+    def edge(self) -> int:
+        """ Returns the number the next frame will have."""
+        with self.lock:
+            return self.first + len(self.frames)
+
+    def frameAt(self, arrival: float) -> int:
+        """ 
+            Returns the number of the newest frame that arrived by arrival: the oldest 
+            frame kept if none did, the edge if there are none.
+        """
+        with self.lock:
+            number = self.first + len(self.frames) - 1
+            for time, _ in reversed(self.frames):
+                if time <= arrival:
+                    return number
+                number -= 1
+            return self.first
+
+    def get(self, number: int):
+        """ Returns (first frame number kept, arrival, frame) for number, with None for a frame not kept (yet)."""
+        with self.lock:
+            index = number - self.first
+            if 0 <= index < len(self.frames):
+                time, frame = self.frames[index]
+                return self.first, time, frame
+            return self.first, None, None
+
+class LiveStream:
+    """ A viewer's cursor into a LiveRing, read like a VideoStream."""
+
+    def __init__(self, ring: LiveRing, filename: str, frameRate: float, delay: float = 0.0,
+                 maxLag: float = MAX_LAG):
+        self.ring = ring
+        self.filename = filename
+        self.frameRate = frameRate
+        self.delay = max(0.0, delay)
+        self.maxLag = maxLag
+        self.frameNum = self.place()
+        self.skips = 0
+        self.skipped = 0
+
+    def place(self) -> int:
+        """ Returns the frame number this viewer should be at now: the newest one due."""
+        return self.ring.frameAt(self.ring.clock() - self.delay)
+
+    def nextFrame(self):
+        """ Returns the next frame, or None if no new one has arrived."""
+        first, arrival, frame = self.ring.get(self.frameNum)
+        if frame is None and self.frameNum >= first:
+            return None
+        if frame is None or arrival < self.ring.clock() - self.delay - self.maxLag:
+            # Too far behind: catch up rather than hold the stream back
+            self.skipTo(self.place())
+            first, arrival, frame = self.ring.get(self.frameNum)
+            if frame is None:
+                return None
+        self.frameNum += 1
+        return frame
+
+    def skipTo(self, number: int) -> None:
+        if number <= self.frameNum:
+            return
+        self.skips += 1
+        self.skipped += number - self.frameNum
+        LIVE_SKIPS.inc(1, (self.ring.name,))
+        LIVE_SKIPPED.inc(number - self.frameNum, (self.ring.name,))
+        self.frameNum = number
+
+    def frameNbr(self) -> int:
+        return self.frameNum
+
+    def skip(self, count: int) -> None:
+        """ Skip count frames, but not past the live edge."""
+        self.frameNum = min(self.frameNum + count, max(self.frameNum, self.ring.edge()))
+
+    def seek(self, frame: int) -> None:
+        raise ValueError("a live stream cannot be positioned")
+
+    def duration(self):
+        """ None: a live stream has no end."""
+        return None
+
+    def close(self) -> None:
+        if self.skips:
+            log.info("Viewer of %s skipped %d frames in %d catch-ups", self.filename, self.skipped, self.skips)
+
+class LiveSource:
+
+    def __init__(self, name: str, spec: str, seconds: float = DEFAULT_SECONDS, budget: int = DEFAULT_BUDGET):
+        kind, sep, address = spec.partition(":")
+        if not sep or kind not in ("pipe", "unix", "udp"):
+            raise ValueError("live source %s: expected pipe:PATH, unix:PATH or udp:HOST:PORT, got %r"
+                             % (name, spec))
+        if kind == "udp":
+            host, _, port = address.rpartition(":")
+            address = (host or "0.0.0.0", int(port))
+        self.name = name
+        self.kind = kind
+        self.address = address
+        self.ring = LiveRing(name, seconds, budget)
+        self.scanner = JpegScanner()
+        self.sock = None
+        self.running = False
+        self.thread = None
+
+    def start(self) -> "LiveSource":
+        """ Opens the input and starts the ingest thread. Returns self."""
+        if self.kind == "udp":
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+            self.sock.bind(self.address)
+        elif self.kind == "unix":
+            if os.path.exists(self.address) and stat.S_ISSOCK(os.stat(self.address).st_mode):
+                os.unlink(self.address)
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.bind(self.address)
+            self.sock.listen(1)
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="LiveSource-" + self.name, daemon=True)
+        self.thread.start()
+        log.info("Live source %s reading %s:%s", self.name, self.kind, self.address)
+        return self
+
+    def stop(self) -> None:
+        self.running = False
+        if self.sock is not None:
+            self.sock.close()
+
+    def run(self) -> None:
+        try:
+            if self.kind == "udp":
+                self.readDatagrams()
+            elif self.kind == "unix":
+                while self.running:
+                    conn, _ = self.sock.accept()
+                    with conn:
+                        self.readStream(conn.recv)
+            else:
+                self.readPipe()
+        except OSError as e:
+            if self.running:
+                log.error("Live source %s stopped: %s", self.name, e)
+
+    def ingest(self, data) -> None:
+        for frame in self.scanner.feed(data):
+            self.ring.append(frame)
+        if self.scanner.discarded:
+            LIVE_DISCARDED.inc(self.scanner.discarded, (self.name,))
+            self.scanner.discarded = 0
+
+    def readStream(self, read) -> None:
+        while self.running:
+            data = read(READ_SIZE)
+            if not data:
+                # The writer went away; its partial frame is gone with it
+                self.scanner.reset()
+                return
+            self.ingest(data)
+
+    def readPipe(self) -> None:
+        while self.running:
+            if self.address == "-":
+                self.readStream(sys.stdin.buffer.raw.read)
+                return
+            # Opening a FIFO waits for a writer
+            with open(self.address, "rb", buffering=0) as pipe:
+                self.readStream(pipe.read)
+            if not stat.S_ISFIFO(os.stat(self.address).st_mode):
+                return
+
+    def readDatagrams(self) -> None:
+        while self.running:
+            data = self.sock.recv(READ_SIZE)
+            if data[:2] == SOI and self.scanner.inFrame:
+                # The rest of the previous frame was lost
+                self.scanner.reset()
+            self.ingest(data)
+
+class LiveSources:
+    """ The live sources of a server, by name."""
+
+    def __init__(self, seconds: float = DEFAULT_SECONDS, budget: int = DEFAULT_BUDGET):
+        self.seconds = seconds
+        self.budget = budget
+        self.sources = {}
+
+    def add(self, name: str, spec: str) -> LiveSource:
+        source = self.sources[name] = LiveSource(name, spec, self.seconds, self.budget).start()
+        return source
+
+    def attach(self, filename: str, frameRate: float) -> LiveStream:
+        """ Returns a cursor for live:NAME[?delay=SECONDS]. Raises IOError for an unknown source."""
+        name, _, query = filename[len(LIVE_PREFIX):].partition("?")
+        source = self.sources.get(name)
+        if source is None:
+            raise IOError("no live source %r" % name)
+        try:
+            delay = float(dict(parse_qsl(query)).get("delay", 0))
+        except ValueError:
+            raise IOError("bad delay in %r" % filename)
+        return LiveStream(source.ring, filename, frameRate, delay)
+
+    def stop(self) -> None:
+        for source in self.sources.values():
+            source.stop()
+
+def feed(path: str, spec: str, fps: float, loop: bool = False) -> None:
+    """ Sends the frames of an .Mjpeg file to a live source input at fps, like a camera."""
+    from VideoStream import VideoStream
+
+    kind, _, address = spec.partition(":")
+    if kind == "udp":
+        host, _, port = address.rpartition(":")
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.connect((host, int(port)))
+
+        def send(frame):
+            # Frames go out in datagram-sized pieces
+            for start in range(0, len(frame), 60000):
+                try:
+                    sock.send(frame[start:start + 60000])
+                except ConnectionRefusedError:
+                    # Nobody listening yet; a camera keeps sending regardless
+                    pass
+    elif kind == "unix":
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(address)
+        send = sock.sendall
+    else:
+        pipe = open(address, "wb", buffering=0) if address != "-" else sys.stdout.buffer
+        send = pipe.write
+    period = 1.0 / fps
+    deadline = monotonic()
+    while True:
+        stream = VideoStream(path, fps)
+        while True:
+            frame = stream.nextFrame()
+            if not frame:
+                break
+            send(bytes(frame))
+            deadline += period
+            time.sleep(max(0.0, deadline - monotonic()))
+        stream.close()
+        if not loop:
+            return
+
+def main():
+    parser = argparse.ArgumentParser(description="Feed an .Mjpeg file to a live source input, like a camera")
+    parser.add_argument("file", help="length-prefixed .Mjpeg file to send")
+    parser.add_argument("spec", help="pipe:PATH, unix:PATH or udp:HOST:PORT")
+    parser.add_argument("--fps", type=float, default=30.0, help="frames per second (default 30)")
+    parser.add_argument("--loop", action="store_true", help="start over at the end of the file")
+    args = parser.parse_args()
+    feed(args.file, args.spec, args.fps, args.loop)
+
+if __name__ == "__main__":
+    main()
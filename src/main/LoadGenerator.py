@@ -0,0 +1,371 @@
+"""
+Purpose:
+
+LoadGenerator is a headless client that runs many RTSP/RTP sessions
+against one server from a single process, to find out how many viewers
+a server mode can really carry. Every session drives the same RtspClient
+state machine as the GUI client, on one asyncio event loop:
+
+    - sessions start spread evenly over a ramp-up period;
+    - each second a playing session may PAUSE for a moment and PLAY
+      again (--pause-rate), or TEARDOWN and be replaced by a fresh
+      session (--churn);
+    - every RTP packet is checked: sequence numbers give loss,
+      reordering and duplicates (RtpReceiverStats), and frames are
+      reassembled and must look like a JPEG (SOI ... EOI);
+    - receiver reports go back to the server once a second, so its RTCP
+      and rate control see the load generator like any other client.
+
+The report gives per-session frame rates, loss and reordering, and
+percentiles of the control latency of every RTSP method plus the time
+from SETUP to the first complete frame.
+
+Each session uses three sockets, so large runs need a raised open file
+limit (ulimit -n).
+
+Usage (from src/main):
+    python LoadGenerator.py --sessions 200 --ramp 10 --duration 30 [--json report.json]
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+from collections import Counter, deque
+from random import getrandbits
+from socket import socket, AF_INET, SOCK_DGRAM
+from time import monotonic
+
+from RtpPacket import RtpPacket
+from RtpReceiverStats import RtpReceiverStats, SEQ_MOD, MAX_MISORDER
+from RtcpPacket import RTCP_INTERVAL, SenderReport, pack_receiver_report, parse_rtcp
+from FrameReassembler import FrameReassembler
+from RtspCodec import RtspParser, RtspError
+from RtspClient import RtspClient
+from VariantCache import TIER_HEADER
+
+JPEG_SOI = b"\xff\xd8"
+JPEG_EOI = b"\xff\xd9"
+RECENT_SEQS = 512               # sequence numbers remembered to tell duplicates from reordering
+PAUSE_TIME = (0.2, 1.0)         # seconds a randomly paused session stays paused
+
+def percentiles(values) -> dict:
+    """ Returns count, p50, p90, p99 and max of values, in milliseconds."""
+    values = sorted(values)
+    result = {"count": len(values)}
+    for name, fraction in (("p50_ms", 0.50), ("p90_ms", 0.90), ("p99_ms", 0.99)):
+        result[name] = 1000 * values[min(len(values) - 1, int(fraction * len(values)))] if values else 0.0
+    result["max_ms"] = 1000 * values[-1] if values else 0.0
+    return result
+
+def bind_port_pair(host: str = "0.0.0.0"):
+    """ Binds UDP sockets to a free even port and the port above it, for RTP and RTCP."""
+    for _ in range(100):
+        rtpSocket = socket(AF_INET, SOCK_DGRAM)
+        rtpSocket.bind((host, 0))
+        port = rtpSocket.getsockname()[1]
+        if port % 2 == 0:
+            rtcpSocket = socket(AF_INET, SOCK_DGRAM)
+            try:
+                rtcpSocket.bind((host, port + 1))
+                return rtpSocket, rtcpSocket
+            except OSError:
+                rtcpSocket.close()
+        rtpSocket.close()
+    raise OSError("no free RTP/RTCP port pair")
+
+class DatagramHandler(asyncio.DatagramProtocol):
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def datagram_received(self, data, addr):
+        self.callback(data)
+
+class LoadSession(RtspClient):
+
+    def __init__(self, generator, slot: int, fileName: str):
+        RtspClient.__init__(self, fileName, 0)
+        self.generator = generator
+        self.slot = slot
+        self.parser = RtspParser()
+        self.pending = None
+        self.writer = None
+        self.transports = []
+        self.rtcpTransport = None
+        # RTP checks
+        self.receiverStats = RtpReceiverStats()
+        self.reassembler = FrameReassembler(reorder=True)
+        self.recentSeqs = deque(maxlen=RECENT_SEQS)
+        self.packets = 0
+        self.frames = 0
+        self.badFrames = 0
+        self.reordered = 0
+        self.duplicates = 0
+        self.rtcpSsrc = getrandbits(32)
+        if generator.tier:
+            self.setupHeaders[TIER_HEADER] = generator.tier
+        # Timing
+        self.setupSent = None
+        self.firstFrame = None
+        self.playingSince = None
+        self.playingTime = 0.0
+        self.churned = False
+        self.error = None
+
+    async def run(self, deadline: float) -> None:
+        """ Streams until deadline (loop time), with random pauses and churn."""
+        loop = asyncio.get_running_loop()
+        rng = self.generator.rng
+        try:
+            await self.open()
+            self.setupSent = monotonic()
+            await self.request(self.SETUP)
+            await self.request(self.PLAY)
+            while loop.time() < deadline:
+                await asyncio.sleep(min(RTCP_INTERVAL, max(0.0, deadline - loop.time())))
+                self.sendReceiverReport()
+                if loop.time() >= deadline:
+                    break
+                if rng.random() < self.generator.churn:
+                    self.churned = True
+                    break
+                if rng.random() < self.generator.pauseRate:
+                    await self.request(self.PAUSE)
+                    await asyncio.sleep(rng.uniform(*PAUSE_TIME))
+                    await self.request(self.PLAY)
+            await self.request(self.TEARDOWN)
+        except (OSError, RtspError, asyncio.TimeoutError, ConnectionError) as e:
+            self.error = type(e).__name__
+        finally:
+            self.close()
+
+    async def open(self) -> None:
+        loop = asyncio.get_running_loop()
+        rtpSocket, rtcpSocket = bind_port_pair()
+        self.rtpPort = rtpSocket.getsockname()[1]
+        transport, _ = await loop.create_datagram_endpoint(
+            lambda: DatagramHandler(self.receiveRtp), sock=rtpSocket)
+        self.transports.append(transport)
+        self.rtcpTransport, _ = await loop.create_datagram_endpoint(
+            lambda: DatagramHandler(self.receiveRtcp), sock=rtcpSocket)
+        self.transports.append(self.rtcpTransport)
+        reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.generator.host, self.generator.port), self.generator.timeout)
+        self.transports.append(self.writer)
+        self.readerTask = loop.create_task(self.readReplies(reader))
+
+    def close(self) -> None:
+        self.stopPlaying()
+        if getattr(self, "readerTask", None) is not None:
+            self.readerTask.cancel()
+        for transport in self.transports:
+            transport.close()
+        self.transports = []
+
+    async def request(self, requestCode) -> None:
+        """ Sends one request and waits for its reply, recording the control latency."""
+        request = self.makeRequest(requestCode)
+        if request is None:
+            return
+        self.pending = asyncio.get_running_loop().create_future()
+        sent = monotonic()
+        self.writer.write(request.encode("%s:%d" % (self.generator.host, self.generator.port)))
+        reply, acked = await asyncio.wait_for(self.pending, self.generator.timeout)
+        method = self.REQUEST_TYPES[requestCode]
+        self.generator.latencies[method].append(monotonic() - sent)
+        if acked != requestCode:
+            raise RtspError("%s answered %d %s" % (method, reply.status, reply.reason))
+        if acked == self.PLAY:
+            self.playingSince = monotonic()
+        elif acked in (self.PAUSE, self.TEARDOWN):
+            self.stopPlaying()
+
+    async def readReplies(self, reader) -> None:
+        while True:
+            data = await reader.read(4096)
+            if not data:
+                if self.pending is not None and not self.pending.done():
+                    self.pending.set_exception(ConnectionError("server closed the connection"))
+                return
+            try:
+                messages = self.parser.feed(data)
+            except RtspError as e:
+                if self.pending is not None and not self.pending.done():
+                    self.pending.set_exception(e)
+                return
+            for message in messages:
+                acked = self.processReply(message)
+                if self.pending is not None and not self.pending.done() and not message.is_request:
+                    self.pending.set_result((message, acked))
+
+    def stopPlaying(self) -> None:
+        if self.playingSince is not None:
+            self.playingTime += monotonic() - self.playingSince
+            self.playingSince = None
+
+    def receiveRtp(self, data) -> None:
+        packet = RtpPacket()
+        try:
+            packet.decode(data)
+        except Exception:
+            self.badFrames += 1
+            return
+        self.packets += 1
+        seq = packet.get_seq_num()
+        if packet.get_ssrc() == self.receiverStats.ssrc:
+            if seq in self.recentSeqs:
+                self.duplicates += 1
+                return
+            if (seq - self.receiverStats.maxSeq) % SEQ_MOD > SEQ_MOD - MAX_MISORDER:
+                self.reordered += 1
+        self.recentSeqs.append(seq)
+        self.receiverStats.update(packet.get_ssrc(), seq, packet.get_timestamp())
+
+        frame = self.reassembler.add(packet)
+        if frame is None:
+            return
+        data = frame[1]
+        if not (data.startswith(JPEG_SOI) and data.endswith(JPEG_EOI)):
+            self.badFrames += 1
+            return
+        self.frames += 1
+        if self.firstFrame is None:
+            self.firstFrame = monotonic()
+            self.generator.latencies["first_frame"].append(self.firstFrame - self.setupSent)
+
+    def receiveRtcp(self, data) -> None:
+        try:
+            for packet in parse_rtcp(data):
+                if isinstance(packet, SenderReport):
+                    self.receiverStats.on_sender_report(packet)
+        except ValueError:
+            pass
+
+    def sendReceiverReport(self) -> None:
+        if self.receiverStats.ssrc is None or not self.serverPorts or self.rtcpTransport is None:
+            return
+        report = pack_receiver_report(self.rtcpSsrc, [self.receiverStats.report_block()])
+        self.rtcpTransport.sendto(report, (self.generator.host, self.serverPorts[1]))
+
+    def summary(self) -> dict:
+        expected = self.receiverStats.expected() if self.receiverStats.ssrc is not None else 0
+        lost = max(0, self.receiverStats.lost()) if expected else 0
+        return {
+            "slot": self.slot,
+            "session": self.sessionId,
+            "error": self.error,
+            "churned": self.churned,
+            "packets": self.packets,
+            "frames": self.frames,
+            "playing_s": self.playingTime,
+            "fps": self.frames / self.playingTime if self.playingTime else 0.0,
+            "lost": lost,
+            "loss_pct": 100.0 * lost / expected if expected else 0.0,
+            "reordered": self.reordered,
+            "duplicates": self.duplicates,
+            "bad_frames": self.badFrames,
+        }
+
+class LoadGenerator:
+
+    def __init__(self, host, port, fileName, sessions, ramp=0.0, duration=10.0, pauseRate=0.0,
+                 churn=0.0, seed=None, timeout=5.0, tier=None):
+        self.host = host
+        self.port = port
+        self.fileName = fileName
+        self.slots = sessions
+        self.ramp = ramp
+        self.duration = duration
+        self.pauseRate = pauseRate
+        self.churn = churn
+        self.timeout = timeout
+        self.tier = tier
+        self.rng = random.Random(seed)
+        self.sessions = []
+        self.latencies = {name: [] for name in list(RtspClient.REQUEST_TYPES.values()) + ["first_frame"]}
+
+    async def run(self) -> dict:
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        deadline = start + self.ramp + self.duration
+        await asyncio.gather(*(self.runSlot(slot, start + self.ramp * slot / self.slots, deadline)
+                               for slot in range(self.slots)))
+        return self.report()
+
+    async def runSlot(self, slot: int, startAt: float, deadline: float) -> None:
+        """ Runs one session of the scenario, and its replacements if it churns."""
+        loop = asyncio.get_running_loop()
+        await asyncio.sleep(max(0.0, startAt - loop.time()))
+        while loop.time() < deadline:
+            session = LoadSession(self, slot, self.fileName)
+            self.sessions.append(session)
+            await session.run(deadline)
+            if not session.churned:
+                break
+
+    def report(self) -> dict:
+        summaries = [session.summary() for session in self.sessions]
+        rates = sorted(summary["fps"] for summary in summaries if summary["frames"])
+        received = sum(summary["packets"] for summary in summaries)
+        lost = sum(summary["lost"] for summary in summaries)
+        return {
+            "slots": self.slots,
+            "sessions": len(summaries),
+            "errors": dict(Counter(summary["error"] for summary in summaries if summary["error"])),
+            "fps": {
+                "min": rates[0] if rates else 0.0,
+                "p50": rates[len(rates) // 2] if rates else 0.0,
+                "mean": sum(rates) / len(rates) if rates else 0.0,
+            },
+            "frames": sum(summary["frames"] for summary in summaries),
+            "loss_pct": 100.0 * lost / (received + lost) if received + lost else 0.0,
+            "reordered": sum(summary["reordered"] for summary in summaries),
+            "duplicates": sum(summary["duplicates"] for summary in summaries),
+            "bad_frames": sum(summary["bad_frames"] for summary in summaries),
+            "latency": {name: percentiles(values) for name, values in self.latencies.items()},
+            "per_session": summaries,
+        }
+
+def print_report(report) -> None:
+    print("%d sessions in %d slots, %d failed %s" % (report["sessions"], report["slots"],
+          sum(report["errors"].values()), report["errors"] or ""))
+    print("fps per session: min %.1f  p50 %.1f  mean %.1f" % (report["fps"]["min"], report["fps"]["p50"],
+          report["fps"]["mean"]))
+    print("%d frames, loss %.2f%%, %d reordered, %d duplicates, %d bad frames" % (report["frames"],
+          report["loss_pct"], report["reordered"], report["duplicates"], report["bad_frames"]))
+    for name, latency in report["latency"].items():
+        print("%-12s n=%-6d p50 %7.1f ms  p90 %7.1f ms  p99 %7.1f ms  max %7.1f ms" % (name,
+              latency["count"], latency["p50_ms"], latency["p90_ms"], latency["p99_ms"], latency["max_ms"]))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless RTSP/RTP load generator")
+    parser.add_argument("--host", default="localhost", help="server address")
+    parser.add_argument("--port", type=int, default=8000, help="server RTSP port")
+    parser.add_argument("--file", default="./movie.Mjpeg", help="media file to request")
+    parser.add_argument("--sessions", type=int, default=10, help="concurrent sessions")
+    parser.add_argument("--ramp", type=float, default=0.0, help="seconds over which sessions start")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to stream after the ramp")
+    parser.add_argument("--pause-rate", type=float, default=0.0,
+                        help="chance per session and second of a short PAUSE")
+    parser.add_argument("--churn", type=float, default=0.0,
+                        help="chance per session and second of a TEARDOWN and a new session")
+    parser.add_argument("--seed", type=int, default=None, help="random seed for a repeatable scenario")
+    parser.add_argument("--timeout", type=float, default=5.0, help="seconds to wait for an RTSP reply")
+    parser.add_argument("--json", metavar="FILE", help="also write the full report as JSON")
+    parser.add_argument("--tier", default=None, help="quality tier every session asks for at SETUP")
+    args = parser.parse_args(argv)
+    if args.sessions < 1:
+        parser.error("--sessions must be at least 1")
+
+    generator = LoadGenerator(args.host, args.port, args.file, args.sessions, args.ramp, args.duration,
+                              args.pause_rate, args.churn, args.seed, args.timeout, args.tier)
+    report = asyncio.run(generator.run())
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+    return report
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,236 @@
+"""
+Purpose:
+
+Metrics gives the server and the client counters, gauges and histograms
+that cost little enough to update on the hot path (a dict update under
+a lock), and renders them in the Prometheus text exposition format:
+
+    # HELP rtp_frames_sent_total Video frames sent over RTP
+    # TYPE rtp_frames_sent_total counter
+    rtp_frames_sent_total 1234
+
+Metrics are created once per process through the METRICS registry,
+usually as module-level names next to the code that updates them. A
+Gauge can also take a function that is only called at scrape time, and
+a collector function can add whole metrics at scrape time (e.g. one
+sample per session).
+
+MetricsServer serves the registry over HTTP on GET /metrics, by default
+on the loopback interface only. Other tools can add control routes to 
+it (see Profiler.routes()). 
+"""
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_HOST = "127.0.0.1"
+# Seconds; suits send calls, pacing errors and RTSP request handling alike
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5)
+
+def format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def format_labels(names, values, extra=None) -> str:
+    pairs = ["%s=\"%s\"" % (name, escape_label(value)) for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append("%s=\"%s\"" % extra)
+    return "{%s}" % ",".join(pairs) if pairs else ""
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelNames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelNames = tuple(labelNames)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def get(self, labels: tuple = ()):
+        """ Returns the current value for labels (for tests and debugging)."""
+        with self.lock:
+            return self.values.get(tuple(labels))
+
+    def samples(self):
+        """ Yields (suffix, labels, extra label or None, value) for every sample."""
+        with self.lock:
+            values = list(self.values.items())
+        for labels, value in values:
+            yield "", labels, None, value
+
+    def render(self, lines: list) -> None:
+        lines.append("# HELP %s %s" % (self.name, self.help.replace("\\", "\\\\").replace("\n", "\\n")))
+        lines.append("# TYPE %s %s" % (self.name, self.kind))
+        for suffix, labels, extra, value in self.samples():
+            lines.append("%s%s%s %s" % (self.name, suffix, format_labels(self.labelNames, labels, extra),
+                                        format_value(value)))
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, labels: tuple = ()) -> None:
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelNames: tuple = (), function=None):
+        Metric.__init__(self, name, help, labelNames)
+        # Called at scrape time: returns a number, or {labels: number}
+        self.function = function
+
+    def set(self, value, labels: tuple = ()) -> None:
+        with self.lock:
+            self.values[labels] = value
+
+    def inc(self, amount=1, labels: tuple = ()) -> None:
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dec(self, amount=1, labels: tuple = ()) -> None:
+        self.inc(-amount, labels)
+
+    def samples(self):
+        if self.function is None:
+            yield from Metric.samples(self)
+            return
+        value = self.function()
+        if not isinstance(value, dict):
+            value = {(): value}
+        for labels, sample in value.items():
+            yield "", labels, None, sample
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelNames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        Metric.__init__(self, name, help, labelNames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, labels: tuple = ()) -> None:
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(labels)
+            if state is None:
+                # Per-bucket counts (the last one is +Inf), sum, count
+                state = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        with self.lock:
+            values = [(labels, (list(counts), total, count)) for labels, (counts, total, count) in self.values.items()]
+        for labels, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucketCount in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucketCount
+                yield "_bucket", labels, ("le", format_value(float(bound))), cumulative
+            yield "_sum", labels, None, total
+            yield "_count", labels, None, count
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.collectors = []
+
+    def register(self, metric: Metric) -> Metric:
+        """ Adds metric, or returns the one already registered under its name."""
+        with self.lock:
+            existing = self.metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric):
+                    raise ValueError("metric %s is already registered as a %s" % (metric.name, existing.kind))
+                return existing
+            self.metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help: str, labelNames: tuple = ()) -> Counter:
+        return self.register(Counter(name, help, labelNames))
+
+    def gauge(self, name: str, help: str, labelNames: tuple = (), function=None) -> Gauge:
+        gauge = self.register(Gauge(name, help, labelNames))
+        if function is not None:
+            gauge.function = function
+        return gauge
+
+    def histogram(self, name: str, help: str, labelNames: tuple = (),
+                  buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelNames, buckets))
+
+    def add_collector(self, collector) -> None:
+        """ Adds a function called at scrape time that returns a list of Metrics to render."""
+        with self.lock:
+            self.collectors.append(collector)
+
+    def remove_collector(self, collector) -> None:
+        with self.lock:
+            if collector in self.collectors:
+                self.collectors.remove(collector)
+
+    def render(self) -> str:
+        with self.lock:
+            metrics = list(self.metrics.values())
+            collectors = list(self.collectors)
+        for collector in collectors:
+            metrics.extend(collector())
+        lines = []
+        for metric in metrics:
+            metric.render(lines)
+        return "\n".join(lines) + "\n"
+
+# One registry per process
+METRICS = MetricsRegistry()
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path in ("/", "/metrics"):
+            contentType, body = CONTENT_TYPE, self.server.registry.render()
+        elif url.path in self.server.routes:
+            try:
+                contentType, body = self.server.routes[url.path](dict(parse_qsl(url.query)))
+            except ValueError as e:
+                self.send_error(400, str(e))
+                return
+        else:
+            self.send_error(404)
+            return
+        body = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", contentType)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # One line per scrape would be noise
+        pass
+
+class MetricsServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int, host: str = DEFAULT_HOST, registry: MetricsRegistry = METRICS):
+        ThreadingHTTPServer.__init__(self, (host, port), MetricsHandler)
+        self.registry = registry
+        # Extra GET paths: path -> handler(query dict) -> (content type, body text)
+        self.routes = {}
+
+    def start(self) -> "MetricsServer":
+        """ Serves scrapes on a daemon thread. Returns self."""
+        threading.Thread(target=self.serve_forever, name="MetricsServer", daemon=True).start()
+        return self
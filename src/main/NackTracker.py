@@ -0,0 +1,134 @@
+"""
+Purpose: 
+
+The NackTracker finds gaps in the RTP sequence numbers the client 
+receives and decides which lost packets to ask the server for again 
+(RTCP generic NACK), and until when. 
+
+Each missing packet gets a deadline, normally the jitter buffer's 
+playout delay: a retransmission arriving after that is useless. A gap 
+is only NACKed after a short reorder delay, since UDP packets often 
+arrive slightly out of order, and is asked for again every retry 
+interval until it arrives, its deadline passes or the retries run out. 
+
+The tracker also suppresses duplicates: a packet seen before (e.g. a 
+retransmission racing the late original) is reported so the caller can 
+drop it before reassembly. Counters record what was NACKed, which 
+retransmissions arrived in time or late, and what was given up. 
+"""
+from time import monotonic
+
+DEFAULT_REORDER_DELAY = 0.005   # seconds before a gap is NACKed
+DEFAULT_RETRY_INTERVAL = 0.05   # seconds between NACKs for the same packet
+DEFAULT_MAX_RETRIES = 3
+MAX_GAP = 512                   # larger jumps resynchronise instead of NACKing
+SEEN_WINDOW = 2048              # sequence numbers remembered for duplicate suppression
+LATE_GRACE = 1.0                # seconds a packet past its deadline is still tracked, to count it late
+
+class MissingPacket: 
+
+    def __init__(self, detected: float, deadline: float):
+        self.detected = detected
+        self.deadline = deadline
+        self.nacked = None
+        self.retries = 0
+        self.expired = False
+
+class NackTracker: 
+
+    def __init__(self, reorderDelay: float = DEFAULT_REORDER_DELAY, 
+                 retryInterval: float = DEFAULT_RETRY_INTERVAL, 
+                 maxRetries: int = DEFAULT_MAX_RETRIES, clock=monotonic):
+        self.reorderDelay = reorderDelay
+        self.retryInterval = retryInterval
+        self.maxRetries = maxRetries
+        self.clock = clock
+        self.highest = None      # extended sequence number
+        self.seen = set()
+        self.missing = {}
+        self.nacked = 0
+        self.inTime = 0
+        self.late = 0
+        self.duplicates = 0
+        self.givenUp = 0
+
+    def extend(self, seq_num: int) -> int: 
+        delta = ((seq_num - self.highest + 0x8000) & 0xFFFF) - 0x8000
+        return self.highest + delta
+
+    def received(self, seq_num: int, delay: float, now: float = None) -> bool: 
+        """ 
+            Accounts for a received packet; delay is how long a packet 
+            missing now may still take to arrive. Returns false for a 
+            duplicate that should be dropped. 
+        """
+        if now is None: 
+            now = self.clock()
+        if self.highest is None: 
+            self.highest = seq_num
+            self.seen.add(seq_num)
+            return True
+
+        extended = self.extend(seq_num)
+        if extended in self.seen: 
+            self.duplicates += 1
+            return False
+        self.seen.add(extended)
+
+        missing = self.missing.pop(extended, None)
+        if missing is not None and missing.nacked is not None: 
+            if now <= missing.deadline: 
+                self.inTime += 1
+            else: 
+                self.late += 1
+
+        if extended > self.highest: 
+            if extended - self.highest > MAX_GAP: 
+                # The stream jumped (e.g. the server restarted it): start over
+                self.missing.clear()
+                self.seen = {extended}
+            else: 
+                for lost in range(self.highest + 1, extended): 
+                    self.missing[lost] = MissingPacket(now, now + delay)
+            self.highest = extended
+            if len(self.seen) > 2 * SEEN_WINDOW: 
+                self.seen = {seq for seq in self.seen if seq > extended - SEEN_WINDOW}
+        return True
+
+    def due(self, now: float = None) -> tuple: 
+        """ 
+            Returns (sequence numbers, deadline in seconds from now) to NACK
+            now; the list is empty if nothing is due. 
+        """
+        if now is None: 
+            now = self.clock()
+        due = []
+        deadline = None
+        for extended, missing in list(self.missing.items()): 
+            if now >= missing.deadline: 
+                if not missing.expired: 
+                    missing.expired = True
+                    self.givenUp += 1
+                if now >= missing.deadline + LATE_GRACE: 
+                    del self.missing[extended]
+                continue
+            if missing.retries >= self.maxRetries: 
+                continue
+            if missing.nacked is None: 
+                if now - missing.detected < self.reorderDelay: 
+                    continue
+            elif now - missing.nacked < self.retryInterval: 
+                continue
+            if missing.nacked is None: 
+                self.nacked += 1
+            missing.nacked = now
+            missing.retries += 1
+            due.append(extended & 0xFFFF)
+            remaining = missing.deadline - now
+            deadline = remaining if deadline is None else min(deadline, remaining)
+        return due, deadline
+
+    def stats(self) -> dict: 
+        return {"nacked": self.nacked, "in_time": self.inTime, "late": self.late, 
+                "duplicates": self.duplicates, "given_up": self.givenUp, 
+                "missing": sum(not missing.expired for missing in self.missing.values())}
@@ -0,0 +1,188 @@
+"""
+Purpose: 
+
+The PacingScheduler decides when each streaming session sends its next
+frame. Sessions keep absolute deadlines on a monotonic clock (deadline n
+is start + n / frame_rate), so the time spent reading and sending a frame
+no longer stretches the frame period and the output rate does not drift.
+
+In the threaded server a single scheduler thread serves every playing
+session: it sleeps until the earliest deadline, then sends for every 
+session that is due within a small batch window in one pass. The asyncio
+server keeps one PacingClock per session on the event loop's clock. 
+
+When the sender falls behind, the policy decides what happens: 
+    * CATCH_UP: send the late frames back-to-back until on schedule again
+    * DROP: skip the frames whose time has passed and send the current one
+Either way a session more than max_lag behind is re-anchored to now, so
+a stall never turns into a burst of a whole second of video. 
+
+PacingStats records how late each send was against its deadline, and
+feeds the process-wide pacing metrics.
+"""
+import heapq
+import itertools
+import logging
+import threading
+from collections import deque
+from time import monotonic
+
+from Metrics import METRICS
+
+log = logging.getLogger(__name__)
+
+PACING_ERROR = METRICS.histogram("pacing_error_seconds", "How late a frame was sent against its deadline")
+FRAMES_SKIPPED = METRICS.counter("pacing_skipped_frames_total", "Frames dropped by the pacing policy")
+
+CATCH_UP = "catchup"
+DROP = "drop"
+POLICIES = (CATCH_UP, DROP)
+
+DEFAULT_MAX_LAG = 1.0       # seconds behind before a session is re-anchored
+DEFAULT_BATCH_WINDOW = 0.001
+STATS_WINDOW = 1024         # recent samples kept for percentiles
+FRAME_SLACK = 1e-6          # fraction of a period by which a deadline counts as passed despite rounding
+
+class PacingStats: 
+
+    def __init__(self, window: int = STATS_WINDOW):
+        self.lock = threading.Lock()
+        self.recent = deque(maxlen=window)
+        self.sends = 0
+        self.skipped = 0
+        self.total_error = 0.0
+        self.max_error = 0.0
+
+    def record(self, error: float, skipped: int = 0) -> None: 
+        """ Records one send that happened error seconds after its deadline."""
+        PACING_ERROR.observe(error)
+        if skipped: 
+            FRAMES_SKIPPED.inc(skipped)
+        with self.lock: 
+            self.sends += 1
+            self.skipped += skipped
+            self.total_error += error
+            self.max_error = max(self.max_error, error)
+            self.recent.append(error)
+
+    def snapshot(self) -> dict: 
+        """ Returns pacing error statistics in milliseconds."""
+        with self.lock: 
+            recent = sorted(self.recent)
+            sends = self.sends
+            result = {"sends": sends, "skipped": self.skipped,
+                      "mean_ms": 1000 * self.total_error / sends if sends else 0.0,
+                      "max_ms": 1000 * self.max_error}
+        for name, fraction in (("p50_ms", 0.50), ("p99_ms", 0.99)): 
+            result[name] = 1000 * recent[min(len(recent) - 1, int(fraction * len(recent)))] if recent else 0.0
+        return result
+
+class PacingClock: 
+
+    def __init__(self, frame_rate: float, start: float, policy: str = CATCH_UP, 
+                 max_lag: float = DEFAULT_MAX_LAG):
+        if policy not in POLICIES: 
+            raise ValueError("unknown pacing policy %r" % policy)
+        self.period = 1 / frame_rate
+        self.policy = policy
+        self.max_lag = max_lag
+        self.anchor = start
+        self.frames = 1
+        self.deadline = start + self.period
+
+    def due(self, now: float) -> tuple: 
+        """
+            Called when the deadline has passed. Returns (error, skip): how 
+            late this send is and how many frames to skip before sending, 
+            and moves the deadline on to the next frame. 
+        """
+        error = max(0.0, now - self.deadline)
+        skip = 0
+        if error > self.max_lag: 
+            # Too far behind to recover smoothly: restart the schedule now.
+            self.anchor = now
+            self.frames = 0
+        elif self.policy == DROP: 
+            # Count the frames due since the anchor rather than dividing the error,
+            # so a send exactly N periods late does not round down to N - 1 skips
+            skip = max(0, int((now - self.anchor) / self.period + FRAME_SLACK) - self.frames)
+            self.frames += skip
+        self.frames += 1
+        self.deadline = self.anchor + self.frames * self.period
+        return error, skip
+
+class PacingScheduler: 
+
+    def __init__(self, policy: str = CATCH_UP, max_lag: float = DEFAULT_MAX_LAG, 
+                 batch_window: float = DEFAULT_BATCH_WINDOW, clock=monotonic):
+        if policy not in POLICIES: 
+            raise ValueError("unknown pacing policy %r" % policy)
+        self.policy = policy
+        self.max_lag = max_lag
+        self.batch_window = batch_window
+        self.clock = clock
+        self.stats = PacingStats()
+        self.condition = threading.Condition()
+        self.heap = []
+        self.entries = {}
+        self.counter = itertools.count()
+        self.thread = None
+
+    def add(self, session, frame_rate: float) -> None: 
+        """
+            Starts pacing session at frame_rate. The scheduler calls 
+            session.sendFrame(skip) at every deadline until remove(). 
+        """
+        with self.condition: 
+            if self.thread is None: 
+                self.thread = threading.Thread(target=self.run, name="PacingScheduler", daemon=True)
+                self.thread.start()
+            entry = [PacingClock(frame_rate, self.clock(), self.policy, self.max_lag), session]
+            self.entries[id(session)] = entry
+            heapq.heappush(self.heap, (entry[0].deadline, next(self.counter), entry))
+            self.condition.notify()
+
+    def remove(self, session) -> None: 
+        """ Stops pacing session (PAUSE or TEARDOWN)."""
+        with self.condition: 
+            entry = self.entries.pop(id(session), None)
+            if entry is not None: 
+                # Heap entries are dropped lazily when they come due.
+                entry[1] = None
+
+    def __len__(self) -> int: 
+        with self.condition: 
+            return len(self.entries)
+
+    def run(self) -> None: 
+        while True: 
+            with self.condition: 
+                while True: 
+                    now = self.clock()
+                    if self.heap and self.heap[0][0] <= now + self.batch_window: 
+                        break
+                    self.condition.wait(self.heap[0][0] - now if self.heap else None)
+                batch = []
+                while self.heap and self.heap[0][0] <= now + self.batch_window: 
+                    entry = heapq.heappop(self.heap)[2]
+                    if entry[1] is not None: 
+                        batch.append(entry)
+
+            for entry in batch: 
+                pacing, session = entry
+                if session is None: 
+                    continue
+                error, skip = pacing.due(max(self.clock(), pacing.deadline))
+                self.stats.record(error, skip)
+                try: 
+                    session.sendFrame(skip)
+                except Exception as e: 
+                    log.warning("Pacing: send failed: %s", e)
+
+            with self.condition: 
+                for entry in batch: 
+                    if entry[1] is not None: 
+                        heapq.heappush(self.heap, (entry[0].deadline, next(self.counter), entry))
+
+# Process-wide scheduler used by the threaded ServerWorker.
+PACING_SCHEDULER = PacingScheduler()
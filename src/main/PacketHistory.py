@@ -0,0 +1,55 @@
+"""
+Purpose: 
+
+The PacketHistory keeps a session's recently sent RTP packets so that 
+packets the client reports lost (RTCP generic NACK) can be sent again. 
+It is a ring bounded by bytes rather than by packets: the oldest packets
+are dropped as soon as the stored packets exceed the budget, so memory 
+per session stays fixed however large the frames are. By the time a 
+packet falls out of the ring it is normally too old to be played anyway.
+
+A packet is resent at most once per holdoff interval, so a client that 
+repeats a NACK before the first retransmission could arrive does not get
+duplicates. 
+"""
+import threading
+from collections import OrderedDict
+
+DEFAULT_BUDGET = 1 << 20   # bytes of packets kept per session
+
+class PacketHistory: 
+
+    def __init__(self, budget: int = DEFAULT_BUDGET):
+        if budget <= 0: 
+            raise ValueError("history budget must be positive")
+        self.budget = budget
+        self.size = 0
+        self.packets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def add(self, seq_num: int, packet: bytes) -> None: 
+        """ Stores a sent packet (header and payload joined) under its sequence number."""
+        with self.lock: 
+            old = self.packets.pop(seq_num, None)
+            if old is not None: 
+                self.size -= len(old[0])
+            self.packets[seq_num] = [packet, None]
+            self.size += len(packet)
+            while self.size > self.budget and self.packets: 
+                self.size -= len(self.packets.popitem(last=False)[1][0])
+
+    def resend(self, seq_num: int, now: float, holdoff: float = 0.0) -> bytes: 
+        """ 
+            Returns the packet to send again, or None if it is no longer kept 
+            or was already resent less than holdoff seconds ago. 
+        """
+        with self.lock: 
+            entry = self.packets.get(seq_num)
+            if entry is None or (entry[1] is not None and now - entry[1] < holdoff): 
+                return None
+            entry[1] = now
+            return entry[0]
+
+    def __len__(self) -> int: 
+        with self.lock: 
+            return len(self.packets)
@@ -0,0 +1,304 @@
+"""
+Purpose:
+
+The Profiler shows where a server's time goes when it falls behind. It
+has three tools, all off by default:
+
+    - stage timers: one frame in every `every` is timed through the
+      send path, stage by stage (read, packetize, send, fec, record),
+      with both wall-clock and thread CPU time. Wall time well above CPU
+      time means waiting: for the GIL, a lock or the socket;
+    - a cProfile window: every thread that sends frames runs cProfile
+      for a fixed number of seconds, and the merged statistics are
+      returned as text. A thread can only stop its own profile, which
+      it does on its first frame after the window;
+    - a stack sampler: for a fixed window a thread samples the stacks
+      of all other threads and counts them as collapsed stacks, one line
+      per stack with the stage at the root, ready for flamegraph.pl or
+      speedscope.
+
+The hot path only pays for a check of PROFILER.enabled while profiling
+is off:
+
+    timer = PROFILER.timer(self) if PROFILER.enabled else None
+
+Profiling is switched on with ServerLauncher --profile, or at runtime
+through the metrics endpoint (see routes()).
+"""
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter as Tally
+from time import perf_counter, thread_time, monotonic
+
+from Metrics import Counter
+
+log = logging.getLogger(__name__)
+
+DEFAULT_EVERY = 16          # time one frame in every N
+DEFAULT_WINDOW = 5.0        # seconds of cProfile or stack sampling
+MAX_WINDOW = 60.0
+STACK_INTERVAL = 0.005      # seconds between stack samples
+REPORT_INTERVAL = 10.0      # seconds between stage reports in the log
+STAGES = ("read", "packetize", "send", "fec", "record")
+
+# Functions that identify a stage in a sampled stack, innermost first wins
+STAGE_FUNCTIONS = {
+    "nextFrame": "read", "skip": "read", "switchQuality": "read",
+    "packetize": "packetize", "packetize_hinted": "packetize", "makeRtp": "packetize", "encapsulate": "packetize",
+    "send_packet": "send", "sendRtp": "send", "resendRtp": "send",
+    "protect": "fec",
+    "recordSent": "record",
+}
+
+class StageTimer:
+    __slots__ = ("profiler", "session", "wall", "cpu", "samples")
+
+    def __init__(self, profiler, session):
+        self.profiler = profiler
+        self.session = session
+        self.samples = []
+        self.wall = perf_counter()
+        self.cpu = thread_time()
+
+    def mark(self, stage: str) -> None:
+        """ Ends stage: the time since the previous mark is charged to it."""
+        wall, cpu = perf_counter(), thread_time()
+        self.samples.append((stage, wall - self.wall, cpu - self.cpu))
+        self.wall, self.cpu = wall, cpu
+
+    def finish(self) -> None:
+        self.profiler.record(self.session, self.samples)
+
+class Profiler:
+
+    def __init__(self, every: int = DEFAULT_EVERY):
+        self.every = every
+        self.lock = threading.Lock()
+        # The one flag the hot path reads
+        self.enabled = False
+        self.timing = False
+        self.calls = 0
+        self.stats = {}
+        self.lastReport = monotonic()
+        # cProfile window: end time, and the profile of every thread taking part
+        self.windowEnd = None
+        self.profiles = {}
+        self.finished = []
+        # Profiles of threads that sent no frame after their window: each is still enabled
+        # until its own thread disables it (cProfile only can from there)
+        self.abandoned = {}
+
+    def update(self) -> None:
+        self.enabled = self.timing or self.windowEnd is not None or bool(self.abandoned)
+
+    def start(self, every: int = None) -> None:
+        """ Starts the stage timers."""
+        with self.lock:
+            if every:
+                self.every = max(1, every)
+            self.timing = True
+            self.update()
+        log.info("Profiling: timing 1 in %d frames", self.every)
+
+    def stop(self) -> None:
+        with self.lock:
+            self.timing = False
+            self.update()
+
+    def reset(self) -> None:
+        with self.lock:
+            self.stats = {}
+
+    def timer(self, session) -> StageTimer:
+        """
+            Called once per frame by the thread sending it, while enabled.
+            Returns a StageTimer if this frame is sampled, otherwise None.
+        """
+        if self.windowEnd is not None or self.abandoned:
+            self.profileThread()
+        if not self.timing:
+            return None
+        self.calls += 1
+        if self.calls % self.every:
+            return None
+        return StageTimer(self, session)
+
+    def record(self, session, samples) -> None:
+        key = str(getattr(session, 'clientInfo', {}).get('session', session))
+        with self.lock:
+            for stage, wall, cpu in samples:
+                entry = self.stats.get((key, stage))
+                if entry is None:
+                    entry = self.stats[(key, stage)] = [0, 0.0, 0.0, 0.0]
+                entry[0] += 1
+                entry[1] += wall
+                entry[2] += cpu
+                entry[3] = max(entry[3], wall)
+            report = monotonic() - self.lastReport >= REPORT_INTERVAL
+            if report:
+                self.lastReport = monotonic()
+        if report:
+            log.info("Profiling stages:\n%s", self.report(perSession=False))
+
+    def stageTotals(self) -> dict:
+        """ Returns {stage: [samples, wall, cpu, max wall]} summed over sessions."""
+        totals = {}
+        with self.lock:
+            for (_, stage), (count, wall, cpu, worst) in self.stats.items():
+                total = totals.setdefault(stage, [0, 0.0, 0.0, 0.0])
+                total[0] += count
+                total[1] += wall
+                total[2] += cpu
+                total[3] = max(total[3], worst)
+        return totals
+
+    def report(self, perSession: bool = True) -> str:
+        """ Returns the stage timings as a text table, in microseconds per sampled frame."""
+        lines = ["%-20s %-10s %8s %10s %10s %10s %10s" % ("session", "stage", "samples", "wall_us",
+                                                          "cpu_us", "wait_us", "max_us")]
+        rows = [("all", stage, total) for stage, total in self.stageTotals().items()]
+        if perSession:
+            with self.lock:
+                rows += [(session, stage, list(entry)) for (session, stage), entry in sorted(self.stats.items())]
+        order = {stage: index for index, stage in enumerate(STAGES)}
+        for session, stage, (count, wall, cpu, worst) in sorted(rows, key=lambda row: (row[0] != "all", row[0],
+                                                                                        order.get(row[1], 99))):
+            lines.append("%-20s %-10s %8d %10.1f %10.1f %10.1f %10.1f" % (session, stage, count,
+                         1e6 * wall / count, 1e6 * cpu / count, 1e6 * max(0.0, wall - cpu) / count, 1e6 * worst))
+        return "\n".join(lines) + "\n"
+
+    def metrics(self) -> list:
+        """ Collector for a MetricsRegistry: stage time summed over sessions."""
+        samples = Counter("profile_stage_samples_total", "Frames timed by the profiler, by stage", ("stage",))
+        seconds = Counter("profile_stage_seconds_total", "Time spent in a stage of the timed frames",
+                          ("stage", "clock"))
+        for stage, (count, wall, cpu, _) in self.stageTotals().items():
+            samples.values[(stage,)] = count
+            seconds.values[(stage, "wall")] = wall
+            seconds.values[(stage, "cpu")] = cpu
+        return [samples, seconds]
+
+    def profileThread(self) -> None:
+        """ Starts or ends this thread's part in the cProfile window."""
+        ident = threading.get_ident()
+        with self.lock:
+            abandoned = self.abandoned.pop(ident, None)
+            if abandoned is not None:
+                abandoned.disable()
+                self.update()
+            end = self.windowEnd
+            profile = self.profiles.get(ident)
+            if end is None:
+                return
+            if profile is None and monotonic() < end:
+                profile = self.profiles[ident] = cProfile.Profile()
+                profile.enable()
+            elif profile is not None and monotonic() >= end:
+                profile.disable()
+                self.finished.append(profile)
+                del self.profiles[ident]
+
+    def cprofile(self, seconds: float = DEFAULT_WINDOW, sortBy: str = "cumulative", limit: int = 40,
+                 path: str = None) -> str:
+        """
+            Runs cProfile in every frame-sending thread for seconds, then
+            returns the merged statistics (and saves them to path if given).
+        """
+        seconds = min(max(0.1, seconds), MAX_WINDOW)
+        with self.lock:
+            if self.windowEnd is not None:
+                return "a cProfile window is already running\n"
+            self.windowEnd = monotonic() + seconds
+            self.finished = []
+            self.update()
+        time.sleep(seconds)
+        # Threads end their part on their next frame after the window
+        deadline = monotonic() + 1.0
+        while self.profiles and monotonic() < deadline:
+            time.sleep(0.01)
+        with self.lock:
+            self.windowEnd = None
+            finished = self.finished
+            self.finished = []
+            abandoned = len(self.profiles)
+            self.abandoned.update(self.profiles)
+            self.profiles = {}
+            # A thread that has ended cannot profile anything any more
+            alive = {thread.ident for thread in threading.enumerate()}
+            self.abandoned = {ident: profile for ident, profile in self.abandoned.items() if ident in alive}
+            self.update()
+        if not finished:
+            return "no frames were sent during the window\n"
+        stream = io.StringIO()
+        stats = pstats.Stats(finished[0], stream=stream)
+        for profile in finished[1:]:
+            stats.add(profile)
+        if path:
+            stats.dump_stats(path)
+        stream.write("%d thread(s) profiled for %.1f s%s\n" % (len(finished), seconds,
+                     ", %d did not finish" % abandoned if abandoned else ""))
+        stats.sort_stats(sortBy).print_stats(limit)
+        return stream.getvalue()
+
+    def stacks(self, seconds: float = DEFAULT_WINDOW, interval: float = STACK_INTERVAL) -> str:
+        """ Samples the stacks of all other threads for seconds. Returns them collapsed."""
+        seconds = min(max(0.1, seconds), MAX_WINDOW)
+        me = threading.get_ident()
+        tally = Tally()
+        end = monotonic() + seconds
+        while monotonic() < end:
+            for ident, frame in sys._current_frames().items():
+                if ident != me:
+                    tally[collapse(frame)] += 1
+            time.sleep(interval)
+        return "".join("%s %d\n" % (stack, count) for stack, count in tally.most_common())
+
+    def routes(self) -> dict:
+        """ HTTP control routes for a MetricsServer: path -> handler(query) -> (content type, body)."""
+        text = "text/plain; charset=utf-8"
+
+        def seconds(query):
+            return float(query.get("seconds", DEFAULT_WINDOW))
+
+        def start(query):
+            self.start(int(query.get("every", 0)) or None)
+            return text, "profiling on, 1 in %d frames\n" % self.every
+
+        def stop(query):
+            self.stop()
+            return text, "profiling off\n"
+
+        def reset(query):
+            self.reset()
+            return text, "stage timings cleared\n"
+
+        return {
+            "/profile/start": start,
+            "/profile/stop": stop,
+            "/profile/reset": reset,
+            "/profile/stages": lambda query: (text, self.report()),
+            "/profile/cprofile": lambda query: (text, self.cprofile(seconds(query))),
+            "/profile/stacks": lambda query: (text, self.stacks(seconds(query))),
+        }
+
+def collapse(frame) -> str:
+    """ Returns frame's stack in collapsed form, outermost first, with its stage at the root."""
+    names = []
+    stage = "other"
+    while frame is not None:
+        code = frame.f_code
+        names.append("%s:%s" % (os.path.basename(code.co_filename), code.co_name))
+        if stage == "other" and code.co_name in STAGE_FUNCTIONS:
+            stage = STAGE_FUNCTIONS[code.co_name]
+        frame = frame.f_back
+    names.append(stage)
+    return ";".join(reversed(names))
+
+# One profiler per process
+PROFILER = Profiler()
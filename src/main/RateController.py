@@ -0,0 +1,125 @@
+"""
+Purpose: 
+
+The RateController adapts what the server sends to one session from the
+client's RTCP receiver reports. Without it a congested link keeps 
+dropping whole frames while the server keeps filling it at full rate. 
+
+Congestion is read from two signals: 
+    - the loss fraction of each receiver report, and 
+    - the delay trend: the smoothed round-trip time rising well above 
+      the lowest RTT seen, i.e. queues building up along the path. 
+
+The controller walks a ladder of steps, each a (thinning, quality) 
+pair. It first thins frames (send every 2nd, then every 4th frame...) 
+and, once thinning is at its limit, switches to lower-quality JPEG 
+variants of the file. On congestion it steps down at once (at most one 
+step per report interval, so the effect of a step can show first); after
+a run of good reports it steps back up, quality first. Every change is 
+logged with the numbers that caused it, for tuning. 
+
+Reports arrive on the RTCP thread while the sending thread reads the 
+current step, so the ladder and step are only touched under the 
+controller's lock. 
+"""
+import logging
+import threading
+from collections import deque
+
+DEFAULT_MAX_THINNING = 4       # send at least every 4th frame
+LOSS_HIGH = 0.10               # loss fraction that means congestion
+LOSS_LOW = 0.02                # loss fraction below which a report is good
+DELAY_RISE = 0.05              # seconds of smoothed RTT above the minimum that means queuing
+UP_HOLDOFF = 3                 # good reports in a row before stepping up
+DOWN_HOLDOFF = 1               # reports to wait after a change before stepping down again
+RTT_GAIN = 0.25
+
+class RateController: 
+
+    def __init__(self, qualityLevels: int = 1, maxThinning: int = DEFAULT_MAX_THINNING, 
+                 lossHigh: float = LOSS_HIGH, lossLow: float = LOSS_LOW, delayRise: float = DELAY_RISE, 
+                 upHoldoff: int = UP_HOLDOFF, downHoldoff: int = DOWN_HOLDOFF, name: str = "", log=None):
+        self.ladder = []
+        thinning = 1
+        while thinning <= maxThinning: 
+            self.ladder.append((thinning, 0))
+            thinning *= 2
+        for quality in range(1, qualityLevels): 
+            self.ladder.append((self.ladder[-1][0], quality))
+        self.lossHigh = lossHigh
+        self.lossLow = lossLow
+        self.delayRise = delayRise
+        self.upHoldoff = upHoldoff
+        self.downHoldoff = downHoldoff
+        self.name = name
+        self.log = log or logging.getLogger(__name__).info
+        self.lock = threading.RLock()
+        self.step = 0
+        self.goodReports = 0
+        self.sinceChange = downHoldoff
+        self.srtt = None
+        self.minRtt = None
+        self.decisions = deque(maxlen=100)
+
+    @property
+    def thinning(self) -> int: 
+        with self.lock: 
+            return self.ladder[self.step][0]
+
+    @property
+    def quality(self) -> int: 
+        """ 0 is the original file, higher levels are lower-quality variants."""
+        with self.lock: 
+            return self.ladder[self.step][1]
+
+    def dropQualities(self, quality: int) -> None: 
+        """ Removes quality levels from quality on, e.g. when their variant cannot be opened."""
+        with self.lock: 
+            self.ladder = [step for step in self.ladder if step[1] < quality]
+            self.step = min(self.step, len(self.ladder) - 1)
+
+    def wantsFrame(self, offered: int) -> bool: 
+        """ Returns true if the offered-th frame read for the session should be sent at the current thinning."""
+        return offered % self.thinning == 0
+
+    def delayRising(self, rtt: float) -> bool: 
+        if rtt is None: 
+            return False
+        self.minRtt = rtt if self.minRtt is None else min(self.minRtt, rtt)
+        previous = self.srtt
+        self.srtt = rtt if previous is None else previous + RTT_GAIN * (rtt - previous)
+        return previous is not None and self.srtt > previous and self.srtt - self.minRtt > self.delayRise
+
+    def update(self, fractionLost: float, rtt: float = None, now: float = None) -> bool: 
+        """ 
+            Feeds one receiver report (loss fraction 0..1, RTT in seconds or
+            None). Returns true if the step changed. 
+        """
+        with self.lock: 
+            rising = self.delayRising(rtt)
+            self.sinceChange += 1
+            if fractionLost >= self.lossHigh or rising: 
+                self.goodReports = 0
+                if self.step + 1 < len(self.ladder) and self.sinceChange > self.downHoldoff: 
+                    reason = "loss" if fractionLost >= self.lossHigh else "delay"
+                    return self.change(self.step + 1, reason, fractionLost, rtt, now)
+            elif fractionLost <= self.lossLow: 
+                self.goodReports += 1
+                if self.step > 0 and self.goodReports >= self.upHoldoff: 
+                    self.goodReports = 0
+                    return self.change(self.step - 1, "recovered", fractionLost, rtt, now)
+            else: 
+                self.goodReports = 0
+            return False
+
+    def change(self, step: int, reason: str, fractionLost: float, rtt: float, now: float) -> bool: 
+        self.step = step
+        self.sinceChange = 0
+        decision = (now, reason, fractionLost, rtt, self.thinning, self.quality)
+        self.decisions.append(decision)
+        if self.log is not None: 
+            self.log("Rate %s: %s (loss %.1f%%, rtt %s) -> 1 in %d frames, quality level %d" 
+                     % (self.name, reason, fractionLost * 100, 
+                        "%.0f ms" % (rtt * 1000) if rtt is not None else "n/a", 
+                        self.thinning, self.quality))
+        return True
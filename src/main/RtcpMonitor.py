@@ -0,0 +1,64 @@
+"""
+Purpose: 
+
+The RtcpMonitor receives RTCP on behalf of every threaded ServerWorker
+session. Each session binds its own RTCP socket at SETUP and registers it
+here; one daemon thread waits on all of them with a selector and hands 
+each datagram to the owning session's receiveRtcp(). This keeps RTCP off
+the RTSP threads and avoids a thread per session just to read receiver 
+reports. 
+"""
+import logging
+import selectors
+import threading
+from time import sleep
+
+log = logging.getLogger(__name__)
+
+RTCP_RECV_SIZE = 2048
+POLL_TIMEOUT = 0.5
+
+class RtcpMonitor: 
+
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def register(self, sock, session) -> None: 
+        """ Delivers datagrams arriving on sock to session.receiveRtcp(data, address)."""
+        with self.lock: 
+            if self.thread is None: 
+                self.thread = threading.Thread(target=self.run, name="RtcpMonitor", daemon=True)
+                self.thread.start()
+            self.selector.register(sock, selectors.EVENT_READ, session)
+
+    def unregister(self, sock) -> None: 
+        with self.lock: 
+            try: 
+                self.selector.unregister(sock)
+            except (KeyError, ValueError): 
+                pass
+
+    def __len__(self) -> int: 
+        with self.lock: 
+            return len(self.selector.get_map())
+
+    def run(self) -> None: 
+        while True: 
+            if not len(self): 
+                # Some selectors refuse to wait on an empty set
+                sleep(POLL_TIMEOUT)
+                continue
+            for key, _ in self.selector.select(POLL_TIMEOUT): 
+                try: 
+                    data, address = key.fileobj.recvfrom(RTCP_RECV_SIZE)
+                except OSError: 
+                    continue
+                try: 
+                    key.data.receiveRtcp(data, address)
+                except Exception as e: 
+                    log.warning("RTCP: bad packet from %s: %s", address, e)
+
+# Process-wide monitor used by the threaded ServerWorker.
+RTCP_MONITOR = RtcpMonitor()
@@ -0,0 +1,213 @@
+"""
+Purpose: 
+
+RtcpPacket packs and parses the RTCP packets (RFC 3550 section 6) that 
+travel next to the RTP stream, one port above it. The server sends a 
+Sender Report (SR) about once a second, mapping its RTP timestamps to 
+wall-clock time and counting what it sent. The client answers with 
+Receiver Reports (RR) carrying one report block per source: 
+
+ 0                   1                   2                   3
+ 0 1 2 3 4 5 6 7 8 9 0 1 2 3 4 5 6 7 8 9 0 1 2 3 4 5 6 7 8 9 0 1
++-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
+|                 SSRC of the source reported on                |
++-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
+| fraction lost |       cumulative number of packets lost       |
++-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
+|           extended highest sequence number received           |
++-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
+|                      interarrival jitter                      |
++-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
+|                         last SR (LSR)                         |
++-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
+|                   delay since last SR (DLSR)                  |
++-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
+
+LSR is the middle 32 bits of the NTP timestamp of the last SR received 
+and DLSR the time since then in 1/65536 s, which lets the sender compute
+the round-trip time. 
+
+To ask for retransmissions the client sends a generic NACK (RFC 4585, 
+PT 205 FMT 1). Each FCI entry names a lost packet ID (PID) and a bitmask
+of lost packets following it (BLP). The NACK is followed by an APP 
+packet named NACK_DEADLINE carrying the milliseconds left until the 
+packets would be played out, so the server resends only what can still
+arrive in time. parse_rtcp() accepts compound and reduced-size packets 
+and skips packet types it does not know. 
+"""
+import struct
+from collections import namedtuple
+from time import time
+
+RTCP_VERSION = 2
+SR = 200
+RR = 201
+APP = 204
+RTPFB = 205
+GENERIC_NACK = 1               # RTPFB feedback message type
+NACK_DEADLINE = b"NKDL"        # APP name of the retransmission deadline
+FEEDBACK_HEADER_NAME = "X-RTCP-FB"   # RTSP header offering/accepting NACK at SETUP
+FEEDBACK_NACK = "nack"
+RTCP_INTERVAL = 1.0            # seconds between reports
+NTP_EPOCH_OFFSET = 2208988800  # seconds from 1900-01-01 to 1970-01-01
+
+RTCP_HEADER = struct.Struct("!BBHI")             # V|P|RC, PT, length, sender SSRC
+SENDER_INFO = struct.Struct("!IIIII")            # NTP sec, NTP frac, RTP timestamp, packets, octets
+REPORT_BLOCK = struct.Struct("!IIIIII")
+NACK_FCI = struct.Struct("!HH")                  # PID, BLP
+DEADLINE = struct.Struct("!I")                   # milliseconds
+SSRC = struct.Struct("!I")
+MAX_REPORT_BLOCKS = 31
+
+SenderReport = namedtuple("SenderReport", "ssrc ntp_sec ntp_frac rtp_timestamp packets octets reports")
+ReceiverReport = namedtuple("ReceiverReport", "ssrc reports")
+ReportBlock = namedtuple("ReportBlock", "ssrc fraction_lost cumulative_lost highest_seq jitter lsr dlsr")
+GenericNack = namedtuple("GenericNack", "ssrc media_ssrc lost")
+AppPacket = namedtuple("AppPacket", "ssrc subtype name data")
+
+def ntp_timestamp(t: float = None) -> tuple: 
+    """ Returns the 64-bit NTP timestamp of Unix time t as (seconds, fraction)."""
+    if t is None: 
+        t = time()
+    seconds = int(t)
+    fraction = int((t - seconds) * (1 << 32)) & 0xFFFFFFFF
+    return (seconds + NTP_EPOCH_OFFSET) & 0xFFFFFFFF, fraction
+
+def ntp_middle(seconds: int, fraction: int) -> int: 
+    """ Returns the middle 32 bits of an NTP timestamp, as used by LSR."""
+    return (seconds & 0xFFFF) << 16 | fraction >> 16
+
+def pack_common_header(buffer, packet_type: int, count: int, ssrc: int, size: int) -> None: 
+    """ Writes the RTCP header and sender SSRC of a packet of size bytes."""
+    RTCP_HEADER.pack_into(buffer, 0, RTCP_VERSION << 6 | count, packet_type, size // 4 - 1, ssrc)
+
+def pack_report_blocks(buffer, offset: int, reports) -> None: 
+    for block in reports: 
+        lost = block.cumulative_lost
+        # Cumulative loss is a signed 24-bit field (duplicates can make it negative)
+        lost = max(-0x800000, min(0x7FFFFF, lost)) & 0xFFFFFF
+        REPORT_BLOCK.pack_into(buffer, offset, block.ssrc, block.fraction_lost << 24 | lost, 
+                               block.highest_seq & 0xFFFFFFFF, int(block.jitter) & 0xFFFFFFFF, 
+                               block.lsr, block.dlsr)
+        offset += REPORT_BLOCK.size
+
+def pack_sender_report(ssrc: int, t: float, rtp_timestamp: int, packets: int, octets: int, 
+                       reports=()) -> bytes: 
+    """ Returns an SR for wall-clock time t and the RTP timestamp matching it."""
+    reports = list(reports)[:MAX_REPORT_BLOCKS]
+    size = RTCP_HEADER.size + SENDER_INFO.size + REPORT_BLOCK.size * len(reports)
+    buffer = bytearray(size)
+    pack_common_header(buffer, SR, len(reports), ssrc, size)
+    seconds, fraction = ntp_timestamp(t)
+    SENDER_INFO.pack_into(buffer, RTCP_HEADER.size, seconds, fraction, rtp_timestamp & 0xFFFFFFFF, 
+                          packets & 0xFFFFFFFF, octets & 0xFFFFFFFF)
+    pack_report_blocks(buffer, RTCP_HEADER.size + SENDER_INFO.size, reports)
+    return bytes(buffer)
+
+def pack_receiver_report(ssrc: int, reports=()) -> bytes: 
+    """ Returns an RR from ssrc carrying the given ReportBlocks."""
+    reports = list(reports)[:MAX_REPORT_BLOCKS]
+    size = RTCP_HEADER.size + REPORT_BLOCK.size * len(reports)
+    buffer = bytearray(size)
+    pack_common_header(buffer, RR, len(reports), ssrc, size)
+    pack_report_blocks(buffer, RTCP_HEADER.size, reports)
+    return bytes(buffer)
+
+def pack_generic_nack(ssrc: int, media_ssrc: int, lost) -> bytes: 
+    """ Returns a generic NACK from ssrc for the lost sequence numbers of media_ssrc."""
+    entries = []
+    for seq in sorted(set(lost), key=lambda seq: (seq - min(lost)) & 0xFFFF): 
+        if entries and 0 < (seq - entries[-1][0]) & 0xFFFF <= 16: 
+            entries[-1][1] |= 1 << (((seq - entries[-1][0]) & 0xFFFF) - 1)
+        else: 
+            entries.append([seq & 0xFFFF, 0])
+    size = RTCP_HEADER.size + 4 + NACK_FCI.size * len(entries)
+    buffer = bytearray(size)
+    pack_common_header(buffer, RTPFB, GENERIC_NACK, ssrc, size)
+    SSRC.pack_into(buffer, RTCP_HEADER.size, media_ssrc)
+    for i, (pid, blp) in enumerate(entries): 
+        NACK_FCI.pack_into(buffer, RTCP_HEADER.size + 4 + i * NACK_FCI.size, pid, blp)
+    return bytes(buffer)
+
+def pack_app(ssrc: int, name: bytes, data: bytes = b"", subtype: int = 0) -> bytes: 
+    """ Returns an APP packet; data is padded to a multiple of four bytes."""
+    if len(name) != 4: 
+        raise ValueError("APP name must be four ASCII characters")
+    data = data + bytes(-len(data) % 4)
+    size = RTCP_HEADER.size + 4 + len(data)
+    buffer = bytearray(size)
+    pack_common_header(buffer, APP, subtype, ssrc, size)
+    buffer[RTCP_HEADER.size:] = name + data
+    return bytes(buffer)
+
+def pack_nack_request(ssrc: int, media_ssrc: int, lost, deadline: float) -> bytes: 
+    """ Returns a NACK for lost followed by its deadline (seconds from now)."""
+    return (pack_generic_nack(ssrc, media_ssrc, lost) + 
+            pack_app(ssrc, NACK_DEADLINE, DEADLINE.pack(max(0, int(deadline * 1000)))))
+
+def nack_deadline(packets) -> float: 
+    """ Returns the deadline (seconds) sent with a NACK in a compound packet, or None."""
+    for packet in packets: 
+        if isinstance(packet, AppPacket) and packet.name == NACK_DEADLINE and len(packet.data) >= 4: 
+            return DEADLINE.unpack_from(packet.data)[0] / 1000
+    return None
+
+def parse_report_blocks(data, offset: int, count: int) -> list: 
+    reports = []
+    for i in range(count): 
+        ssrc, lost, highest, jitter, lsr, dlsr = REPORT_BLOCK.unpack_from(data, offset + i * REPORT_BLOCK.size)
+        cumulative = lost & 0xFFFFFF
+        if cumulative & 0x800000: 
+            cumulative -= 0x1000000
+        reports.append(ReportBlock(ssrc, lost >> 24, cumulative, highest, jitter, lsr, dlsr))
+    return reports
+
+def parse_rtcp(data) -> list: 
+    """ 
+        Returns the SenderReports and ReceiverReports of a (compound) RTCP
+        packet. Raises ValueError if the packet is malformed. 
+    """
+    packets = []
+    offset = 0
+    while offset < len(data): 
+        if len(data) - offset < 4: 
+            raise ValueError("truncated RTCP header")
+        first, packet_type, length = struct.unpack_from("!BBH", data, offset)
+        if first >> 6 != RTCP_VERSION: 
+            raise ValueError("RTCP version %d" % (first >> 6))
+        count = first & 0x1F
+        end = offset + (length + 1) * 4
+        if end > len(data): 
+            raise ValueError("RTCP packet longer than the datagram")
+
+        if packet_type == SR: 
+            if end - offset < RTCP_HEADER.size + SENDER_INFO.size + count * REPORT_BLOCK.size: 
+                raise ValueError("truncated SR")
+            ssrc = RTCP_HEADER.unpack_from(data, offset)[3]
+            info = SENDER_INFO.unpack_from(data, offset + RTCP_HEADER.size)
+            reports = parse_report_blocks(data, offset + RTCP_HEADER.size + SENDER_INFO.size, count)
+            packets.append(SenderReport(ssrc, *info, reports))
+        elif packet_type == RR: 
+            if end - offset < RTCP_HEADER.size + count * REPORT_BLOCK.size: 
+                raise ValueError("truncated RR")
+            ssrc = RTCP_HEADER.unpack_from(data, offset)[3]
+            packets.append(ReceiverReport(ssrc, parse_report_blocks(data, offset + RTCP_HEADER.size, count)))
+        elif packet_type == RTPFB and count == GENERIC_NACK: 
+            if end - offset < RTCP_HEADER.size + 4: 
+                raise ValueError("truncated NACK")
+            ssrc = RTCP_HEADER.unpack_from(data, offset)[3]
+            media_ssrc = SSRC.unpack_from(data, offset + RTCP_HEADER.size)[0]
+            lost = []
+            for position in range(offset + RTCP_HEADER.size + 4, end, NACK_FCI.size): 
+                pid, blp = NACK_FCI.unpack_from(data, position)
+                lost.append(pid)
+                lost.extend((pid + bit + 1) & 0xFFFF for bit in range(16) if blp >> bit & 1)
+            packets.append(GenericNack(ssrc, media_ssrc, lost))
+        elif packet_type == APP: 
+            if end - offset < RTCP_HEADER.size + 4: 
+                raise ValueError("truncated APP")
+            ssrc = RTCP_HEADER.unpack_from(data, offset)[3]
+            name = bytes(data[offset + RTCP_HEADER.size:offset + RTCP_HEADER.size + 4])
+            packets.append(AppPacket(ssrc, count, name, bytes(data[offset + RTCP_HEADER.size + 4:end])))
+        offset = end
+    return packets
@@ -18,11 +18,12 @@ whereas, it provides the client app access to the contents of the packet
 via methods such as decode() and the numerous get methods. 
 """
 from time import time 
-from bitstring import * 
+import struct
 from IRtpPacket import IRtpPacket
 
 BYTE_SIZE = 8
 HEADER_SIZE = 12 
+CLOCK_RATE = 90000      # RTP media clock for MJPEG (RFC 2435)
 MAX_LENGTHS = {
     "version" : 2,
     "padding" : 1,
@@ -35,50 +36,68 @@ MAX_LENGTHS = {
     "timestamp" : 32
 }
 
+# Byte 0 (V|P|X|CC), byte 1 (M|PT), sequence number, timestamp, SSRC.
+HEADER_STRUCT = struct.Struct("!BBHII")
+
+# Exclusive upper bound of every field, derived from MAX_LENGTHS.
+FIELD_LIMITS = {name: 1 << bits for name, bits in MAX_LENGTHS.items()}
+
+def check_field(name: str, value: int) -> None:
+    """
+        Raises ValueError if value does not fit in the bit length given
+        for the field in MAX_LENGTHS.
+    """
+    if not 0 <= value < FIELD_LIMITS[name]:
+        raise ValueError("%s=%r does not fit in %d bits" 
+                         % (name, value, MAX_LENGTHS[name]))
+
+def pack_header(buffer, offset: int, version: int, padding: int, 
+                extension: int, contr_sources: int, marker: int, 
+                payload_type: int, seq_num: int, timestamp: int, 
+                sync_source_id: int) -> None:
+    """
+        Writes the 12-byte fixed RTP header into buffer (any writable 
+        bytes-like object) starting at offset. Every field is range checked
+        against MAX_LENGTHS first. 
+    """
+    check_field("version", version)
+    check_field("padding", padding)
+    check_field("extension", extension)
+    check_field("contr_sources", contr_sources)
+    check_field("marker", marker)
+    check_field("payload_type", payload_type)
+    check_field("seq_num", seq_num)
+    check_field("timestamp", timestamp)
+    check_field("sync_source_id", sync_source_id)
+
+    HEADER_STRUCT.pack_into(buffer, offset,
+                            version << 6 | padding << 5 | extension << 4 | contr_sources,
+                            marker << 7 | payload_type,
+                            seq_num, timestamp, sync_source_id)
+
 class RtpPacket(IRtpPacket): 
 
+    header = None
+
 ################ Public methods #####################################
     def encapsulate(self, version: int, padding: int, extension: int, 
                     contr_sources: int, marker: int, payload_type: int, 
-                seq_num: int, sync_source_id: int, payload) -> None:
-        """For the inputs, apply them to the RTP packet fields.""" 
-        
-        self.timestamp = int(time()) 
-        self.header = bytearray(HEADER_SIZE)
+                seq_num: int, sync_source_id: int, payload, timestamp: int = None) -> None:
+        """
+            For the inputs, apply them to the RTP packet fields. Without a 
+            timestamp the packet is stamped with the wall clock in 90 kHz units.
+        """ 
+        if timestamp is None: 
+            timestamp = int(time() * CLOCK_RATE) & 0xFFFFFFFF
+        self.timestamp = timestamp
         self.payload = payload
 
-        # 1.CONVERT ALL INPUT TO BINARY OF NEEDED LENGTHS
-        version_bin = self.__convert_uint_to_binary(version, MAX_LENGTHS["version"])
-        padding_bin = self.__convert_uint_to_binary(padding, MAX_LENGTHS["padding"])
-        extension_bin = self.__convert_uint_to_binary(extension, MAX_LENGTHS["extension"])
-        contr_sources_bin = self.__convert_uint_to_binary(contr_sources, MAX_LENGTHS["contr_sources"])
-        marker_bin = self.__convert_uint_to_binary(marker, MAX_LENGTHS["marker"])
-        payload_type_bin = self.__convert_uint_to_binary(payload_type, MAX_LENGTHS["payload_type"]) 
-        seq_num_bin = self.__convert_uint_to_binary(seq_num, MAX_LENGTHS["seq_num"]) 
-        sync_source_id_bin = self.__convert_uint_to_binary(sync_source_id, MAX_LENGTHS["sync_source_id"])
-        timestamp_bin = self.__convert_uint_to_binary(self.timestamp, MAX_LENGTHS["timestamp"])
-
-        # 2.CREATE THE NEEDED BYTESTRINGS for the 12 bytes header
-        byte_string_0 = self.__build_bytestring([version_bin, padding_bin, extension_bin, contr_sources_bin])
-        byte_string_1 = self.__build_bytestring([marker_bin, payload_type_bin]) 
-        byte_string_2_3 = self.__build_bytestring([seq_num_bin]) 
-        
-        byte_string_4_5_6_7 = self.__build_bytestring([timestamp_bin]) 
-        byte_string_8_9_10_11 = self.__build_bytestring([sync_source_id_bin])
-
-        # 3. CONVERT EACH OF THE BYTSTRINGS ABOVE INTO A UINT and insert them into the associated byte in the header byterarray
-        self.header[0] = self.__convert_to_unsigned_num(byte_string_0)
-        self.header[1] = self.__convert_to_unsigned_num(byte_string_1)
-        self.header[2] = self.__convert_to_unsigned_num(byte_string_2_3[0:8])
-        self.header[3] = self.__convert_to_unsigned_num(byte_string_2_3[8:])
-        self.header[4] = self.__convert_to_unsigned_num(byte_string_4_5_6_7[0:8])
-        self.header[5] = self.__convert_to_unsigned_num(byte_string_4_5_6_7[8:16])
-        self.header[6] = self.__convert_to_unsigned_num(byte_string_4_5_6_7[16:24])
-        self.header[7] = self.__convert_to_unsigned_num(byte_string_4_5_6_7[24:32])
-        self.header[8] = self.__convert_to_unsigned_num(byte_string_8_9_10_11[0:8])
-        self.header[9] = self.__convert_to_unsigned_num(byte_string_8_9_10_11[8:16])
-        self.header[10] = self.__convert_to_unsigned_num(byte_string_8_9_10_11[16:24])
-        self.header[11] = self.__convert_to_unsigned_num(byte_string_8_9_10_11[24:32])
+        # Pack the fields straight into the header buffer. The buffer is
+        # reused across calls so a long-lived packet object never reallocates.
+        if self.header is None or len(self.header) != HEADER_SIZE:
+            self.header = bytearray(HEADER_SIZE)
+        pack_header(self.header, 0, version, padding, extension, contr_sources,
+                    marker, payload_type, seq_num, self.timestamp, sync_source_id)
 
     def decode(self, byteStream: bytes) -> None: 
         """ For use by the client to de-packetize the data"""
@@ -88,6 +107,10 @@ class RtpPacket(IRtpPacket):
     def get_version(self) -> int: 
         return int(self.header[0] >> 6) 
 
+    def get_marker(self) -> int: 
+        """ Returns the marker bit (set on the last fragment of a frame)."""
+        return int(self.header[1] >> 7)
+
     def get_seq_num(self) -> int: 
         """ Returns the rtp packet sequence number (frame number)."""
         seqNum = self.header[2] << 8 | self.header[3]
@@ -99,6 +122,10 @@ class RtpPacket(IRtpPacket):
                     self.header[6] << 8 | self.header[7])
         return int(timestamp) 
 
+    def get_ssrc(self) -> int: 
+        """ Returns the synchronization source identifier of the stream."""
+        return int.from_bytes(self.header[8:12], "big")
+
     def get_payload_type(self) -> int: 
         pt = self.header[1] & 127
         return int(pt)       
@@ -111,29 +138,14 @@ class RtpPacket(IRtpPacket):
         """ Returns the contents (header + payload) of the packet itself"""
         return self.header + self.payload 
 
-    ################## Private methods ####################################
-    def __convert_to_unsigned_num(self, bytestring:str): 
-        """
-            Returns an uint representing the given bytestring.
-        """
-        return BitArray(bin=bytestring).uint
-
-    def __build_bytestring(self, bitstrings: list): 
-        """
-            Returns a string of 8 bits by concatenating the elements in the
-            given bitstring. 
-        """
-        string = ""
-        for bitstring in bitstrings: 
-            string = string + bitstring 
-        return string     
-
-    def __convert_uint_to_binary(self, num: int, length: int) -> str: 
-        """
-            returns a bitstring representing a given number and its length. 
+    def get_buffers(self) -> tuple: 
+        """ 
+            Returns (header, payload) without joining them, for vectored 
+            sends such as socket.sendmsg(). 
         """
-        return BitArray(uint=num, length=length).bin
+        return self.header, self.payload
 
+    ################## Private methods ####################################
     def __byte_index(self, bit_index: int) -> int: 
         """ Returns the computed byte_index based on the desired bit index
             (chooses the byte). 
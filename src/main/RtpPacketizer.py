@@ -0,0 +1,161 @@
+"""
+Purpose: 
+
+The RtpPacketizer splits one MJPEG frame into MTU-sized RTP packets in 
+the style of RFC 2435, so that frames larger than a single datagram are
+no longer truncated by the receiver or left to IP fragmentation. 
+
+Every packet carries the 12-byte RTP header followed by an 8-byte JPEG
+header:
+
+ 0                   1                   2                   3
+ 0 1 2 3 4 5 6 7 8 9 0 1 2 3 4 5 6 7 8 9 0 1 2 3 4 5 6 7 8 9 0 1
++-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
+| Type-specific |              Fragment Offset                  |
++-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
+|      Type     |       Q       |     Width     |     Height    |
++-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
+
+All fragments of a frame share one RTP timestamp, the fragment offset is
+the byte offset of the fragment within the frame, and the marker bit is 
+set on the last fragment only. Unlike RFC 2435 the payload is the whole
+JFIF image (tables included), so Type, Q, Width and Height are left zero.
+FrameReassembler is the client-side counterpart. 
+
+Packets are never built as one contiguous buffer. packetize() returns
+(header, fragment) pairs: the 20 bytes of RTP and JPEG header come from a
+pool of preallocated buffers that is reused for every frame, and the 
+fragment is a memoryview into the frame (or the frame store's mapping). 
+send_packet() hands both to the kernel with one vectored sendmsg(), so 
+the payload is never copied in user space. 
+
+packetize_hinted() does the same from a HintTrack, which has every 
+header built in advance: a frame's headers are copied in one go and 
+only the sequence number, timestamp and SSRC of each are filled in. 
+"""
+import random
+import socket
+import struct
+
+from RtpPacket import HEADER_SIZE, CLOCK_RATE, pack_header
+
+MTU = 1400              # bytes of UDP payload allowed per datagram
+MJPEG_PT = 26
+JPEG_HEADER = struct.Struct("!I4B")
+SEQ_NUM_FIELD = struct.Struct("!H")     # bytes 2-3 of the RTP header
+TIMESTAMP_FIELD = struct.Struct("!I")   # bytes 4-7 of the RTP header
+SSRC_FIELD = struct.Struct("!I")        # bytes 8-11 of the RTP header
+SESSION_FIELDS = struct.Struct("!HII")  # bytes 2-11: sequence number, timestamp and SSRC
+JPEG_HEADER_SIZE = JPEG_HEADER.size
+MAX_FRAGMENT_OFFSET = (1 << 24) - 1
+PACKET_HEADER_SIZE = HEADER_SIZE + JPEG_HEADER_SIZE
+
+class RtpPacketizer: 
+
+    def __init__(self, ssrc: int = 0, seq_num: int = 0, mtu: int = MTU, timestamp_offset: int = 0):
+        if mtu <= HEADER_SIZE + JPEG_HEADER_SIZE:
+            raise ValueError("mtu must leave room for the RTP and JPEG headers")
+        self.ssrc = ssrc
+        self.seq_num = seq_num & 0xFFFF
+        self.timestamp_offset = timestamp_offset & 0xFFFFFFFF
+        self.mtu = mtu
+        self.fragment_size = mtu - PACKET_HEADER_SIZE
+        self.headers = []
+        # Headers of hinted frames, one PACKET_HEADER_SIZE slot per packet
+        self.hinted = bytearray()
+        self.hintedView = memoryview(self.hinted)
+
+    @classmethod
+    def for_session(cls, mtu: int = MTU): 
+        """ 
+            Returns a packetizer with a random SSRC, initial sequence number
+            and timestamp offset, as RFC 3550 asks of every new stream. 
+        """
+        rng = random.SystemRandom()
+        return cls(rng.getrandbits(32), rng.getrandbits(16), mtu, rng.getrandbits(32))
+
+    def packetize(self, frame, timestamp: int) -> list: 
+        """
+            Returns the (header, fragment) pairs of one frame. Sequence 
+            numbers continue from the previous call and wrap at 16 bits, 
+            and the packetizer's timestamp offset is added to timestamp. 
+            The header buffers are reused by the next call, so the packets
+            must be sent before packetizing another frame. 
+        """
+        if len(frame) > MAX_FRAGMENT_OFFSET: 
+            raise ValueError("frame of %d bytes exceeds the 24-bit fragment offset" % len(frame))
+
+        view = frame if isinstance(frame, memoryview) else memoryview(frame)
+        timestamp = (timestamp + self.timestamp_offset) & 0xFFFFFFFF
+        packets = []
+        offset = 0
+        size = len(view)
+        while True: 
+            fragment = view[offset:offset + self.fragment_size]
+            last = offset + len(fragment) >= size
+            if len(packets) == len(self.headers): 
+                self.headers.append(bytearray(PACKET_HEADER_SIZE))
+            header = self.headers[len(packets)]
+            pack_header(header, 0, 2, 0, 0, 0, int(last), MJPEG_PT, 
+                        self.seq_num, timestamp, self.ssrc)
+            JPEG_HEADER.pack_into(header, HEADER_SIZE, offset, 0, 0, 0, 0)
+            packets.append((header, fragment))
+
+            self.seq_num = (self.seq_num + 1) & 0xFFFF
+            offset += len(fragment)
+            if last: 
+                return packets
+
+    def packetize_hinted(self, templates, fragments: list, timestamp: int) -> list: 
+        """
+            Like packetize(), for a frame whose packet headers (templates, 
+            PACKET_HEADER_SIZE bytes each) and fragments were prepared by a
+            HintTrack. The header buffer is reused by the next call as well.
+        """
+        size = len(templates)
+        if len(self.hinted) < size: 
+            self.hintedView.release()
+            self.hinted = bytearray(size)
+            self.hintedView = memoryview(self.hinted)
+        headers, view = self.hinted, self.hintedView
+        headers[:size] = templates
+        timestamp = (timestamp + self.timestamp_offset) & 0xFFFFFFFF
+        seq_num, ssrc = self.seq_num, self.ssrc
+        packets = []
+        start = 0
+        for fragment in fragments: 
+            SESSION_FIELDS.pack_into(headers, start + 2, seq_num, timestamp, ssrc)
+            packets.append((view[start:start + PACKET_HEADER_SIZE], fragment))
+            seq_num = (seq_num + 1) & 0xFFFF
+            start += PACKET_HEADER_SIZE
+        self.seq_num = seq_num
+        return packets
+
+def patch_header(header, seq_num: int, ssrc: int, timestamp: int = None) -> None: 
+    """ Rewrites the sequence number, SSRC and optionally timestamp of a packed RTP header."""
+    SEQ_NUM_FIELD.pack_into(header, 2, seq_num & 0xFFFF)
+    if timestamp is not None: 
+        TIMESTAMP_FIELD.pack_into(header, 4, timestamp & 0xFFFFFFFF)
+    SSRC_FIELD.pack_into(header, 8, ssrc)
+
+def header_timestamp(header) -> int: 
+    """ Returns the timestamp of a packed RTP header."""
+    return TIMESTAMP_FIELD.unpack_from(header, 4)[0]
+
+def parse_jpeg_header(payload) -> tuple: 
+    """
+        Splits an RTP payload into (fragment_offset, fragment_bytes). 
+    """
+    if len(payload) < JPEG_HEADER_SIZE: 
+        raise ValueError("payload shorter than the JPEG header")
+    type_offset = JPEG_HEADER.unpack_from(payload, 0)[0]
+    return type_offset & MAX_FRAGMENT_OFFSET, payload[JPEG_HEADER_SIZE:]
+
+if hasattr(socket.socket, "sendmsg"): 
+    def send_packet(sock, header, payload, address) -> None: 
+        """ Sends header and payload as one datagram without joining them."""
+        sock.sendmsg((header, payload), (), 0, address)
+else: 
+    def send_packet(sock, header, payload, address) -> None: 
+        """ Sends header and payload as one datagram (no sendmsg on this platform)."""
+        sock.sendto(bytes(header) + bytes(payload), address)
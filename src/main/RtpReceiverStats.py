@@ -0,0 +1,117 @@
+"""
+Purpose: 
+
+RtpReceiverStats keeps the receiver-side statistics of one RTP source 
+that go into an RTCP receiver report, following RFC 3550 appendix A: 
+
+    - the extended highest sequence number, counting 16-bit wrap-arounds
+      (A.1), so a source that restarts or jumps far is resynchronised 
+      instead of being reported as massive loss;
+    - expected and lost packets, in total and since the last report,
+      giving the cumulative loss and the 8-bit loss fraction (A.3); 
+    - the interarrival jitter in RTP timestamp units (A.8); 
+    - LSR and DLSR, from the last sender report received. 
+
+The client updates it for every RTP packet and turns it into a 
+ReportBlock about once a second. 
+"""
+from time import monotonic
+
+from RtpPacket import CLOCK_RATE
+from RtcpPacket import ReportBlock, ntp_middle
+
+SEQ_MOD = 1 << 16
+MAX_DROPOUT = 3000
+MAX_MISORDER = 100
+
+class RtpReceiverStats: 
+
+    def __init__(self, clockRate: int = CLOCK_RATE, clock=monotonic):
+        self.clockRate = clockRate
+        self.clock = clock
+        self.ssrc = None
+        self.init_seq(0)
+        self.jitter = 0.0
+        self.transit = None
+        self.lsr = 0
+        self.lsrArrival = None
+
+    def init_seq(self, seq: int) -> None: 
+        self.baseSeq = seq
+        self.maxSeq = seq
+        self.badSeq = SEQ_MOD + 1
+        self.cycles = 0
+        self.received = 0
+        self.expectedPrior = 0
+        self.receivedPrior = 0
+
+    def update(self, ssrc: int, seq: int, timestamp: int, arrival: float = None) -> bool: 
+        """ 
+            Accounts for one RTP packet. Returns false if the packet was 
+            judged out of sequence (too old, or the start of a jump that is
+            only accepted once the next packet confirms it). 
+        """
+        if arrival is None: 
+            arrival = self.clock()
+        if ssrc != self.ssrc: 
+            # New source, e.g. the server restarted the stream
+            self.ssrc = ssrc
+            self.init_seq(seq)
+            self.transit = None
+            self.jitter = 0.0
+
+        delta = (seq - self.maxSeq) % SEQ_MOD
+        if delta < MAX_DROPOUT: 
+            # In order, with a permissible gap
+            if seq < self.maxSeq: 
+                self.cycles += SEQ_MOD
+            self.maxSeq = seq
+        elif delta <= SEQ_MOD - MAX_MISORDER: 
+            # A very large jump: resync only if the next packet follows it
+            if seq == self.badSeq: 
+                self.init_seq(seq)
+            else: 
+                self.badSeq = (seq + 1) % SEQ_MOD
+                return False
+        # else: duplicate or reordered packet, counted but not a new maximum
+        self.received += 1
+
+        transit = arrival * self.clockRate - timestamp
+        if self.transit is not None: 
+            d = abs(transit - self.transit)
+            self.jitter += (d - self.jitter) / 16
+        self.transit = transit
+        return True
+
+    def extended_max(self) -> int: 
+        return self.cycles + self.maxSeq
+
+    def expected(self) -> int: 
+        return self.extended_max() - self.baseSeq + 1
+
+    def lost(self) -> int: 
+        return self.expected() - self.received
+
+    def on_sender_report(self, report, arrival: float = None) -> None: 
+        """ Remembers a SenderReport so the next report block can carry LSR and DLSR."""
+        self.lsr = ntp_middle(report.ntp_sec, report.ntp_frac)
+        self.lsrArrival = self.clock() if arrival is None else arrival
+
+    def report_block(self, now: float = None) -> ReportBlock: 
+        """ Returns the ReportBlock for the interval since the previous call."""
+        if now is None: 
+            now = self.clock()
+        expected = self.expected()
+        expectedInterval = expected - self.expectedPrior
+        receivedInterval = self.received - self.receivedPrior
+        self.expectedPrior = expected
+        self.receivedPrior = self.received
+        lostInterval = expectedInterval - receivedInterval
+        fraction = 0
+        if expectedInterval > 0 and lostInterval > 0: 
+            fraction = (lostInterval << 8) // expectedInterval
+        dlsr = 0
+        if self.lsrArrival is not None: 
+            dlsr = int((now - self.lsrArrival) * 65536) & 0xFFFFFFFF
+        return ReportBlock(self.ssrc, min(fraction, 255), self.lost(), self.extended_max(), 
+                           int(self.jitter), self.lsr, dlsr)
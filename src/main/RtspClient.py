@@ -0,0 +1,144 @@
+"""
+Purpose: 
+
+RtspClient is the client's RTSP state machine without any GUI or socket
+code, so that the Tk ClientWorker and the headless LoadGenerator drive 
+sessions the same way. States are INIT, READY and PLAYING; SETUP, PLAY,
+PAUSE and TEARDOWN requests move between them once the server replies 
+200 OK: 
+
+    INIT --SETUP--> READY --PLAY--> PLAYING --PAUSE--> READY 
+    READY/PLAYING --TEARDOWN--> INIT
+
+makeRequest() vets a request against the current state and builds it; 
+processReply() matches a reply to the request sent last and applies the
+state change. What happens around a transition (opening sockets, 
+starting threads) is left to the subclass. 
+
+seek() makes the next PLAY carry a Range header, and setScale() a Scale
+header for trick play; either allows a PLAY while PLAYING. position and
+scale hold the start time and speed the server last replied with. 
+"""
+import RtspRequest as rq
+from RtspCodec import RtspMessage
+
+class RtspClient: 
+    INIT = 0
+    READY = 1
+    PLAYING = 2
+
+    SETUP = 0
+    PLAY = 1
+    PAUSE = 2
+    TEARDOWN = 3
+
+    REQUEST_TYPES = {SETUP: "SETUP", PLAY: "PLAY", PAUSE: "PAUSE", TEARDOWN: "TEARDOWN"}
+
+    def __init__(self, fileName, rtpPort):
+        self.fileName = fileName
+        self.rtpPort = int(rtpPort)
+        self.state = self.INIT
+        self.rtspSeq = 0
+        self.sessionId = 0
+        self.requestSent = -1
+        self.serverPorts = None
+        # Extra headers sent with SETUP (e.g. FEC or NACK offers)
+        self.setupHeaders = {}
+        # Range for the next PLAY, and where the server said playing starts (npt seconds)
+        self.pendingRange = None
+        self.position = 0.0
+        # Scale for the next PLAY, and the speed the server plays at
+        self.pendingScale = None
+        self.scale = 1.0
+
+    def allowed(self, requestCode) -> bool: 
+        """ Returns true if requestCode may be sent in the current state."""
+        if requestCode == self.SETUP: 
+            return self.state == self.INIT
+        if requestCode == self.PLAY: 
+            # A PLAY with a Range or Scale seeks or changes speed, also while playing
+            return self.state == self.READY or (self.state == self.PLAYING and 
+                                                (self.pendingRange is not None or self.pendingScale is not None))
+        if requestCode == self.PAUSE: 
+            return self.state == self.PLAYING
+        if requestCode == self.TEARDOWN: 
+            return self.state != self.INIT
+        return False
+
+    def makeRequest(self, requestCode): 
+        """ Returns the RtspRequest for requestCode, or None if the current state does not allow it."""
+        if not self.allowed(requestCode): 
+            return None
+        self.rtspSeq += 1
+        request = rq.RtspRequest(self.REQUEST_TYPES[requestCode], self.rtspSeq, self.fileName, self.rtpPort)
+        if requestCode == self.SETUP: 
+            request.headers.update(self.setupHeaders)
+        elif requestCode == self.PLAY and self.pendingRange is not None: 
+            request.headers[rq.RANGE_HEADER] = self.pendingRange
+            self.pendingRange = None
+        if requestCode == self.PLAY and self.pendingScale is not None: 
+            request.headers[rq.SCALE_HEADER] = self.pendingScale
+            self.pendingScale = None
+        if self.sessionId: 
+            request.session = self.sessionId
+        # Keep track of the sent request.
+        self.requestSent = requestCode
+        return request
+
+    def seek(self, start: float, end: float = None) -> None: 
+        """ Makes the next PLAY start at start seconds (and stop at end)."""
+        self.pendingRange = rq.format_range(start, end)
+
+    def setScale(self, scale: float) -> None: 
+        """ Makes the next PLAY ask for trick play at scale (e.g. 4 or -1); 1 is normal play."""
+        self.pendingScale = rq.format_scale(scale)
+
+    def processReply(self, reply): 
+        """ 
+            Applies a reply from the server. Returns the request code it 
+            acknowledged with 200 OK, or None (an error, a stale reply or 
+            not a reply at all). 
+        """
+        if not isinstance(reply, RtspMessage) or reply.is_request: 
+            return None
+        # Process only if the server reply's sequence number is the same as the request's
+        if int(reply.header('CSeq', 0)) != self.rtspSeq: 
+            return None
+
+        session = int(reply.header('Session', '0').split(';')[0])
+        # New RTSP session ID
+        if self.sessionId == 0: 
+            self.sessionId = session
+        # Process only if the session ID is the same
+        if self.sessionId != session or reply.status != 200: 
+            return None
+
+        if self.requestSent == self.SETUP: 
+            self.state = self.READY
+            serverPort = rq.parse_transport(reply.header('Transport', '')).get('server_port')
+            if serverPort and '-' in serverPort: 
+                self.serverPorts = tuple(int(port) for port in serverPort.split('-')[:2])
+        elif self.requestSent == self.PLAY: 
+            self.state = self.PLAYING
+            self.updatePosition(reply)
+            try: 
+                self.scale = rq.parse_scale(reply.header(rq.SCALE_HEADER, '1'))
+            except ValueError: 
+                self.scale = 1.0
+        elif self.requestSent == self.PAUSE: 
+            self.state = self.READY
+            self.updatePosition(reply)
+        elif self.requestSent == self.TEARDOWN: 
+            self.state = self.INIT
+            # A new SETUP gets a new session
+            self.sessionId = 0
+        return self.requestSent
+
+    def updatePosition(self, reply) -> None: 
+        try: 
+            start, _ = rq.parse_range(reply.header(rq.RANGE_HEADER, ''))
+        except ValueError: 
+            # No Range in the reply, or "now" (a live channel)
+            return
+        if start is not None: 
+            self.position = start
@@ -0,0 +1,180 @@
+"""
+Purpose: 
+
+The RtspCodec turns RTSP/1.0 messages into bytes and back. It replaces 
+pickled RtspRequest objects on the control connection: unpickling data
+from the network is unsafe, and a recv() does not have to hold exactly
+one whole message, since TCP may split or coalesce them. 
+
+RtspParser is incremental: feed() it whatever recv() returned and it 
+returns every message completed so far, keeping any partial message for
+the next call. It understands 
+    * requests:  "PLAY rtsp://host/movie.Mjpeg RTSP/1.0" + headers
+    * responses: "RTSP/1.0 200 OK" + headers
+    * CRLF-terminated header lines ending in an empty line, and a body of
+      Content-Length bytes when that header is present
+    * interleaved binary data: "$", channel (1 byte), length (2 bytes),
+      then the data (RFC 2326 section 10.12)
+
+RtspMessage.encode() serializes a message in the same format. Malformed
+input raises RtspError; the connection cannot be resynchronized after 
+that and should be closed. 
+"""
+import struct
+
+CRLF = b"\r\n"
+HEADER_END = b"\r\n\r\n"
+VERSION = "RTSP/1.0"
+INTERLEAVED_MAGIC = 0x24   # "$"
+INTERLEAVED_HEADER = struct.Struct("!BBH")
+MAX_HEADER_SIZE = 8192
+MAX_BODY_SIZE = 1 << 20
+
+class RtspError(ValueError): 
+    """ Raised for input that is not a valid RTSP message."""
+
+class RtspMessage: 
+
+    def __init__(self, method: str = None, uri: str = None, status: int = None, 
+                 reason: str = None, headers: dict = None, body: bytes = b""):
+        self.method = method
+        self.uri = uri
+        self.status = status
+        self.reason = reason
+        self.headers = dict(headers or {})
+        self.body = body
+
+    @property
+    def is_request(self) -> bool: 
+        return self.method is not None
+
+    def header(self, name: str, default=None): 
+        """ Returns the value of a header, matching its name case-insensitively."""
+        if name in self.headers: 
+            return self.headers[name]
+        lower = name.lower()
+        for key, value in self.headers.items(): 
+            if key.lower() == lower: 
+                return value
+        return default
+
+    def encode(self) -> bytes: 
+        if self.is_request: 
+            lines = ["%s %s %s" % (self.method, self.uri, VERSION)]
+        else: 
+            lines = ["%s %d %s" % (VERSION, self.status, self.reason)]
+        for name, value in self.headers.items(): 
+            if name.lower() != "content-length": 
+                lines.append("%s: %s" % (name, value))
+        if self.body: 
+            lines.append("Content-Length: %d" % len(self.body))
+        lines.append("")
+        lines.append("")
+        return "\r\n".join(lines).encode("utf-8") + self.body
+
+    def __str__(self): 
+        start = ("%s %s" % (self.method, self.uri) if self.is_request 
+                 else "%d %s" % (self.status, self.reason))
+        return start + " " + str(self.headers)
+
+class InterleavedFrame: 
+
+    def __init__(self, channel: int, data: bytes):
+        self.channel = channel
+        self.data = data
+
+    def encode(self) -> bytes: 
+        return INTERLEAVED_HEADER.pack(INTERLEAVED_MAGIC, self.channel, len(self.data)) + self.data
+
+class RtspParser: 
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.message = None     # message whose body is still arriving
+        self.bodySize = 0
+        self.searched = 0       # bytes already searched for HEADER_END
+
+    def feed(self, data) -> list: 
+        """ 
+            Adds received bytes and returns the RtspMessage and 
+            InterleavedFrame objects they complete, in order. 
+        """
+        self.buffer += data
+        messages = []
+        while True: 
+            message = self.next()
+            if message is None: 
+                return messages
+            messages.append(message)
+
+    def next(self): 
+        buffer = self.buffer
+        if self.message is not None: 
+            if len(buffer) < self.bodySize: 
+                return None
+            message, self.message = self.message, None
+            message.body = bytes(buffer[:self.bodySize])
+            del buffer[:self.bodySize]
+            return message
+
+        if not buffer: 
+            return None
+        if buffer[0] == INTERLEAVED_MAGIC: 
+            if len(buffer) < INTERLEAVED_HEADER.size: 
+                return None
+            _, channel, length = INTERLEAVED_HEADER.unpack_from(buffer, 0)
+            end = INTERLEAVED_HEADER.size + length
+            if len(buffer) < end: 
+                return None
+            frame = InterleavedFrame(channel, bytes(buffer[INTERLEAVED_HEADER.size:end]))
+            del buffer[:end]
+            return frame
+
+        end = buffer.find(HEADER_END, max(0, self.searched - 3))
+        if end < 0: 
+            if len(buffer) > MAX_HEADER_SIZE: 
+                raise RtspError("header section longer than %d bytes" % MAX_HEADER_SIZE)
+            self.searched = len(buffer)
+            return None
+        self.searched = 0
+        message = parse_head(bytes(buffer[:end]))
+        del buffer[:end + len(HEADER_END)]
+
+        length = message.header("Content-Length")
+        if length is None: 
+            return message
+        try: 
+            self.bodySize = int(length)
+        except ValueError: 
+            raise RtspError("bad Content-Length %r" % length)
+        if not 0 <= self.bodySize <= MAX_BODY_SIZE: 
+            raise RtspError("Content-Length %d out of range" % self.bodySize)
+        self.message = message
+        return self.next()
+
+def parse_head(head: bytes) -> RtspMessage: 
+    """ Parses the start line and header lines of one message (without the blank line)."""
+    try: 
+        lines = head.decode("utf-8").split("\r\n")
+    except UnicodeDecodeError: 
+        raise RtspError("message head is not UTF-8")
+
+    parts = lines[0].split(" ", 2)
+    if len(parts) != 3: 
+        raise RtspError("bad start line %r" % lines[0])
+    if parts[0] == VERSION: 
+        try: 
+            message = RtspMessage(status=int(parts[1]), reason=parts[2])
+        except ValueError: 
+            raise RtspError("bad status line %r" % lines[0])
+    elif parts[2] == VERSION: 
+        message = RtspMessage(method=parts[0], uri=parts[1])
+    else: 
+        raise RtspError("bad start line %r" % lines[0])
+
+    for line in lines[1:]: 
+        name, sep, value = line.partition(":")
+        if not sep or not name.strip(): 
+            raise RtspError("bad header line %r" % line)
+        message.headers[name.strip()] = value.strip()
+    return message
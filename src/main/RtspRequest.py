@@ -31,15 +31,103 @@ newRequest.reqType = 'pause'
 # would fail under @reqType.setter logic
 newRequest.reqType = 'not a valid command'
 
+#-------on the wire------#
+Requests are no longer pickled. toMessage()/encode() turn a request into
+an RTSP/1.0 message (see RtspCodec), and fromMessage() turns a parsed 
+message back into an RtspRequest:
+
+    SETUP rtsp://127.0.0.1:8000/./movie.Mjpeg RTSP/1.0
+    CSeq: 1
+    Transport: RTP/AVP;unicast;client_port=1025-1026
+
+Optional fields:
+- session, int: RTSP session ID, sent once the server assigned one
+- headers, dict: any other RTSP headers (e.g. Range)
+
+A PLAY may carry a Range in npt (parse_range), to seek, and a Scale 
+(parse_scale) for trick play: at Scale N the server sends every Nth 
+frame, backwards if N is negative, at the normal frame interval. Its 
+reply gives the start and speed actually used; a PLAY without Range 
+after PAUSE resumes at the next unsent frame, and a live source only 
+plays npt=now- at Scale 1. 
+
 '''
+from urllib.parse import quote, unquote
+
+from RtspCodec import RtspMessage, RtspError
 
 VALIDREQS = ["SETUP", "PLAY", "PAUSE", "TEARDOWN"]
+TRANSPORT = "RTP/AVP;unicast;client_port=%d-%d"
+SERVER_TRANSPORT = TRANSPORT + ";server_port=%d-%d"
+
+def parse_transport(transport):
+    """Split a Transport header into a dict of its parameters (flags map to None)."""
+    params = {}
+    for param in transport.split(";"):
+        name, sep, value = param.partition("=")
+        if name.strip():
+            params[name.strip()] = value.strip() if sep else None
+    return params
+
+RANGE_HEADER = "Range"
+
+def parse_npt_time(value):
+    """Turn an npt time ("12.5", "1:02:03.5") into seconds."""
+    parts = value.strip().split(":")
+    if not 1 <= len(parts) <= 3 or not all(parts):
+        raise ValueError("bad npt time %r" % value)
+    seconds = 0.0
+    for part in parts:
+        seconds = seconds * 60 + float(part)
+    if seconds < 0 or seconds != seconds or seconds == float("inf"):
+        raise ValueError("bad npt time %r" % value)
+    return seconds
+
+def parse_range(value):
+    """
+    Split a Range header in npt ("npt=10-", "npt=now-", "npt=0:01:00-0:02:00")
+    into (start, end) in seconds. start is None for "now" and end is None when open.
+    Raises ValueError for other units or a malformed range.
+    """
+    unit, sep, spec = value.strip().partition("=")
+    if unit.strip().lower() != "npt" or not sep:
+        raise ValueError("only npt ranges are supported, got %r" % value)
+    # Drop a ";time=..." parameter, the range is acted on at once
+    spec = spec.split(";")[0]
+    first, sep, last = spec.partition("-")
+    if not sep:
+        raise ValueError("bad npt range %r" % value)
+    first, last = first.strip(), last.strip()
+    start = None if first.lower() == "now" else parse_npt_time(first) if first else 0.0
+    end = parse_npt_time(last) if last else None
+    if end is not None and start is not None and end <= start:
+        raise ValueError("npt range %r ends before it starts" % value)
+    return start, end
+
+def format_range(start, end=None):
+    """Format a Range header value in npt, e.g. npt=10.000-120.000."""
+    return "npt=%.3f-%s" % (start, "" if end is None else "%.3f" % end)
+
+SCALE_HEADER = "Scale"
+
+def parse_scale(value):
+    """Turn a Scale header ("2", "-1", "0.5") into a number. Raises ValueError if it is 0 or not a number."""
+    scale = float(value)
+    if not scale or scale != scale or abs(scale) == float("inf"):
+        raise ValueError("bad scale %r" % value)
+    return scale
+
+def format_scale(scale):
+    """Format a Scale header value, e.g. 2 or -1."""
+    return "%g" % scale
 
 class RtspRequest:
 
 
-    def __init__(self, reqType, seqNum, fileName, rtpPort):
+    def __init__(self, reqType, seqNum, fileName, rtpPort, session=None, headers=None):
         self.rtpPort = rtpPort
+        self.session = session
+        self.headers = dict(headers or {})
         if type(reqType) is str and type(fileName) is str:
             self.reqType = reqType
             self.fileName= fileName
@@ -98,6 +186,55 @@ class RtspRequest:
         # else:
         self.__rtpPort = port
 
+    def toMessage(self, host=None):
+        """Build the RTSP message for this request. host ("addr:port") makes the URI absolute."""
+        uri = quote(self.fileName, safe="/.:-_~")
+        if host is not None:
+            uri = "rtsp://%s/%s" % (host, uri)
+
+        headers = {"CSeq": str(self.seqNum)}
+        if self.rtpPort is not None:
+            port = int(self.rtpPort)
+            headers["Transport"] = TRANSPORT % (port, port + 1)
+        if self.session:
+            headers["Session"] = str(self.session)
+        headers.update(self.headers)
+        return RtspMessage(method=self.reqType, uri=uri, headers=headers)
+
+    def encode(self, host=None):
+        """Serialize this request for the RTSP socket."""
+        return self.toMessage(host).encode()
+
+    @classmethod
+    def fromMessage(cls, message):
+        """
+        Build an RtspRequest from a parsed RtspMessage.
+        Raises RtspError if the message is not a valid request.
+        """
+        if not message.is_request:
+            raise RtspError("not a request")
+
+        uri = message.uri
+        if uri.startswith("rtsp://"):
+            # drop scheme and host, keep the path after the first slash
+            uri = uri[len("rtsp://"):].partition("/")[2]
+        fileName = unquote(uri)
+
+        rtpPort = parse_transport(message.header("Transport", "")).get("client_port")
+        if rtpPort is not None:
+            rtpPort = rtpPort.split("-")[0]
+
+        headers = {name: value for name, value in message.headers.items()
+                   if name.lower() not in ("cseq", "transport", "session")}
+        try:
+            seqNum = int(message.header("CSeq"))
+            session = message.header("Session")
+            session = int(session.split(";")[0]) if session else None
+            rtpPort = int(rtpPort) if rtpPort is not None else None
+            return cls(message.method, seqNum, fileName, rtpPort, session, headers)
+        except (TypeError, ValueError) as e:
+            raise RtspError("invalid %s request: %s" % (message.method, e))
+
     def __str__(self):
         return "Req Type: " + self.reqType +  " Seq Num: " + str(self.seqNum) + " File name: " + self.fileName + " RTP Port: " + str(self.rtpPort) 
     
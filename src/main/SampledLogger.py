@@ -0,0 +1,47 @@
+"""
+Purpose:
+
+Logging for messages on the hot path (once per packet or per frame),
+where printing every one would cost more than the work it reports. A
+SampledLogger lets the first message of a kind through and then one in
+every `every`, and costs a single level check when its level is off.
+
+Everything else logs through the standard logging module, one logger
+per module; configure_logging() sets the level and format for the
+launchers.
+"""
+import logging
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+DEFAULT_EVERY = 100
+LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR")
+
+def configure_logging(level: str = "INFO") -> None:
+    logging.basicConfig(level=getattr(logging, level.upper()), format=LOG_FORMAT)
+
+class SampledLogger:
+
+    def __init__(self, name: str, every: int = DEFAULT_EVERY):
+        self.logger = logging.getLogger(name)
+        self.every = max(1, every)
+        # Not locked: an occasional lost count only shifts which message is logged
+        self.counts = {}
+
+    def log(self, level: int, key: str, msg: str, *args) -> bool:
+        """ Logs msg for the first and then every `every`-th call with key. Returns true if logged."""
+        if not self.logger.isEnabledFor(level):
+            return False
+        count = self.counts.get(key, 0)
+        self.counts[key] = count + 1
+        if count % self.every:
+            return False
+        if self.every > 1:
+            msg += " (1 in %d logged)" % self.every
+        self.logger.log(level, msg, *args)
+        return True
+
+    def debug(self, key: str, msg: str, *args) -> bool:
+        return self.log(logging.DEBUG, key, msg, *args)
+
+    def warning(self, key: str, msg: str, *args) -> bool:
+        return self.log(logging.WARNING, key, msg, *args)
@@ -1,7 +1,23 @@
 import sys
+import argparse
+import logging
+import multiprocessing
 from socket import *
 
 from ServerWorker import ServerWorker
+from AsyncServer import AsyncServer
+from PacingScheduler import PACING_SCHEDULER, POLICIES
+from BroadcastChannel import ChannelRegistry
+from SessionTable import SessionTable
+from ServerSupervisor import ServerSupervisor
+from PacketHistory import DEFAULT_BUDGET
+from Metrics import METRICS, MetricsServer, DEFAULT_HOST
+from SampledLogger import configure_logging, LEVELS
+from Profiler import PROFILER, DEFAULT_EVERY
+from LiveSource import LiveSources, DEFAULT_SECONDS, DEFAULT_BUDGET as LIVE_BUDGET
+from VariantCache import VariantCache, parse_tier, DEFAULT_TIERS, DEFAULT_BUDGET as VARIANT_BUDGET
+
+log = logging.getLogger(__name__)
 
 # Author(s): Zak Hussain
 # Credit: Kurose lab 6 code 
@@ -13,30 +29,183 @@ Launches the server application for an inputted server port. This
 Class reads in the Server address and desired server port. It 
 also prepares a dictionary that stores information pertaining to 
 setting up the connections with the client. 
+
+Two server modes are available: 
+    * threaded (default): a ServerWorker with its own threads per client
+    * async: every session on one asyncio event loop (see AsyncServer)
+
+Options beyond those (see --help) share channels between viewers of a 
+file (--broadcast, see BroadcastChannel), run several worker processes
+(--workers, see ServerSupervisor), serve metrics and profiler controls
+(--metrics-port, --profile, see Profiler), ingest live sources (--live,
+see LiveSource) and set the quality tiers (--tier, see VariantCache). 
+Output goes through logging, at the --log-level given (INFO by default). 
 """
 class ServerLauncher: 
     
-    def main(self):
+    def parseArgs(self, argv):
+        parser = argparse.ArgumentParser(description="RTSP/RTP video streaming server")
+        parser.add_argument("--host", default='localhost', help="address to listen on")
+        parser.add_argument("--port", type=int, default=8000, help="RTSP port")
+        parser.add_argument("--mode", choices=["threaded", "async"], default="threaded",
+                            help="one thread per session, or one asyncio loop for all")
+        parser.add_argument("--pacing-policy", choices=POLICIES, default=PACING_SCHEDULER.policy,
+                            help="what a session that falls behind does with late frames")
+        parser.add_argument("--frame-rate", action="append", default=[], metavar="FILE=FPS",
+                            help="frame rate of a media file (repeatable, default 20 fps)")
+        parser.add_argument("--broadcast", action="store_true",
+                            help="viewers of the same file share one live channel (threaded mode)")
+        parser.add_argument("--workers", type=int, default=1,
+                            help="worker processes sharing the RTSP port (default 1, no supervisor)")
+        parser.add_argument("--no-rate-control", dest="rate_control", action="store_false",
+                            help="send at the full frame rate and quality whatever the receiver reports")
+        parser.add_argument("--history-bytes", type=int, default=DEFAULT_BUDGET,
+                            help="bytes of sent packets kept per session for NACK retransmission (0 disables)")
+        parser.add_argument("--metrics-port", type=int, default=None,
+                            help="serve Prometheus metrics on this port (off by default)")
+        parser.add_argument("--metrics-host", default=DEFAULT_HOST,
+                            help="address for the metrics endpoint (default loopback only)")
+        parser.add_argument("--log-level", choices=LEVELS, default="INFO", type=str.upper,
+                            help="DEBUG also logs every RTSP request")
+        parser.add_argument("--profile", action="store_true",
+                            help="time the stages of the send path (see also /profile/* on the metrics port)")
+        parser.add_argument("--profile-every", type=int, default=DEFAULT_EVERY,
+                            help="with --profile, time one frame in every N (default %d)" % DEFAULT_EVERY)
+        parser.add_argument("--live", action="append", default=[], metavar="NAME=SPEC",
+                            help="serve a live MJPEG source as live:NAME; SPEC is pipe:PATH, unix:PATH "
+                                 "or udp:HOST:PORT (repeatable)")
+        parser.add_argument("--live-seconds", type=float, default=DEFAULT_SECONDS,
+                            help="seconds of each live source kept for viewers (default %g)" % DEFAULT_SECONDS)
+        parser.add_argument("--live-bytes", type=int, default=LIVE_BUDGET,
+                            help="bytes of each live source kept at most (default %d)" % LIVE_BUDGET)
+        parser.add_argument("--tier", action="append", default=[], metavar="NAME=WxH@QUALITY",
+                            help="offer a quality tier clients can ask for at SETUP (repeatable; default %s)"
+                                 % ", ".join("%s=%dx%d@%d" % tier for tier in DEFAULT_TIERS))
+        parser.add_argument("--variant-cache-bytes", type=int, default=VARIANT_BUDGET,
+                            help="bytes of transcoded tier frames kept in memory, 0 to offer no tiers "
+                                 "(default %d)" % VARIANT_BUDGET)
+        parser.add_argument("--variant-cache-dir", default=None,
+                            help="also keep transcoded tier frames in this directory, across restarts")
+        parser.add_argument("--variant-workers", type=int, default=None,
+                            help="processes transcoding tier frames (default: one per CPU)")
+        args = parser.parse_args(argv)
+        if args.live and args.workers > 1:
+            parser.error("--live sources cannot be shared between --workers processes")
+        if args.broadcast and args.mode != "threaded":
+            parser.error("--broadcast is only available in threaded mode")
+        if args.workers > 1 and "fork" not in multiprocessing.get_all_start_methods():
+            parser.error("--workers needs fork(), which this platform does not have")
+        return args
+
+    def parseFrameRates(self, values):
+        """Turn FILE=FPS arguments into a {file: fps} dictionary."""
+        frameRates = {}
+        for value in values:
+            fileName, _, fps = value.rpartition('=')
+            if not fileName or not fps:
+                raise SystemExit("--frame-rate expects FILE=FPS, got %r" % value)
+            frameRates[fileName] = float(fps)
+        return frameRates
 
+    def startLiveSources(self, values, seconds, budget):
+        """Start the live sources of NAME=SPEC arguments. Returns them, or None if there are none."""
+        if not values:
+            return None
+        liveSources = LiveSources(seconds, budget)
+        for value in values:
+            name, _, spec = value.partition('=')
+            if not name or not spec:
+                raise SystemExit("--live expects NAME=SPEC, got %r" % value)
+            try:
+                liveSources.add(name, spec)
+            except (ValueError, OSError) as e:
+                raise SystemExit("--live %s: %s" % (value, e))
+        return liveSources
+
+    def startVariantCache(self, values, budget, directory, workers):
+        """Set up the tiers of NAME=WxH@QUALITY arguments. Returns their cache, or None if tiers are off."""
+        if budget <= 0:
+            return None
         try:
-            SERVER_HOSTNAME = 'localhost'
-            SERVER_PORT = 8000
-        except:
-            print("[Usage: Server.py Server_port]\n")
-		
+            tiers = [parse_tier(value) for value in values] or DEFAULT_TIERS
+        except ValueError as e:
+            raise SystemExit("--tier: %s" % e)
+        variantCache = VariantCache(tiers, budget, directory, workers)
+        if not variantCache.enabled:
+            log.warning("Quality tiers need Pillow, which is not installed; X-Tier requests are ignored")
+            return None
+        return variantCache
+
+    def bindRtspSocket(self, host, port, reusePort=False):
+        """Create the listening RTSP/TCP socket."""
         rtspSocket = socket(AF_INET, SOCK_STREAM)
-        rtspSocket.bind((SERVER_HOSTNAME, SERVER_PORT))
+        if reusePort:
+            rtspSocket.setsockopt(SOL_SOCKET, SO_REUSEPORT, 1)
+        rtspSocket.bind((host, port))
         rtspSocket.listen(5)        
-        print('Server is listening...')
+        return rtspSocket
+
+    def serve(self, args, rtspSocket, onSessionsChange=None):
+        """Serve RTSP clients on rtspSocket in the mode selected by args."""
+        frameRates = self.parseFrameRates(args.frame_rate)
+        PACING_SCHEDULER.policy = args.pacing_policy
+        sessions = SessionTable(onSessionsChange)
+        liveSources = self.startLiveSources(args.live, args.live_seconds, args.live_bytes)
+        variantCache = self.startVariantCache(args.tier, args.variant_cache_bytes, args.variant_cache_dir,
+                                              args.variant_workers)
+        if args.profile:
+            PROFILER.start(args.profile_every)
+        if args.metrics_port:
+            sessions.publish(METRICS)
+            if variantCache is not None:
+                variantCache.publish(METRICS)
+            METRICS.add_collector(PROFILER.metrics)
+            metricsServer = MetricsServer(args.metrics_port, args.metrics_host)
+            metricsServer.routes.update(PROFILER.routes())
+            metricsServer.start()
+            log.info("Metrics on http://%s:%d/metrics", args.metrics_host, args.metrics_port)
+
+        if args.mode == "async":
+            log.info('Server is listening (async)...')
+            AsyncServer(args.host, args.port, frameRates, args.pacing_policy, sessions, 
+                        args.history_bytes, args.rate_control, liveSources, variantCache).run(rtspSocket)
+            return
+		
+        channels = ChannelRegistry(liveSources=liveSources) if args.broadcast else None
+
+        log.info('Server is listening...')
 		# Receive client info (address,port) through RTSP/TCP session
         while True:
             # create a dictionary to store client information. 
             clientInfo = {}
             clientInfo['rtspSocket'] = rtspSocket.accept()
+            clientInfo['frameRates'] = frameRates
+            clientInfo['sessions'] = sessions
+            clientInfo['historyBytes'] = args.history_bytes
+            clientInfo['rateControl'] = args.rate_control
+            if liveSources is not None:
+                clientInfo['liveSources'] = liveSources
+            if variantCache is not None:
+                clientInfo['variantCache'] = variantCache
+            if channels is not None:
+                clientInfo['channels'] = channels
             
             # TODO: implement the Server worker class. 
             ServerWorker(clientInfo).run()		
 
+    def main(self, argv=None):
+
+        args = self.parseArgs(argv)
+        configure_logging(args.log_level)
+        SERVER_HOSTNAME = args.host
+        SERVER_PORT = args.port
+
+        if args.workers > 1:
+            ServerSupervisor(self, args, args.workers).run()
+            return
+
+        self.serve(args, self.bindRtspSocket(SERVER_HOSTNAME, SERVER_PORT))
+
 if __name__ == "__main__":
     (ServerLauncher()).main()
 
@@ -0,0 +1,111 @@
+"""
+Purpose: 
+
+The ServerSupervisor scales the server across CPU cores. It forks N 
+worker processes that all serve the same RTSP port, each with its own 
+interpreter, session table, pacing scheduler and frame store: 
+
+    * with SO_REUSEPORT (Linux) every worker binds its own listening 
+      socket and the kernel spreads new connections across them
+    * otherwise the supervisor binds one socket before forking and the
+      workers accept on it in turn (pre-forked accept)
+
+Each worker publishes its session count into a shared array. With 
+--metrics-port P, worker N serves its metrics on port P + N. The 
+supervisor polls its workers, restarts any that exited or crashed, and
+periodically logs the aggregate session count. Clients see one server
+on one port, as before. 
+"""
+import logging
+import multiprocessing
+import socket
+import sys
+import time
+
+log = logging.getLogger(__name__)
+
+POLL_INTERVAL = 1.0     # seconds between liveness checks
+REPORT_INTERVAL = 10.0  # seconds between session count reports
+
+def reuse_port_supported() -> bool: 
+    """ Returns true if SO_REUSEPORT balances connections across sockets here."""
+    return hasattr(socket, "SO_REUSEPORT") and sys.platform.startswith("linux")
+
+class ServerSupervisor: 
+
+    def __init__(self, launcher, args, workers: int):
+        self.launcher = launcher
+        self.args = args
+        self.workers = workers
+        self.context = multiprocessing.get_context("fork")
+        self.counts = self.context.Array("i", workers)
+        self.processes = [None] * workers
+        self.restarts = 0
+        self.reusePort = reuse_port_supported()
+        self.sharedSocket = None
+
+    def start(self) -> None: 
+        if not self.reusePort: 
+            self.sharedSocket = self.launcher.bindRtspSocket(self.args.host, self.args.port)
+        for slot in range(self.workers): 
+            self.startWorker(slot)
+
+    def startWorker(self, slot: int) -> None: 
+        self.counts[slot] = 0
+        process = self.context.Process(target=self.runWorker, args=(slot,), 
+                                       name="ServerWorker-%d" % slot, daemon=True)
+        process.start()
+        self.processes[slot] = process
+
+    def runWorker(self, slot: int) -> None: 
+        """ Body of a worker process: serve until killed."""
+        def publish(count): 
+            self.counts[slot] = count
+
+        if self.sharedSocket is not None: 
+            rtspSocket = self.sharedSocket
+        else: 
+            rtspSocket = self.launcher.bindRtspSocket(self.args.host, self.args.port, reusePort=True)
+        # Every worker serves its own metrics, on consecutive ports
+        if self.args.metrics_port: 
+            self.args.metrics_port += slot
+        self.launcher.serve(self.args, rtspSocket, publish)
+
+    def sessionCounts(self) -> list: 
+        """ Returns the number of sessions of every worker."""
+        return list(self.counts)
+
+    def poll(self) -> None: 
+        """ Restarts every worker process that is no longer running."""
+        for slot, process in enumerate(self.processes): 
+            if not process.is_alive(): 
+                log.warning("Worker %d exited with code %s, restarting", slot, process.exitcode)
+                process.join()
+                self.restarts += 1
+                self.startWorker(slot)
+
+    def run(self) -> None: 
+        self.start()
+        log.info("Server is listening with %d worker processes (%s)...", 
+                 self.workers, "SO_REUSEPORT" if self.reusePort else "shared socket")
+        lastReport = time.monotonic()
+        try: 
+            while True: 
+                time.sleep(POLL_INTERVAL)
+                self.poll()
+                if time.monotonic() - lastReport >= REPORT_INTERVAL: 
+                    lastReport = time.monotonic()
+                    counts = self.sessionCounts()
+                    log.info("Sessions: %d %s, restarts: %d", sum(counts), counts, self.restarts)
+        except KeyboardInterrupt: 
+            pass
+        finally: 
+            self.stop()
+
+    def stop(self) -> None: 
+        for process in self.processes: 
+            if process is not None and process.is_alive(): 
+                process.terminate()
+        for process in self.processes: 
+            if process is not None: 
+                process.join()
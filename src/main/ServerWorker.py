@@ -5,13 +5,43 @@
 
 
 from random import randint
-import sys, traceback, threading, socket
+from time import time, perf_counter
+import sys, traceback, threading, socket, logging
 
 from VideoStream import VideoStream
-from RtpPacket import RtpPacket
-from RtspRequest import RtspRequest
+from LiveSource import is_live
+from FrameStore import FRAME_STORE
+from PacingScheduler import PACING_SCHEDULER
+from RtpPacket import HEADER_SIZE
+from RtpPacketizer import RtpPacketizer, CLOCK_RATE, send_packet, header_timestamp
+from RtcpMonitor import RTCP_MONITOR
+from RtcpPacket import (RTCP_INTERVAL, FEEDBACK_HEADER_NAME, FEEDBACK_NACK, GenericNack, 
+                        pack_sender_report, parse_rtcp, ntp_timestamp, ntp_middle, nack_deadline)
+from PacketHistory import PacketHistory, DEFAULT_BUDGET
+from RtspRequest import (RtspRequest, SERVER_TRANSPORT, RANGE_HEADER, SCALE_HEADER, parse_range, 
+                         format_range, parse_scale, format_scale)
+from XorFec import FecEncoder, FEC_HEADER_NAME, format_fec_params, parse_fec_params
+from RateController import RateController
+from VariantWriter import find_variants
+from VariantCache import TIER_HEADER
+from RtspCodec import RtspParser, RtspMessage, RtspError
+from Metrics import METRICS
+from SampledLogger import SampledLogger
+from Profiler import PROFILER
+
+log = logging.getLogger(__name__)
+sampledLog = SampledLogger(__name__)
+
+FRAMES_SENT = METRICS.counter("rtp_frames_sent_total", "Video frames sent over RTP")
+PACKETS_SENT = METRICS.counter("rtp_packets_sent_total", "RTP media packets sent (without FEC and resends)")
+BYTES_SENT = METRICS.counter("rtp_bytes_sent_total", "RTP media payload bytes sent")
+RESENT = METRICS.counter("rtp_retransmitted_packets_total", "RTP packets resent after a NACK")
+SEND_TIME = METRICS.histogram("rtp_send_seconds", "Time to hand one frame's packets to the socket")
+REQUEST_TIME = METRICS.histogram("rtsp_request_seconds", "Time to handle an RTSP request", ("method",))
+
+# Fastest trick-play speed; faster requests are played at this speed
+MAX_SCALE = 16
 
-import pickle 
 """
 Purpose: 
 
@@ -22,6 +52,14 @@ for real-time control packets to affect how the server transmits to the
 client (i.e. the server can either transmit the content, or wait, or stop
 transmitting to the client). The ServerWorker uses RtpPacket to package 
 the video bytes and tranmit those packets over UDP. 
+
+Each session also sends RTCP sender reports and reads the client's 
+receiver reports, and as negotiated at SETUP adds XOR parity FEC 
+(XorFec), resends NACKed packets (PacketHistory), adapts its rate 
+(RateController) and reads a quality tier (VariantCache, X-Tier). PLAY 
+may seek (Range) or play fast or backwards (Scale); files with a hint 
+track (HintTrack) and live:NAME sources (LiveSource) are sent as well. 
+Those modules describe the details. 
 """
 class ServerWorker:
 	SETUP = 'SETUP'
@@ -37,26 +75,100 @@ class ServerWorker:
 	OK_200 = 0
 	FILE_NOT_FOUND_404 = 1
 	CON_ERR_500 = 2
+	BAD_REQUEST_400 = 3
+	INVALID_RANGE_457 = 4
+	METHOD_NOT_VALID_455 = 5
+
+	STATUS = {
+		OK_200: (200, 'OK'),
+		FILE_NOT_FOUND_404: (404, 'Not Found'),
+		CON_ERR_500: (500, 'Internal Server Error'),
+		BAD_REQUEST_400: (400, 'Bad Request'),
+		INVALID_RANGE_457: (457, 'Invalid Range'),
+		METHOD_NOT_VALID_455: (455, 'Method Not Valid in This State'),
+	}
+
+	frameRate = VideoStream.DEFAULT_FRAME_RATE
+	channel = None
+	rtcpStats = None
+	fec = None
+	history = None
+	rateController = None
+	quality = 0
+	# Frames read for the session so far, for thinning
+	framesOffered = 0
+	# Media timestamps: frameBase is sent with timestampBase, later frames follow at the frame rate
+	frameBase = 0
+	timestampBase = 0
+	stopFrame = None
+	# Prebuilt packetization of the file being sent, if usable
+	hints = None
+	# Trick play: send every scale-th frame, backwards if negative
+	scale = 1
+	# Quality tier the frames are transcoded to, if the client asked for one
+	tier = None
+	# Set by a seek: the first frame after it is the one sought, whatever the scale
+	atSeekPoint = False
 	
 	clientInfo = {}
 	
 	def __init__(self, clientInfo):
 		self.clientInfo = clientInfo
+		# Held while a frame is read, so a seek or PAUSE falls between two frames
+		self.mediaLock = threading.Lock()
+		self.resetSession()
 		
 	def run(self):
+		if 'sessions' in self.clientInfo:
+			self.clientInfo['sessions'].add(self)
 		threading.Thread(target=self.recvRtspRequest).start()
 	
 	def recvRtspRequest(self):
 		"""Receive RTSP request from the client."""
 		connSocket = self.clientInfo['rtspSocket'][0]
+		parser = RtspParser()
 		while True:            
-			data = connSocket.recv(256)
-			if data:
-				# data is an RtspRequest obect
-				# unpickle the data 
-				data = pickle.loads(data) 
+			try:
+				data = connSocket.recv(4096)
+				# A recv() may hold part of a request or several of them
+				messages = parser.feed(data) if data else None
+			except (OSError, RtspError) as e:
+				log.info("Closing RTSP connection: %s", e)
+				messages = None
+			if messages is None:
+				# The client closed the RTSP connection
+				self.stopRtp()
+				self.closeRtp()
+				if 'sessions' in self.clientInfo:
+					self.clientInfo['sessions'].remove(self)
+				connSocket.close()
+				break
+
+			for message in messages:
+				self.processRtspMessage(message)
 
-				self.processRtspRequest(data) 
+	def processRtspMessage(self, message):
+		"""Turn a parsed RTSP message into an RtspRequest and process it."""
+		if not isinstance(message, RtspMessage) or not message.is_request:
+			return
+		try:
+			request = RtspRequest.fromMessage(message)
+		except RtspError as e:
+			log.warning("Bad RTSP request: %s", e)
+			self.replyRtsp(self.BAD_REQUEST_400, message.header('CSeq', '0'))
+			return
+		start = perf_counter()
+		try:
+			self.processRtspRequest(request)
+		except Exception:
+			# Keep serving the connection, so that its cleanup still runs when the client leaves
+			log.exception("Failed to process %s", request.reqType)
+			try:
+				self.replyRtsp(self.CON_ERR_500, str(request.seqNum))
+			except OSError:
+				pass
+			return
+		REQUEST_TIME.observe(perf_counter() - start, (request.reqType,))
 
 	def processRtspRequest(self, data: RtspRequest) -> None:
 		"""Process RTSP request sent from the client."""
@@ -77,111 +189,580 @@ class ServerWorker:
 		if requestType == self.SETUP:
 			if self.state == self.INIT:
 				# Update state
-				print("processing SETUP\n")
+				log.debug("processing SETUP")
 				try:
-					self.clientInfo['videoStream'] = VideoStream(filename)
+					# Frame rates can be configured per file by the launcher (a live name may carry ?delay=)
+					rateKey = filename.partition('?')[0] if is_live(filename) else filename
+					self.frameRate = self.clientInfo.get('frameRates', {}).get(rateKey, self.frameRate)
+					self.clientInfo['videoStream'] = self.openStream(filename)
+					self.hints = self.usableHints(self.clientInfo['videoStream'])
 					self.state = self.READY
 				except IOError:
 					self.replyRtsp(self.FILE_NOT_FOUND_404, seq)
+					return
 				
 				# Generate a randomized RTSP session ID
 				self.clientInfo['session'] = randint(100000, 999999)
 				
-				# Send RTSP reply
-				self.replyRtsp(self.OK_200, seq)
-				
-				# Get the RTP/UDP port from the last line
+				# Get the RTP/UDP port from the Transport header
 				self.clientInfo['rtpPort'] = rtp_port
 
-		# Process PLAY request 		
+				# Adapt to the receiver reports, which need the client's RTP port
+				if rtp_port is not None and self.clientInfo.get('rateControl', True):
+					# Broadcast channels send one version of the file, so only thinning applies there
+					self.variants = ([filename] if 'channels' in self.clientInfo or is_live(filename) 
+					                 else find_variants(filename))
+					self.rateController = RateController(len(self.variants), name=str(self.clientInfo['session']), 
+					                                     log=log.info)
+				
+				# Send RTSP reply, telling the client where our RTP and RTCP ports are
+				headers = {}
+				if rtp_port is not None:
+					serverRtpPort, serverRtcpPort = self.openRtp()
+					headers['Transport'] = SERVER_TRANSPORT % (rtp_port, rtp_port + 1, 
+					                                           serverRtpPort, serverRtcpPort)
+				fec = self.negotiateFec(request)
+				if fec:
+					headers[FEC_HEADER_NAME] = fec
+				if self.negotiateNack(request):
+					headers[FEEDBACK_HEADER_NAME] = FEEDBACK_NACK
+				tier = self.negotiateTier(request, filename)
+				if tier:
+					headers[TIER_HEADER] = tier
+				self.replyRtsp(self.OK_200, seq, headers)
+			else:
+				self.replyRtsp(self.METHOD_NOT_VALID_455, seq)
+
+		# Process PLAY request, or a seek while playing
 		elif requestType == self.PLAY:
-			if self.state == self.READY:
-				print("processing PLAY\n")
+			rangeValue = self.requestHeader(request, RANGE_HEADER)
+			scaleValue = self.requestHeader(request, SCALE_HEADER)
+			if 'videoStream' not in self.clientInfo or self.state == self.INIT:
+				self.replyRtsp(self.METHOD_NOT_VALID_455, seq)
+			elif self.state == self.READY or rangeValue is not None or scaleValue is not None:
+				log.debug("processing PLAY")
+				try:
+					scale = self.chooseScale(scaleValue)
+				except ValueError as e:
+					log.info("PLAY with invalid Scale %r: %s", scaleValue, e)
+					self.replyRtsp(self.BAD_REQUEST_400, seq)
+					return
+				try:
+					headers = self.seek(rangeValue, filename, scale)
+				except ValueError as e:
+					log.info("PLAY with invalid Range %r: %s", rangeValue, e)
+					self.replyRtsp(self.INVALID_RANGE_457, seq)
+					return
+				if self.state == self.PLAYING:
+					# Already streaming: the next frame comes from the new position
+					self.replyRtsp(self.OK_200, seq, headers)
+					return
 				self.state = self.PLAYING
 				
-				# Create a new socket for RTP/UDP
-				self.clientInfo["rtpSocket"] = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-				
-				self.replyRtsp(self.OK_200, seq)
+				self.replyRtsp(self.OK_200, seq, headers)
 				
-				# start new thread that will allow RTP sending
-				# save these threasd to the clientInfo dictionary.
-				self.clientInfo['event'] = threading.Event()
-				self.clientInfo['worker']= threading.Thread(target=self.sendRtp) 
-				self.clientInfo['worker'].start()
+				self.startRtp()
+			else:
+				# Already playing from where the client wants
+				self.replyRtsp(self.OK_200, seq, self.position())
 		
 		# Process PAUSE request
 		elif requestType == self.PAUSE:
-			if self.state == self.PLAYING:
-				print("processing PAUSE\n")
-				self.state = self.READY
+			if self.state == self.PLAYING and 'videoStream' in self.clientInfo:
+				log.debug("processing PAUSE")
+				with self.mediaLock:
+					self.state = self.READY
 				
-				self.clientInfo['event'].set()
+				self.stopRtp()
 			
-				self.replyRtsp(self.OK_200, seq)
+				self.replyRtsp(self.OK_200, seq, self.position())
+			else:
+				self.replyRtsp(self.METHOD_NOT_VALID_455, seq)
 		
 		# Process TEARDOWN request
 		elif requestType == self.TEARDOWN:
-			print("processing TEARDOWN\n")
+			log.debug("processing TEARDOWN")
 
-			self.clientInfo['event'].set()
+			with self.mediaLock:
+				self.state = self.INIT
+			self.stopRtp()
 			
 			# OK  the Rtsp client requset
 			self.replyRtsp(self.OK_200, seq)
 			
-			# Close the RTP socket
-			self.clientInfo['rtpSocket'].close()
+			self.closeRtp()
+			self.resetSession()
+
+	def openStream(self, filename):
+		"""Open filename, or a cursor on the live source for live:NAME. Raises IOError if there is none."""
+		if is_live(filename):
+			liveSources = self.clientInfo.get('liveSources')
+			if liveSources is None:
+				raise IOError("no live sources on this server")
+			return liveSources.attach(filename, self.frameRate)
+		# Sessions share one memory map per file through the frame store
+		return VideoStream(filename, self.frameRate, store=FRAME_STORE)
+
+	def usableHints(self, videoStream):
+		"""Returns the hint track of videoStream if it was made for this session's MTU and frame rate."""
+		hints = getattr(videoStream, 'hints', None)
+		if hints is None:
+			return None
+		if hints.mtu != self.packetizer.mtu or hints.frameRate != self.frameRate:
+			log.info("Not using the hint track of %s: made for MTU %d at %g fps", videoStream.filename, 
+			         hints.mtu, hints.frameRate)
+			return None
+		return hints
+
+	def chooseScale(self, scaleValue):
+		"""Returns the trick-play speed for a PLAY's Scale header. Raises ValueError for a bad one."""
+		if scaleValue is None or 'channels' in self.clientInfo or self.clientInfo['videoStream'].duration() is None:
+			return 1
+		scale = parse_scale(scaleValue)
+		# Whole steps only: slow motion would mean sending frames twice
+		step = min(MAX_SCALE, max(1, int(round(abs(scale)))))
+		return step if scale > 0 else -step
+
+	def seek(self, rangeValue, url, scale=1):
+		"""
+		Move the stream to the start of a PLAY Range (None: stay where it is) and play on at scale.
+		Returns the Range, Scale and RTP-Info reply headers. Raises ValueError for a bad range.
+		RTP timestamps run on across the seek; a reverse play runs back to the start of the file
+		and ignores the end of the Range.
+		"""
+		videoStream = self.clientInfo['videoStream']
+		if rangeValue is not None and 'channels' not in self.clientInfo:
+			start, end = parse_range(rangeValue)
+			duration = videoStream.duration()
+			if duration is None and (start is not None or end is not None):
+				raise ValueError("a live stream only plays from now")
+			with self.mediaLock:
+				if start is not None:
+					if start >= duration:
+						raise ValueError("starts at %.3f s, after the end (%.3f s)" % (start, duration))
+					# The frame index makes this a constant-time jump
+					frame = int(start * self.frameRate + 1e-6)
+					self.anchorTimestamps(frame)
+					videoStream.seek(frame)
+				self.stopFrame = None if end is None else int(end * self.frameRate + 1e-6)
+				self.atSeekPoint = start is not None
+		with self.mediaLock:
+			self.scale = scale
+		headers = self.position()
+		headers[SCALE_HEADER] = format_scale(scale)
+		if 'channels' not in self.clientInfo:
+			with self.mediaLock:
+				rtpTime = self.timestampFor(videoStream.frameNbr() + 1) + self.packetizer.timestamp_offset
+				headers['RTP-Info'] = "url=%s;seq=%d;rtptime=%d" % (url, self.packetizer.seq_num, 
+				                                                     rtpTime & 0xFFFFFFFF)
+		return headers
+
+	def position(self):
+		"""Returns the Range header for where the stream is now, in npt."""
+		videoStream = self.clientInfo['videoStream']
+		if 'channels' in self.clientInfo or videoStream.duration() is None:
+			# A broadcast channel or a live source cannot be positioned, viewers join it live
+			return {RANGE_HEADER: "npt=now-"}
+		return {RANGE_HEADER: format_range(videoStream.frameNbr() / self.frameRate, videoStream.duration())}
+
+	def anchorTimestamps(self, frame, skipped=0):
+		"""
+		Called before the stream moves to frame: the frames from there on get the timestamps 
+		the next ones would have had (skipped frame periods later), so timestamps keep rising.
+		"""
+		self.timestampBase = self.timestampFor(self.clientInfo['videoStream'].frameNbr() + skipped)
+		self.frameBase = frame
+
+	def stepFrames(self, videoStream, skip):
+		"""
+		Trick play: move the stream to the next frame to send, scale frames on from the 
+		last one (and scale more for each of the skip late frame periods). Returns false 
+		once a reverse play has reached the start.
+		"""
+		step = abs(self.scale)
+		position = videoStream.frameNbr()
+		if self.atSeekPoint:
+			# Start with the frame sought; position is the next frame to read
+			offset = step * skip
+		else:
+			offset = step * (skip + 1) - 1 if self.scale > 0 else step * (skip + 1) + 1
+		self.atSeekPoint = False
+		target = position + offset if self.scale > 0 else position - offset
+		if target < 0:
+			return False
+		target = min(target, videoStream.frame_count())
+		if target != position:
+			self.anchorTimestamps(target, skip)
+			videoStream.seek(target)
+		return True
+
+	def mediaTime(self, frameNbr):
+		"""Returns the 90 kHz media time of frame number frameNbr from the start of the file."""
+		hints = self.hints
+		if hints is not None and 0 < frameNbr <= len(hints):
+			# From the hint track's timing table
+			return hints.timestamp(frameNbr - 1)
+		return int(frameNbr * CLOCK_RATE / self.frameRate)
+
+	def timestampFor(self, frameNbr):
+		"""Returns the media timestamp (without the session offset) of frame number frameNbr."""
+		return self.timestampBase + self.mediaTime(frameNbr) - self.mediaTime(self.frameBase)
+
+	def requestHeader(self, request, name):
+		"""Returns the value of header name in request (case-insensitive), or None."""
+		return {key.lower(): value for key, value in request.headers.items()}.get(name.lower())
+
+	def negotiateFec(self, request):
+		"""Set up FEC if the SETUP request asks for it. Returns the accepted X-FEC value or None."""
+		value = self.requestHeader(request, FEC_HEADER_NAME)
+		if value is None:
+			return None
+		try:
+			groupSize, depth, payloadType = parse_fec_params(value)
+		except ValueError as e:
+			log.warning("FEC not enabled: %s", e)
+			return None
+		self.fec = FecEncoder(groupSize, depth, payloadType, randint(0, 0xFFFF))
+		return format_fec_params(groupSize, depth, payloadType)
+
+	def negotiateNack(self, request):
+		"""Keep a packet history if the client offers NACK feedback. Returns true if accepted."""
+		offer = self.requestHeader(request, FEEDBACK_HEADER_NAME) or ''
+		budget = self.clientInfo.get('historyBytes', DEFAULT_BUDGET)
+		if FEEDBACK_NACK not in [value.strip() for value in offer.split(',')] or budget <= 0:
+			return False
+		self.history = PacketHistory(budget)
+		return True
+
+	def negotiateTier(self, request, filename):
+		"""Read frames from the variant cache if SETUP asks for a tier it offers. Returns its name or None."""
+		name = self.requestHeader(request, TIER_HEADER)
+		variantCache = self.clientInfo.get('variantCache')
+		if name is None or variantCache is None or 'channels' in self.clientInfo or is_live(filename):
+			return None
+		tier = variantCache.tier(name.strip())
+		if tier is None:
+			log.info("Tier %r is not offered", name)
+			return None
+		try:
+			self.clientInfo['videoStream'] = variantCache.open(self.clientInfo['videoStream'], tier)
+		except OSError as e:
+			log.warning("Cannot read tier %s of %s, sending the original: %s", tier.name, filename, e)
+			return None
+		self.tier = tier
+		self.hints = None
+		return tier.name
+
+	def openRtp(self):
+		"""Bind the session's RTP and RTCP sockets, kept across PAUSE/PLAY. Returns their ports."""
+		if 'rtpSocket' not in self.clientInfo:
+			rtpSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+			rtpSocket.bind(('', 0))
+			self.clientInfo['rtpSocket'] = rtpSocket
+		if 'rtcpSocket' not in self.clientInfo:
+			rtcpSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+			rtcpSocket.bind(('', 0))
+			self.clientInfo['rtcpSocket'] = rtcpSocket
+			# Receiver reports are read by the process-wide RTCP thread
+			RTCP_MONITOR.register(rtcpSocket, self)
+		return (self.clientInfo['rtpSocket'].getsockname()[1], 
+		        self.clientInfo['rtcpSocket'].getsockname()[1])
+
+	def startRtp(self):
+		"""Start sending RTP packets to the client."""
+		if 'rtpSocket' not in self.clientInfo:
+			self.openRtp()
+
+		channels = self.clientInfo.get('channels')
+		if channels is not None:
+			# Broadcast mode: join the file's channel at its current frame
+			self.channel = channels.join(self.clientInfo['videoStream'].filename, self.frameRate, self)
+		else:
+			# The shared pacing scheduler calls sendFrame() once per frame period
+			PACING_SCHEDULER.add(self, self.frameRate)
+
+	def stopRtp(self):
+		"""Stop sending RTP packets (PAUSE or TEARDOWN)."""
+		if self.fec is not None:
+			self.fec.reset()
+		if self.channel is not None:
+			self.clientInfo['channels'].leave(self.channel, self)
+			self.channel = None
+		else:
+			PACING_SCHEDULER.remove(self)
+
+	def closeRtp(self):
+		"""Release the RTP socket and the media file at the end of the session."""
+		# Close the RTP and RTCP sockets
+		if 'rtpSocket' in self.clientInfo:
+			self.clientInfo.pop('rtpSocket').close()
+		if 'rtcpSocket' in self.clientInfo:
+			rtcpSocket = self.clientInfo.pop('rtcpSocket')
+			RTCP_MONITOR.unregister(rtcpSocket)
+			rtcpSocket.close()
+		if self.rtcpStats:
+			log.info("Session %s RTCP: %s", self.clientInfo.get('session'), self.rtcpStats)
+		if self.retransmitStats['requested']:
+			log.info("Session %s retransmissions: %s", self.clientInfo.get('session'), self.retransmitStats)
+
+		# Hand the shared media mapping back to the frame store
+		if 'videoStream' in self.clientInfo:
+			self.clientInfo.pop('videoStream').close()
+
+	def resetSession(self):
+		"""Start with no session, and again after TEARDOWN so that a new SETUP on the connection starts afresh."""
+		self.clientInfo.pop('session', None)
+		self.clientInfo.pop('rtpPort', None)
+		# A new SSRC, sequence number and timestamp offset
+		self.packetizer = RtpPacketizer.for_session()
+		# Sender statistics for RTCP sender reports
+		self.rtpFrames = 0
+		self.rtpPackets = 0
+		self.rtpOctets = 0
+		self.lastTimestamp = None
+		self.lastReport = 0.0
+		self.retransmitStats = {'requested': 0, 'resent': 0, 'not_kept': 0, 'too_late': 0}
+		for name in ('frameRate', 'rtcpStats', 'fec', 'history', 'rateController', 'variants', 'quality', 
+		             'framesOffered', 'frameBase', 'timestampBase', 'stopFrame', 'hints', 'scale', 'tier', 
+		             'atSeekPoint'):
+			# Back to the class defaults
+			self.__dict__.pop(name, None)
 			
-	def sendRtp(self):
-		"""Send RTP packets over UDP."""
-		while True:
-			self.clientInfo['event'].wait(0.05) 
+	def sendFrame(self, skip=0):
+		"""Send the next frame over RTP/UDP, after skipping frames the scheduler dropped."""
+		timer = PROFILER.timer(self) if PROFILER.enabled else None
+		packets = self.nextPackets(skip, timer)
+		if packets:
+			self.sendPackets(packets, timer)
+		if timer is not None:
+			timer.finish()
+
+	def nextPackets(self, skip=0, timer=None):
+		"""
+		Read and packetize the next frame as the rate controller allows. Returns [] if none is due.
+		A profiler StageTimer, if given, is marked after each stage.
+		"""
+		if self.rateController is not None and self.rateController.quality != self.quality:
+			self.switchQuality(self.rateController.quality)
+		with self.mediaLock:
+			videoStream = self.clientInfo.get('videoStream')
+			if videoStream is None or self.state != self.PLAYING:
+				return []
 			
-			# Stop sending if request is PAUSE or TEARDOWN
-			if self.clientInfo['event'].isSet(): 
-				break 
-				
-			data = self.clientInfo['videoStream'].nextFrame()
-			if data: 
-				frameNumber = self.clientInfo['videoStream'].frameNbr()
-				try:
-					address = self.clientInfo['rtspSocket'][1][0]
-					port = self.clientInfo['rtpPort']
-					self.clientInfo['rtpSocket'].sendto(self.makeRtp(data, frameNumber),(address,port))
-				except socket.error:
-					print(socket.error)
-					print("Connection Error")
+			if self.scale != 1:
+				if not self.stepFrames(videoStream, skip):
+					return []
+			elif skip:
+				videoStream.skip(skip)
+			if self.scale > 0 and self.stopFrame is not None and videoStream.frameNbr() >= self.stopFrame:
+				# Reached the end of the PLAY range
+				return []
+			data = videoStream.nextFrame()
+			frameNbr = videoStream.frameNbr()
+		if timer is not None:
+			timer.mark("read")
+		if not data or not self.wantsFrame():
+			return []
+		packets = self.makeRtp(data, frameNbr)
+		if timer is not None:
+			timer.mark("packetize")
+		return packets
+
+	def wantsFrame(self):
+		"""Called once for each frame read for the session: returns false for frames the rate controller thins out."""
+		# Counted over the frames read rather than by frame number, which steps by the scale in trick play
+		self.framesOffered += 1
+		return self.rateController is None or self.rateController.wantsFrame(self.framesOffered)
+
+	def switchQuality(self, quality):
+		"""Continue the stream from the same frame in another quality variant of the file."""
+		# Under the media lock, so that a seek on the RTSP thread lands on one stream or the other
+		with self.mediaLock:
+			current = self.clientInfo.get('videoStream')
+			if current is None:
+				return
+			variant = None
+			try:
+				variant = VideoStream(self.variants[quality], self.frameRate, store=FRAME_STORE)
+				variant.seek(current.frameNbr())
+				if self.tier is not None:
+					variant = self.clientInfo['variantCache'].open(variant, self.tier)
+			except (IOError, ValueError) as e:
+				log.warning("Cannot switch to %s: %s", self.variants[quality], e)
+				if variant is not None:
+					# Hand the variant's mapping back to the frame store
+					variant.close()
+				self.variants[quality:] = []
+				self.rateController.dropQualities(quality)
+				return
+			self.clientInfo['videoStream'] = variant
+			self.hints = self.usableHints(variant)
+			self.quality = quality
+			current.close()
+
+	def sendPackets(self, packets, timer=None):
+		"""Send packetized (header, payload) pairs to the client over RTP/UDP."""
+		rtpSocket = self.clientInfo.get('rtpSocket')
+		if rtpSocket is None:
+			return
+
+		start = perf_counter()
+		try:
+			address = self.clientInfo['rtspSocket'][1][0]
+			port = self.clientInfo['rtpPort']
+			for header, payload in packets: 
+				send_packet(rtpSocket, header, payload, (address,port))
+			if timer is not None:
+				timer.mark("send")
+			for header, payload in self.protect(packets):
+				send_packet(rtpSocket, header, payload, (address,port))
+			if timer is not None:
+				timer.mark("fec")
+		except socket.error as e:
+			sampledLog.warning("send", "Connection Error: %s", e)
+			return
+		SEND_TIME.observe(perf_counter() - start)
+		self.recordSent(packets)
+		if timer is not None:
+			timer.mark("record")
+
+	def protect(self, packets):
+		"""Returns the FEC packets completed by sending packets (none without FEC)."""
+		if self.fec is None:
+			return []
+		fecPackets = []
+		for header, payload in packets:
+			fecPackets.extend(self.fec.add(header, payload))
+		return fecPackets
+
+	def recordSent(self, packets):
+		"""Count sent packets for the sender report, and send a report once per interval."""
+		if not packets:
+			return
+		octets = sum(len(header) - HEADER_SIZE + len(payload) for header, payload in packets)
+		self.rtpFrames += 1
+		self.rtpPackets += len(packets)
+		self.rtpOctets += octets
+		FRAMES_SENT.inc()
+		PACKETS_SENT.inc(len(packets))
+		BYTES_SENT.inc(octets)
+		self.lastTimestamp = header_timestamp(packets[-1][0])
+		if self.history is not None:
+			for header, payload in packets:
+				self.history.add((header[2] << 8) | header[3], bytes(header) + bytes(payload))
+		now = time()
+		if now - self.lastReport >= RTCP_INTERVAL:
+			self.lastReport = now
+			# The frame just sent was stamped now, so its timestamp maps to now
+			self.sendRtcp(pack_sender_report(self.packetizer.ssrc, now, self.lastTimestamp, 
+			                                 self.rtpPackets, self.rtpOctets))
+
+	def sendRtcp(self, data):
+		"""Send an RTCP packet to the client's RTCP port (one above its RTP port)."""
+		rtcpSocket = self.clientInfo.get('rtcpSocket')
+		if rtcpSocket is None or self.clientInfo.get('rtpPort') is None:
+			return
+		try:
+			rtcpSocket.sendto(data, (self.clientInfo['rtspSocket'][1][0], self.clientInfo['rtpPort'] + 1))
+		except OSError as e:
+			log.warning("RTCP send failed: %s", e)
+
+	def receiveRtcp(self, data, address):
+		"""Called by the RTCP monitor for every datagram on this session's RTCP socket."""
+		self.processRtcp(parse_rtcp(data), time())
+
+	def processRtcp(self, packets, now):
+		"""Fold the report blocks about our stream into rtcpStats, and answer NACKs."""
+		for packet in packets:
+			if isinstance(packet, GenericNack) and packet.media_ssrc == self.packetizer.ssrc:
+				self.retransmit(packet.lost, nack_deadline(packets), now)
+			for block in getattr(packet, 'reports', ()):
+				if block.ssrc != self.packetizer.ssrc:
+					continue
+				stats = dict(self.rtcpStats or {'reports': 0})
+				stats['reports'] += 1
+				stats['fraction_lost'] = block.fraction_lost / 256
+				stats['cumulative_lost'] = block.cumulative_lost
+				stats['highest_seq'] = block.highest_seq
+				stats['jitter_ms'] = block.jitter * 1000 / CLOCK_RATE
+				rtt = None
+				if block.lsr:
+					# RTT = arrival - LSR - DLSR, all in 1/65536 s
+					arrival = ntp_middle(*ntp_timestamp(now))
+					rtt = ((arrival - block.lsr - block.dlsr) & 0xFFFFFFFF) / 65536
+					stats['rtt_ms'] = rtt * 1000
+				self.rtcpStats = stats
+				if self.rateController is not None:
+					self.rateController.update(stats['fraction_lost'], rtt, now)
+
+	def sessionMetrics(self):
+		"""Returns this session's values for the per-session metrics (see SessionTable)."""
+		metrics = {'frames_sent': self.rtpFrames, 'packets_sent': self.rtpPackets, 'bytes_sent': self.rtpOctets}
+		if self.rtcpStats:
+			metrics['fraction_lost'] = self.rtcpStats['fraction_lost']
+			metrics['jitter'] = self.rtcpStats['jitter_ms'] / 1000
+			if 'rtt_ms' in self.rtcpStats:
+				metrics['rtt'] = self.rtcpStats['rtt_ms'] / 1000
+		return metrics
 
 	def makeRtp(self, payload, frameNbr):
-		"""RTP-packetize the video data."""
-		version = 2
-		padding = 0
-		extension = 0
-		cc = 0
-		marker = 0
-		pt = 26 # MJPEG type
-		seqnum = frameNbr
-		ssrc = 0 
-		
-		rtpPacket = RtpPacket()
+		"""RTP-packetize the video data into MTU-sized (header, payload) fragments."""
+		# All fragments of a frame share the frame's 90 kHz media timestamp
+		timestamp = self.timestampFor(frameNbr)
+		hints = self.hints
+		if hints is not None:
+			# Headers and fragment boundaries come prebuilt from the hint track
+			return self.packetizer.packetize_hinted(hints.templates(frameNbr - 1), 
+			                                        hints.fragments(frameNbr - 1, payload), timestamp)
 		
-		rtpPacket.encapsulate(version, padding, extension, 
-								cc, marker, pt, 
-								seqnum, ssrc, payload)
+		return self.packetizer.packetize(payload, timestamp)
 		
-		return rtpPacket.get_packet()
-		
-	def replyRtsp(self, code, seq):
+	def retransmit(self, lost, deadline, now):
+		"""Resend the NACKed packets that are still kept and can arrive before deadline."""
+		stats = self.retransmitStats
+		stats['requested'] += len(lost)
+		if self.history is None:
+			return
+		rtt = (self.rtcpStats or {}).get('rtt_ms', 0) / 1000
+		if deadline is not None and rtt > deadline:
+			# The resent packets would arrive after the client plays them out
+			stats['too_late'] += len(lost)
+			return
+		for seq in lost:
+			# Don't answer a repeated NACK before our last resend could have arrived
+			packet = self.history.resend(seq, now, rtt)
+			if packet is None:
+				stats['not_kept'] += 1
+			else:
+				self.resendRtp(packet)
+				stats['resent'] += 1
+				RESENT.inc()
+
+	def resendRtp(self, packet):
+		"""Send a packet from the history to the client again."""
+		rtpSocket = self.clientInfo.get('rtpSocket')
+		if rtpSocket is None:
+			return
+		try:
+			rtpSocket.sendto(packet, (self.clientInfo['rtspSocket'][1][0], self.clientInfo['rtpPort']))
+		except OSError as e:
+			sampledLog.warning("resend", "Retransmission failed: %s", e)
+
+	def replyRtsp(self, code, seq, headers=None):
 		"""Send RTSP reply to the client."""
-		if code == self.OK_200:
-			#print("200 OK")
-			reply = 'RTSP/1.0 200 OK\nCSeq: ' + seq + '\nSession: ' + str(self.clientInfo['session'])
-			connSocket = self.clientInfo['rtspSocket'][0]
-			connSocket.send(reply.encode())
-		
-		# Error messages
-		elif code == self.FILE_NOT_FOUND_404:
-			print("404 NOT FOUND")
-		elif code == self.CON_ERR_500:
-			print("500 CONNECTION ERROR")
+		status, reason = self.STATUS[code]
+		if code != self.OK_200:
+			# Error messages
+			log.info("%d %s", status, reason)
+
+		reply = RtspMessage(status=status, reason=reason, headers={'CSeq': seq})
+		if 'session' in self.clientInfo:
+			reply.headers['Session'] = str(self.clientInfo['session'])
+		if headers:
+			reply.headers.update(headers)
+		self.writeRtsp(reply.encode())
 
+	def writeRtsp(self, data):
+		"""Write serialized RTSP data to the client."""
+		connSocket = self.clientInfo['rtspSocket'][0]
+		connSocket.sendall(data)
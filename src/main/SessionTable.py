@@ -0,0 +1,87 @@
+"""
+Purpose: 
+
+The SessionTable keeps track of the RTSP sessions (ServerWorker objects)
+a server process is currently serving. A session is added when its RTSP
+connection is accepted and removed when the connection closes. 
+
+The optional onChange callback receives the new session count after 
+every change; the ServerSupervisor uses it to publish each worker 
+process's count into shared memory. 
+
+publish() exports the sessions to a MetricsRegistry: the number of 
+sessions in each RTSP state, and one sample per session of every value 
+in SESSION_METRICS (from the session's sessionMetrics()). 
+"""
+import threading
+
+from Metrics import Counter, Gauge
+
+STATE_NAMES = ("init", "ready", "playing")
+
+# sessionMetrics() key: (metric class, metric name, help)
+SESSION_METRICS = {
+    'frames_sent': (Counter, "rtsp_session_frames_sent_total", "Video frames sent to the session"),
+    'packets_sent': (Counter, "rtsp_session_packets_sent_total", "RTP media packets sent to the session"),
+    'bytes_sent': (Counter, "rtsp_session_bytes_sent_total", "RTP media payload bytes sent to the session"),
+    'fraction_lost': (Gauge, "rtsp_session_fraction_lost", "Loss fraction in the last receiver report"),
+    'jitter': (Gauge, "rtsp_session_jitter_seconds", "Interarrival jitter in the last receiver report"),
+    'rtt': (Gauge, "rtsp_session_rtt_seconds", "Round-trip time from the last receiver report"),
+}
+
+class SessionTable: 
+
+    def __init__(self, onChange=None):
+        self.lock = threading.Lock()
+        self.sessions = set()
+        self.onChange = onChange
+
+    def add(self, session) -> None: 
+        with self.lock: 
+            self.sessions.add(session)
+            count = len(self.sessions)
+        self.changed(count)
+
+    def remove(self, session) -> None: 
+        with self.lock: 
+            self.sessions.discard(session)
+            count = len(self.sessions)
+        self.changed(count)
+
+    def changed(self, count: int) -> None: 
+        if self.onChange is not None: 
+            self.onChange(count)
+
+    def snapshot(self) -> list: 
+        """ Returns the sessions being served right now."""
+        with self.lock: 
+            return list(self.sessions)
+
+    def __len__(self) -> int: 
+        with self.lock: 
+            return len(self.sessions)
+
+    def countByState(self) -> dict: 
+        """ Returns {(state name,): number of sessions in that state}."""
+        counts = {(name,): 0 for name in STATE_NAMES}
+        for session in self.snapshot(): 
+            counts[(STATE_NAMES[session.state],)] += 1
+        return counts
+
+    def sessionMetrics(self) -> list: 
+        """ Returns the per-session metrics, one sample per session, for a scrape."""
+        metrics = {}
+        for session in self.snapshot(): 
+            label = (str(session.clientInfo.get('session', id(session))),)
+            for key, value in session.sessionMetrics().items(): 
+                kind, name, help = SESSION_METRICS[key]
+                if name not in metrics: 
+                    metrics[name] = kind(name, help, ("session",))
+                metrics[name].values[label] = value
+        return list(metrics.values())
+
+    def publish(self, registry) -> None: 
+        """ Exports the session counts by state and the per-session metrics to registry."""
+        registry.gauge("rtsp_sessions", "RTSP sessions being served, by state", ("state",), 
+                       function=self.countByState)
+        registry.add_collector(self.sessionMetrics)
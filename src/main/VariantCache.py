@@ -0,0 +1,340 @@
+"""
+Purpose:
+
+The VariantCache lets each session pick a quality tier at SETUP, a
+smaller resolution and JPEG quality of the movie for clients on slow
+links or small screens, without anyone writing variant files first. The
+client names a tier in an X-Tier header; the server answers with the
+same header if it offers that tier, and the session's stream is wrapped
+in a VariantStream. Tiers are set with ServerLauncher --tier
+NAME=WxH@QUALITY; the frame is scaled down to fit WxH, keeping its
+aspect ratio, never up.
+
+Frames are transcoded the first time a session of a tier asks for them,
+by a pool of worker processes (Pillow), which is only started for the
+first of them, in chunks of CHUNK_FRAMES, and
+the chunks following the one asked for are queued as well so a session
+rarely catches up with the pool. The results go into one LRU shared by
+every session of the server and kept within a byte budget, keyed by the
+file (path, mtime and size, as the FrameStore), the tier and the frame
+number: a hundred viewers of one movie at one tier cost one transcode
+of each frame. A frame that is not ready yet is sent at the original
+quality rather than held back, so the first frames of a cold tier may
+arrive larger than asked for.
+
+With a cache directory the workers also write each frame there, one
+file per frame, and frames dropped from memory or transcoded by an
+earlier run of the server are read back from it instead of transcoded
+again.
+
+Live sources and broadcast channels are not transcoded: they ignore
+X-Tier.
+"""
+import hashlib
+import importlib.util
+import io
+import logging
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from Metrics import METRICS
+
+log = logging.getLogger(__name__)
+
+TIER_HEADER = "X-Tier"
+DEFAULT_BUDGET = 256 * 1024 * 1024  # bytes of transcoded frames kept in memory
+CHUNK_FRAMES = 8                    # frames transcoded per job
+PREFETCH_CHUNKS = 2                 # chunks queued ahead of the one asked for
+MAX_PENDING_PER_WORKER = 4          # queued jobs per worker process, beyond which nothing more is queued
+
+Tier = namedtuple("Tier", "name width height quality")
+
+DEFAULT_TIERS = (Tier("small", 320, 240, 60), Tier("medium", 640, 480, 75), Tier("large", 1280, 720, 85))
+
+VARIANT_HITS = METRICS.counter("variant_cache_hits_total", "Tier frames served from the variant cache",
+                               ("tier",))
+VARIANT_MISSES = METRICS.counter("variant_cache_misses_total",
+                                 "Tier frames sent at the original quality because their variant was not ready",
+                                 ("tier",))
+VARIANT_TRANSCODED = METRICS.counter("variant_transcoded_frames_total", "Frames transcoded for a tier",
+                                     ("tier",))
+VARIANT_DISK_READS = METRICS.counter("variant_disk_reads_total",
+                                     "Tier frames read back from the variant cache directory", ("tier",))
+VARIANT_EVICTIONS = METRICS.counter("variant_cache_evictions_total",
+                                    "Tier frames dropped from memory to stay within the budget")
+
+def parse_tier(value: str) -> Tier:
+    """ Parses NAME=WxH@QUALITY. Raises ValueError if value is not one."""
+    name, _, spec = value.partition("=")
+    size, _, quality = spec.partition("@")
+    width, _, height = size.partition("x")
+    try:
+        tier = Tier(name.strip(), int(width), int(height), int(quality))
+    except ValueError:
+        raise ValueError("expected NAME=WxH@QUALITY, got %r" % value)
+    if not tier.name or tier.width < 1 or tier.height < 1 or not 1 <= tier.quality <= 95:
+        raise ValueError("expected NAME=WxH@QUALITY with a quality of 1 to 95, got %r" % value)
+    return tier
+
+def transcode(filename: str, spans: list, tier: Tier, directory: str = None, first: int = 0) -> tuple:
+    """
+        Re-encodes the frames of filename at (offset, length) spans for tier, in a
+        pool process. With a directory, frame first + i is read from there if an
+        earlier transcode wrote it, and written there otherwise. Returns the data
+        of the frames, None for one that cannot be decoded, how many of them
+        were transcoded and how many were read from the directory.
+    """
+    from PIL import Image
+
+    frames = []
+    transcoded = loaded = 0
+    with open(filename, "rb") as file:
+        for i, (offset, length) in enumerate(spans):
+            if directory is not None:
+                data = load_frame(directory, first + i)
+                if data is not None:
+                    frames.append(data)
+                    loaded += 1
+                    continue
+            file.seek(offset)
+            try:
+                image = Image.open(io.BytesIO(file.read(length)))
+                # Let the JPEG decoder scale down by 1/2, 1/4 or 1/8 on the way in
+                image.draft("RGB", (tier.width, tier.height))
+                image = image.convert("RGB")
+                image.thumbnail((tier.width, tier.height))
+                encoded = io.BytesIO()
+                image.save(encoded, "JPEG", quality=tier.quality)
+            except (OSError, ValueError):
+                frames.append(None)
+                continue
+            data = encoded.getvalue()
+            frames.append(data)
+            transcoded += 1
+            if directory is not None:
+                save_frame(directory, first + i, data)
+    return frames, transcoded, loaded
+
+def load_frame(directory: str, frame: int):
+    """ Returns frame from the cache directory, or None if it is not there."""
+    try:
+        with open(os.path.join(directory, "%d.jpg" % frame), "rb") as file:
+            return file.read()
+    except OSError:
+        return None
+
+def save_frame(directory: str, frame: int, data: bytes) -> None:
+    path = os.path.join(directory, "%d.jpg" % frame)
+    temp = "%s.%d.tmp" % (path, os.getpid())
+    try:
+        with open(temp, "wb") as file:
+            file.write(data)
+        os.replace(temp, path)
+    except OSError as e:
+        log.warning("Cannot write %s: %s", path, e)
+
+class VariantCache:
+
+    def __init__(self, tiers=DEFAULT_TIERS, budget: int = DEFAULT_BUDGET, directory: str = None,
+                 workers: int = None):
+        self.tiers = {tier.name: tier for tier in tiers}
+        self.budget = budget
+        self.directory = directory
+        self.workers = workers or os.cpu_count() or 1
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.bytes = 0
+        # Chunks being transcoded: (file key, tier, first frame) -> Future
+        self.pending = {}
+        # Frames the pool could not decode, sent at the original quality for good
+        self.failed = set()
+        self.pool = None
+        self.enabled = bool(self.tiers) and budget > 0 and importlib.util.find_spec("PIL") is not None
+
+    def tier(self, name: str) -> Tier:
+        """ Returns the tier called name, or None if it is not offered."""
+        return self.tiers.get(name) if self.enabled else None
+
+    def open(self, videoStream, tier: Tier) -> "VariantStream":
+        """ Wraps videoStream so that it reads tier's variant of each frame."""
+        stream = VariantStream(self, videoStream, tier)
+        self.prefetch(stream, videoStream.frameNbr())
+        return stream
+
+    def get(self, stream: "VariantStream", frame: int):
+        """ Returns tier data of frame (0-based) of stream, or None if it is not ready yet."""
+        tier = stream.tier
+        key = (stream.key, tier, frame)
+        with self.lock:
+            data = self.entries.get(key)
+            if data is not None:
+                self.entries.move_to_end(key)
+        if data is None and key not in self.failed:
+            data = self.read(stream, frame)
+        self.prefetch(stream, frame)
+        if data is None:
+            VARIANT_MISSES.inc(1, (tier.name,))
+        else:
+            VARIANT_HITS.inc(1, (tier.name,))
+        return data
+
+    def read(self, stream: "VariantStream", frame: int):
+        """ Returns frame from the cache directory if an earlier transcode left it there."""
+        if stream.directory is None:
+            return None
+        data = load_frame(stream.directory, frame)
+        if data is None:
+            return None
+        VARIANT_DISK_READS.inc(1, (stream.tier.name,))
+        self.put((stream.key, stream.tier, frame), data)
+        return data
+
+    def put(self, key, data: bytes) -> None:
+        if len(data) > self.budget:
+            return
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= len(previous)
+            self.entries[key] = data
+            self.bytes += len(data)
+            evicted = 0
+            while self.bytes > self.budget:
+                self.bytes -= len(self.entries.popitem(last=False)[1])
+                evicted += 1
+        if evicted:
+            VARIANT_EVICTIONS.inc(evicted)
+
+    def prefetch(self, stream: "VariantStream", frame: int) -> None:
+        """ Queues the chunk holding frame and the ones after it that are not cached or queued."""
+        frames = stream.frame_count()
+        first = frame - frame % CHUNK_FRAMES
+        for start in range(first, min(first + (PREFETCH_CHUNKS + 1) * CHUNK_FRAMES, frames), CHUNK_FRAMES):
+            chunk = (stream.key, stream.tier, start)
+            # Done if the frame to be read from the chunk is cached: the LRU may have dropped the others
+            wanted = (stream.key, stream.tier, max(frame, start))
+            with self.lock:
+                if chunk in self.pending or wanted in self.entries or wanted in self.failed:
+                    continue
+                if len(self.pending) >= self.workers * MAX_PENDING_PER_WORKER:
+                    return
+                self.pending[chunk] = None
+            self.submit(stream, chunk, range(start, min(start + CHUNK_FRAMES, frames)))
+
+    def submit(self, stream: "VariantStream", chunk, frames: range) -> None:
+        index = stream.getIndex()
+        spans = [(index.offset(frame), index.length(frame)) for frame in frames]
+        try:
+            future = self.executor().submit(transcode, stream.filename, spans, stream.tier, stream.directory,
+                                      frames.start)
+        except (BrokenProcessPool, RuntimeError) as e:
+            log.warning("Cannot transcode %s for tier %s: %s", stream.filename, stream.tier.name, e)
+            with self.lock:
+                del self.pending[chunk]
+            self.restart()
+            return
+        with self.lock:
+            self.pending[chunk] = future
+        future.add_done_callback(lambda future: self.finish(chunk, frames, future))
+
+    def finish(self, chunk, frames: range, future) -> None:
+        """ Caches the frames of a finished chunk, on the pool's result thread."""
+        key, tier, _ = chunk
+        try:
+            results, transcoded, loaded = future.result()
+        except Exception as e:
+            log.warning("Transcoding frames %d-%d for tier %s failed: %s", frames.start, frames.stop - 1,
+                        tier.name, e)
+            results, transcoded, loaded = [], 0, 0
+        for frame, data in zip(frames, results):
+            if data is None:
+                with self.lock:
+                    self.failed.add((key, tier, frame))
+            else:
+                self.put((key, tier, frame), data)
+        VARIANT_TRANSCODED.inc(transcoded, (tier.name,))
+        VARIANT_DISK_READS.inc(loaded, (tier.name,))
+        with self.lock:
+            self.pending.pop(chunk, None)
+
+    def executor(self) -> ProcessPoolExecutor:
+        """ Returns the pool, created with the first chunk to transcode."""
+        with self.lock:
+            if self.pool is None:
+                # Spawned rather than forked: the server's threads may hold locks a fork would copy
+                self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self.pool
+
+    def restart(self) -> None:
+        with self.lock:
+            pool, self.pool = self.pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        """ Returns the frames and bytes in memory and the chunks being transcoded."""
+        with self.lock:
+            return {"frames": len(self.entries), "bytes": self.bytes, "pending": len(self.pending)}
+
+    def publish(self, registry) -> None:
+        """ Exports the memory used by the cache to registry."""
+        registry.gauge("variant_cache_bytes", "Bytes of transcoded tier frames kept in memory",
+                       function=lambda: self.stats()["bytes"])
+
+    def close(self) -> None:
+        if self.pool is not None:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+            self.pool = None
+
+class VariantStream:
+    """ A VideoStream whose frames come from a VariantCache tier where it has them."""
+
+    # Frame sizes differ from the original file's, so its hint track does not apply
+    hints = None
+
+    def __init__(self, cache: VariantCache, stream, tier: Tier):
+        self.cache = cache
+        self.stream = stream
+        self.tier = tier
+        self.filename = stream.filename
+        self.frameRate = stream.frameRate
+        stat = os.stat(stream.filename)
+        self.key = (os.path.realpath(stream.filename), stat.st_mtime_ns, stat.st_size)
+        self.directory = None
+        if cache.directory is not None:
+            digest = hashlib.sha1(repr(self.key).encode()).hexdigest()[:16]
+            self.directory = os.path.join(cache.directory, "%s-%s-%dx%dq%d" % ((digest,) + tuple(tier)))
+            os.makedirs(self.directory, exist_ok=True)
+
+    def nextFrame(self):
+        frame = self.stream.frameNbr()
+        data = self.stream.nextFrame()
+        if not data:
+            return data
+        variant = self.cache.get(self, frame)
+        return data if variant is None else variant
+
+    def frameNbr(self):
+        return self.stream.frameNbr()
+
+    def getIndex(self):
+        return self.stream.getIndex()
+
+    def seek(self, frame):
+        self.stream.seek(frame)
+
+    def skip(self, count):
+        self.stream.skip(count)
+
+    def frame_count(self):
+        return self.stream.frame_count()
+
+    def duration(self):
+        return self.stream.duration()
+
+    def close(self):
+        self.stream.close()
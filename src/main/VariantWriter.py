@@ -0,0 +1,70 @@
+"""
+Purpose: 
+
+VariantWriter makes lower-quality variants of an .Mjpeg file, which the 
+RateController switches to when thinning frames is not enough. Variant
+level N of movie.Mjpeg is movie.qN.Mjpeg: the same frames, re-encoded 
+at a lower JPEG quality, so a session can switch between levels at any 
+frame number. 
+
+Usage (needs Pillow): 
+
+    python VariantWriter.py movie.Mjpeg 50 25
+
+writes movie.q1.Mjpeg at quality 50 and movie.q2.Mjpeg at quality 25. 
+"""
+import io
+import os
+import sys
+
+from FrameIndex import FrameIndex, LENGTH_PREFIX_SIZE
+
+MAX_FRAME_SIZE = 10 ** LENGTH_PREFIX_SIZE - 1
+
+def variant_filename(filename: str, level: int) -> str: 
+    """ Returns the file name of quality level (0 is the original file)."""
+    if level == 0: 
+        return filename
+    stem, ext = os.path.splitext(filename)
+    return "%s.q%d%s" % (stem, level, ext)
+
+def find_variants(filename: str) -> list: 
+    """ Returns the file names of filename's quality levels, starting with the original."""
+    variants = [filename]
+    while os.path.exists(variant_filename(filename, len(variants))): 
+        variants.append(variant_filename(filename, len(variants)))
+    return variants
+
+def write_variant(source: str, dest: str, quality: int) -> int: 
+    """ Re-encodes every frame of source at JPEG quality into dest. Returns the frame count."""
+    from PIL import Image
+
+    index = FrameIndex.for_file(source)
+    temp = dest + ".tmp"
+    with open(source, "rb") as file, open(temp, "wb") as out: 
+        for frame in range(len(index)): 
+            file.seek(index.offset(frame))
+            image = Image.open(io.BytesIO(file.read(index.length(frame))))
+            encoded = io.BytesIO()
+            image.convert("RGB").save(encoded, "JPEG", quality=quality)
+            data = encoded.getvalue()
+            if len(data) > MAX_FRAME_SIZE: 
+                raise ValueError("frame %d is %d bytes at quality %d, over the %d-digit length prefix" 
+                                 % (frame, len(data), quality, LENGTH_PREFIX_SIZE))
+            out.write(b"%05d" % len(data))
+            out.write(data)
+    os.replace(temp, dest)
+    return len(index)
+
+def main(argv=None) -> None: 
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) < 2: 
+        raise SystemExit("usage: VariantWriter.py FILE QUALITY [QUALITY...]")
+    source = argv[0]
+    for level, quality in enumerate(argv[1:], 1): 
+        dest = variant_filename(source, level)
+        frames = write_variant(source, dest, int(quality))
+        print("Wrote %s: %d frames at quality %s" % (dest, frames, quality))
+
+if __name__ == "__main__": 
+    main()
@@ -4,19 +4,49 @@ Purpose:
 
 Separate class for logic related to opening the video cache.
 
+Random access (seek, frame_count, duration) goes through a FrameIndex,
+which is loaded or built the first time one of those methods is called.
+
+When a FrameStore is given, the stream reads from the store's shared
+memory map instead of its own file handle, and nextFrame() returns 
+zero-copy memoryview slices rather than bytes, and hints holds the 
+file's HintTrack if it has one. 
+
 """
+from FrameIndex import FrameIndex, LENGTH_PREFIX_SIZE
+
 class VideoStream:
-	def __init__(self, filename):
+	DEFAULT_FRAME_RATE = 20
+
+	def __init__(self, filename, frameRate=DEFAULT_FRAME_RATE, store=None):
 		self.filename = filename
+		self.frameRate = frameRate
+		self.store = store
+		self.media = None
+		self.file = None
 
 		try:
-			self.file = open(filename, 'rb')
+			if store is not None:
+				self.media = store.acquire(filename)
+			else:
+				self.file = open(filename, 'rb')
 		except:
 			raise IOError
 		self.frameNum = 0
+		self.index = None if self.media is None else self.media.index
+		# Prebuilt packetization, only through the frame store
+		self.hints = None if self.media is None else self.media.hints
 		
 	def nextFrame(self):
 		"""Get next frame."""
+		if self.store is not None:
+			media = self.media
+			if media is None or self.frameNum >= len(media):
+				return None
+			data = media.frame(self.frameNum)
+			self.frameNum += 1
+			return data
+
 		data = self.file.read(5) # Get the framelength from the first 5 bits
 		if data: 
 			framelength = int(data)
@@ -30,4 +60,44 @@ class VideoStream:
 	def frameNbr(self):
 		"""Get frame number."""
 		return self.frameNum
+
+	def getIndex(self):
+		"""Get the frame index, loading or building it on first use."""
+		if self.index is None:
+			self.index = FrameIndex.for_file(self.filename)
+		return self.index
+
+	def seek(self, frame):
+		"""Position the stream so nextFrame() returns frame (0-based) next."""
+		index = self.getIndex()
+		if not 0 <= frame <= len(index):
+			raise ValueError("frame %d outside 0..%d" % (frame, len(index)))
+
+		# The shared mapping is addressed by frameNum alone
+		if self.file is not None:
+			if frame == len(index):
+				self.file.seek(0, 2)
+			else:
+				self.file.seek(index.offset(frame) - LENGTH_PREFIX_SIZE)
+		self.frameNum = frame
+
+	def skip(self, count):
+		"""Skip over the next count frames without reading them."""
+		self.seek(min(self.frameNum + count, self.frame_count()))
+
+	def frame_count(self):
+		"""Get the number of frames in the file."""
+		return len(self.getIndex())
+
+	def duration(self):
+		"""Get the playing time of the file in seconds."""
+		return self.frame_count() / self.frameRate
+
+	def close(self):
+		"""Close the media file, or hand the shared mapping back to the store."""
+		if self.media is not None:
+			self.store.release(self.media)
+			self.media = None
+		elif self.file is not None:
+			self.file.close()
 	
@@ -0,0 +1,245 @@
+"""
+Purpose: 
+
+XorFec adds RFC 5109-style XOR parity forward error correction to the 
+RTP stream. The server's FecEncoder XORs every group of media packets 
+into one FEC packet; the client's FecDecoder rebuilds a single lost 
+packet of a group from the FEC packet and the packets that did arrive, 
+before reassembly, without waiting a round trip for a retransmission. 
+
+Groups are interleaved: with group size G and depth D, a block of G*D 
+consecutive packets forms D groups, group j protecting packets j, j+D, 
+j+2D, ... A burst of up to D consecutive losses then hits D different 
+groups, each of which can still be repaired. The overhead is one FEC 
+packet per G media packets. 
+
+FEC packets share the media stream's SSRC and port but carry their own 
+payload type and sequence numbers. After the RTP header comes the FEC 
+header, then a level 0 header with a 48-bit mask (L=1), then the parity 
+payload: 
+
+ 0                   1                   2                   3
+ 0 1 2 3 4 5 6 7 8 9 0 1 2 3 4 5 6 7 8 9 0 1 2 3 4 5 6 7 8 9 0 1
++-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
+|E|L|P|X|  CC   |M| PT recovery |            SN base            |
++-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
+|                          TS recovery                          |
++-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
+|        length recovery        |       Protection Length       |
++-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
+|                    mask (48 bits, bit 0 = SN base)            |
++-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
+
+FEC is negotiated at SETUP: the client asks with an X-FEC header such as
+"xor;group=5;depth=2;pt=127" and the server echoes it when it accepts. 
+"""
+import struct
+from collections import OrderedDict
+
+from RtpPacket import HEADER_SIZE, HEADER_STRUCT, pack_header
+
+FEC_PT = 127
+FEC_HEADER_NAME = "X-FEC"
+FEC_HEADER = struct.Struct("!BBHIHH")   # E|L|P|X|CC, M|PT, SN base, TS, length, protection length
+MASK_BITS = 48
+FEC_PACKET_HEADER_SIZE = HEADER_SIZE + FEC_HEADER.size + MASK_BITS // 8
+MAX_GROUP_SIZE = MASK_BITS
+
+def check_params(groupSize: int, depth: int) -> None: 
+    if groupSize < 2 or depth < 1 or (groupSize - 1) * depth >= MASK_BITS: 
+        raise ValueError("FEC group size %d and depth %d do not fit a %d-bit mask" 
+                         % (groupSize, depth, MASK_BITS))
+
+def format_fec_params(groupSize: int, depth: int, payloadType: int = FEC_PT) -> str: 
+    """ Returns the X-FEC header value for the given parameters."""
+    return "xor;group=%d;depth=%d;pt=%d" % (groupSize, depth, payloadType)
+
+def parse_fec_params(value: str) -> tuple: 
+    """ Returns (groupSize, depth, payloadType) from an X-FEC header value, or raises ValueError."""
+    scheme, *params = [param.strip() for param in value.split(";")]
+    if scheme != "xor": 
+        raise ValueError("unsupported FEC scheme %r" % scheme)
+    values = {"depth": 1, "pt": FEC_PT}
+    for param in params: 
+        name, _, number = param.partition("=")
+        values[name] = int(number)
+    if "group" not in values: 
+        raise ValueError("FEC group size missing")
+    if not 96 <= values["pt"] <= 127: 
+        raise ValueError("FEC payload type must be dynamic (96-127)")
+    check_params(values["group"], values["depth"])
+    return values["group"], values["depth"], values["pt"]
+
+class ParityAccumulator: 
+    """ XOR of the recovery fields of a set of RTP packets."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None: 
+        self.bits = 0        # P|X|CC and M|PT
+        self.timestamp = 0
+        self.length = 0
+        self.parity = 0      # payloads as one big-endian integer, zero padded at the end
+        self.size = 0        # protection length
+        self.count = 0
+        self.base = None
+        self.mask = 0
+
+    def add(self, header, payload) -> None: 
+        """ Adds an RTP packet given as its 12-byte header and its payload."""
+        first, second, _, timestamp, _ = HEADER_STRUCT.unpack_from(header, 0)
+        self.bits ^= (first & 0x3F) << 8 | second
+        self.timestamp ^= timestamp
+        self.length ^= len(payload)
+        if len(payload) > self.size: 
+            self.parity <<= 8 * (len(payload) - self.size)
+            self.size = len(payload)
+        self.parity ^= int.from_bytes(payload, "big") << 8 * (self.size - len(payload))
+        self.count += 1
+
+class FecEncoder: 
+
+    def __init__(self, groupSize: int, depth: int = 1, payloadType: int = FEC_PT, seq_num: int = 0):
+        check_params(groupSize, depth)
+        self.groupSize = groupSize
+        self.depth = depth
+        self.payloadType = payloadType
+        self.seq_num = seq_num & 0xFFFF
+        self.groups = [ParityAccumulator() for _ in range(depth)]
+        self.position = 0
+
+    def reset(self) -> None: 
+        """ Drops partial groups, e.g. on PAUSE, so no group spans a gap in the stream."""
+        for group in self.groups: 
+            group.reset()
+        self.position = 0
+
+    def add(self, header, payload) -> list: 
+        """ 
+            Adds one sent media packet (RTP header first in header, as from 
+            RtpPacketizer) and returns the FEC packets, as (header, payload) 
+            pairs, of any group it completes. 
+        """
+        header = memoryview(header)
+        group = self.groups[self.position]
+        self.position = (self.position + 1) % self.depth
+
+        seq_num = (header[2] << 8) | header[3]
+        if group.base is None: 
+            group.base = seq_num
+        group.mask |= 1 << (MASK_BITS - 1 - ((seq_num - group.base) & 0xFFFF))
+        # The RTP payload is everything after the fixed header
+        group.add(header[:HEADER_SIZE], bytes(header[HEADER_SIZE:]) + bytes(payload))
+        if group.count < self.groupSize: 
+            return []
+        packet = self.build(group, HEADER_STRUCT.unpack_from(header, 0)[4], 
+                            HEADER_STRUCT.unpack_from(header, 0)[3])
+        group.reset()
+        return [packet]
+
+    def build(self, group: ParityAccumulator, ssrc: int, timestamp: int) -> tuple: 
+        fecHeader = bytearray(FEC_PACKET_HEADER_SIZE)
+        pack_header(fecHeader, 0, 2, 0, 0, 0, 0, self.payloadType, self.seq_num, timestamp, ssrc)
+        self.seq_num = (self.seq_num + 1) & 0xFFFF
+        # E=0, L=1 (48-bit mask)
+        FEC_HEADER.pack_into(fecHeader, HEADER_SIZE, 0x40 | group.bits >> 8, group.bits & 0xFF, 
+                             group.base, group.timestamp, group.length, group.size)
+        fecHeader[HEADER_SIZE + FEC_HEADER.size:] = group.mask.to_bytes(MASK_BITS // 8, "big")
+        return fecHeader, group.parity.to_bytes(group.size, "big")
+
+class FecDecoder: 
+    """
+        Keeps the recently received media packets of one stream and 
+        rebuilds a missing one when an FEC packet leaves exactly one packet
+        of its group missing. FEC packets that are still missing more than
+        one packet wait (in case a packet arrives late) until they are 
+        pushed out by newer ones. 
+    """
+
+    def __init__(self, payloadType: int = FEC_PT, history: int = 1024, pending: int = 64):
+        self.payloadType = payloadType
+        self.history = history
+        self.maxPending = pending
+        self.packets = OrderedDict()
+        self.pending = []
+        self.recovered = 0
+        self.unrecoverable = 0
+
+    def is_fec(self, data) -> bool: 
+        return len(data) > 1 and data[1] & 0x7F == self.payloadType
+
+    def add_media(self, data) -> list: 
+        """ 
+            Records a received media packet. Returns packets it lets us 
+            recover from waiting FEC packets (usually none). 
+        """
+        seq_num = (data[2] << 8) | data[3]
+        self.packets[seq_num] = data
+        self.packets.move_to_end(seq_num)
+        if len(self.packets) > self.history: 
+            self.packets.popitem(last=False)
+        return self.retry()
+
+    def add_fec(self, data) -> list: 
+        """ Processes a received FEC packet. Returns the media packets it recovers."""
+        if len(data) < FEC_PACKET_HEADER_SIZE: 
+            return []
+        protected = self.protected(data)
+        missing = [seq for seq in protected if seq not in self.packets]
+        if not missing: 
+            return []
+        if len(missing) == 1: 
+            return self.recover(data, protected, missing[0])
+        self.pending.append((data, protected))
+        if len(self.pending) > self.maxPending: 
+            self.pending.pop(0)
+            self.unrecoverable += 1
+        return []
+
+    def retry(self) -> list: 
+        recovered = []
+        for entry in list(self.pending): 
+            data, protected = entry
+            missing = [seq for seq in protected if seq not in self.packets]
+            if len(missing) <= 1: 
+                self.pending.remove(entry)
+                if missing: 
+                    recovered.extend(self.recover(data, protected, missing[0]))
+        return recovered
+
+    def protected(self, data) -> list: 
+        base = struct.unpack_from("!H", data, HEADER_SIZE + 2)[0]
+        mask = int.from_bytes(data[HEADER_SIZE + FEC_HEADER.size:FEC_PACKET_HEADER_SIZE], "big")
+        return [(base + offset) & 0xFFFF for offset in range(MASK_BITS) 
+                if mask >> (MASK_BITS - 1 - offset) & 1]
+
+    def recover(self, data, protected: list, seq_num: int) -> list: 
+        """ 
+            Rebuilds the packet seq_num of the group protected by FEC packet
+            data. Returns it in a list, or an empty list if the group does 
+            not add up (e.g. the history held a packet from another cycle). 
+        """
+        first, second, _, timestamp, length, size = FEC_HEADER.unpack_from(data, HEADER_SIZE)
+        group = ParityAccumulator()
+        group.bits = (first & 0x3F) << 8 | second
+        group.timestamp = timestamp
+        group.length = length
+        group.size = size
+        group.parity = int.from_bytes(data[FEC_PACKET_HEADER_SIZE:], "big")
+        for seq in protected: 
+            if seq != seq_num: 
+                packet = self.packets[seq]
+                group.add(packet[:HEADER_SIZE], packet[HEADER_SIZE:])
+        if group.size != size or group.length > size: 
+            self.unrecoverable += 1
+            return []
+
+        ssrc = HEADER_STRUCT.unpack_from(data, 0)[4]
+        header = bytearray(HEADER_SIZE)
+        HEADER_STRUCT.pack_into(header, 0, 0x80 | group.bits >> 8, group.bits & 0xFF, 
+                                seq_num, group.timestamp, ssrc)
+        packet = bytes(header) + group.parity.to_bytes(size, "big")[:group.length]
+        self.packets[seq_num] = packet
+        self.recovered += 1
+        return [packet]
@@ -0,0 +1,215 @@
+'''
+tests AsyncServer.py: a whole RTSP session over localhost, RTP from the shared socket and session cleanup
+
+Run from src/:  python -m pytest tests/async_server_tests.py
+'''
+import asyncio
+import errno
+import os
+import socket
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "main"))
+
+from AsyncServer import AsyncServer, AsyncSession
+from RtspClient import RtspClient
+from RtspCodec import RtspParser
+from RtpPacket import RtpPacket
+
+FRAME_RATE = 50
+
+
+@pytest.fixture
+def movie(write_movie):
+    # Long enough to keep playing through the whole session
+    return write_movie(b"\xff\xd8" + bytes([i]) * 500 + b"\xff\xd9" for i in range(200))
+
+
+class Connection:
+    """An RtspClient talking to the server over an asyncio stream, with its RTP socket."""
+
+    def __init__(self, movie):
+        self.rtp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.rtp.bind(("127.0.0.1", 0))
+        self.rtp.setblocking(False)
+        self.client = RtspClient(movie, self.rtp.getsockname()[1])
+        self.parser = RtspParser()
+
+    async def open(self, address):
+        self.reader, self.writer = await asyncio.open_connection(*address)
+
+    async def request(self, code):
+        self.writer.write(self.client.makeRequest(code).encode())
+        while True:
+            messages = self.parser.feed(await asyncio.wait_for(self.reader.read(4096), 5.0))
+            if messages:
+                return self.client.processReply(messages[0])
+
+    async def receive(self, timeout=1.0):
+        """Returns (packet, sender address) of the next RTP packet, or None if none comes in time."""
+        loop = asyncio.get_running_loop()
+        try:
+            data, address = await asyncio.wait_for(loop.sock_recvfrom(self.rtp, 65536), timeout)
+        except asyncio.TimeoutError:
+            return None
+        packet = RtpPacket()
+        packet.decode(data)
+        return packet, address
+
+    async def drain(self):
+        while await self.receive(0.1) is not None:
+            pass
+
+    def close(self):
+        self.writer.close()
+        self.rtp.close()
+
+
+async def until(condition, timeout=2.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not condition() and loop.time() < deadline:
+        await asyncio.sleep(0.01)
+    return condition()
+
+
+async def session_cycle(movie):
+    server = AsyncServer("127.0.0.1", 0, {movie: FRAME_RATE})
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen()
+    serving = asyncio.ensure_future(server.serve(listener))
+    connection = Connection(movie)
+    try:
+        await connection.open(listener.getsockname())
+        assert await until(lambda: len(server.sessions) == 1)
+
+        assert await connection.request(RtspClient.SETUP) == RtspClient.SETUP
+        assert connection.client.serverPorts[0] == server.rtpSocket.getsockname()[1]
+        assert await connection.request(RtspClient.PLAY) == RtspClient.PLAY
+        packet, address = await connection.receive()
+        # Media leaves through the one RTP socket every session shares
+        assert address[1] == server.rtpSocket.getsockname()[1]
+        assert packet.get_ssrc() in server.rtcpSessions
+
+        assert await connection.request(RtspClient.PAUSE) == RtspClient.PAUSE
+        await connection.drain()
+        assert await connection.receive(0.2) is None
+        assert await connection.request(RtspClient.PLAY) == RtspClient.PLAY
+        assert await connection.receive() is not None
+
+        assert await connection.request(RtspClient.TEARDOWN) == RtspClient.TEARDOWN
+        assert not server.rtcpSessions
+        await connection.drain()
+        assert await connection.receive(0.2) is None
+
+        # A client that goes away while playing is cleaned up as well
+        dropped = Connection(movie)
+        await dropped.open(listener.getsockname())
+        assert await dropped.request(RtspClient.SETUP) == RtspClient.SETUP
+        assert await dropped.request(RtspClient.PLAY) == RtspClient.PLAY
+        assert await dropped.receive() is not None
+        assert len(server.sessions) == 2
+        dropped.close()
+        connection.close()
+        assert await until(lambda: len(server.sessions) == 0)
+        assert not server.rtcpSessions
+    finally:
+        serving.cancel()
+        await asyncio.gather(serving, return_exceptions=True)
+
+
+def test_setup_play_pause_teardown_and_disconnect(movie):
+    asyncio.run(session_cycle(movie))
+
+
+class BlockingSocket:
+    """Takes datagrams until blocked is set."""
+
+    def __init__(self):
+        self.sent = []
+        self.blocked = False
+
+    def sendmsg(self, buffers, ancdata, flags, address):
+        if self.blocked:
+            raise BlockingIOError()
+        self.sent.append(b"".join(bytes(buffer) for buffer in buffers))
+
+
+class QueueingTransport:
+    """Holds datagrams until drained, like a DatagramTransport whose socket would block."""
+
+    def __init__(self):
+        self.queue = []
+
+    def sendto(self, data, address):
+        self.queue.append(data)
+
+    def get_write_buffer_size(self):
+        return sum(len(data) for data in self.queue)
+
+
+def test_packets_stay_in_order_once_the_transport_queues():
+    server = AsyncServer("127.0.0.1", 0)
+    server.rtpSocket = BlockingSocket()
+    server.rtpTransport = QueueingTransport()
+    address = ("127.0.0.1", 5004)
+    server.sendRtp(b"h", b"1", address)
+    server.rtpSocket.blocked = True
+    server.sendRtp(b"h", b"2", address)
+    # The socket could take the rest again, but they would overtake packet 2
+    server.rtpSocket.blocked = False
+    server.sendRtp(b"h", b"3", address)
+    server.sendRtp(b"h", b"4", address)
+    assert server.rtpSocket.sent == [b"h1"]
+    assert server.rtpTransport.queue == [b"h2", b"h3", b"h4"]
+    # Once the queue has drained, packets go straight to the socket again
+    server.rtpTransport.queue.clear()
+    server.sendRtp(b"h", b"5", address)
+    assert server.rtpSocket.sent == [b"h1", b"h5"]
+
+
+class FailingSocket:
+
+    def sendmsg(self, buffers, ancdata, flags, address):
+        raise OSError(errno.ENOBUFS, "No buffer space available")
+
+
+def test_send_errors_drop_the_packet():
+    server = AsyncServer("127.0.0.1", 0)
+    server.rtpSocket = FailingSocket()
+    server.rtpTransport = QueueingTransport()
+    server.sendRtp(b"h", b"1", ("127.0.0.1", 5004))
+    assert server.rtpTransport.queue == []
+
+
+class Writer:
+
+    def get_extra_info(self, name):
+        return ("127.0.0.1", 5000)
+
+
+async def stream_past_a_bad_frame():
+    server = AsyncServer("127.0.0.1", 0)
+    session = AsyncSession(server, None, Writer())
+    session.frameRate = FRAME_RATE
+    session.clientInfo['rtpPort'] = 5004
+    reads = []
+
+    def nextPackets(skip=0, timer=None):
+        reads.append(skip)
+        if len(reads) == 1:
+            raise RuntimeError("bad frame")
+        return []
+    session.nextPackets = nextPackets
+    streaming = asyncio.ensure_future(session.streamRtp())
+    assert await until(lambda: len(reads) >= 3)
+    assert not streaming.done()
+    streaming.cancel()
+    await asyncio.gather(streaming, return_exceptions=True)
+
+
+def test_stream_goes_on_after_a_bad_frame():
+    asyncio.run(stream_past_a_bad_frame())
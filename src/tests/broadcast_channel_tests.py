@@ -0,0 +1,104 @@
+'''
+tests BroadcastChannel.py
+
+Run from src/:  python -m pytest tests/broadcast_channel_tests.py
+'''
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "main"))
+
+from BroadcastChannel import ChannelRegistry
+from FrameStore import FrameStore
+from RtpPacket import RtpPacket
+from RtpPacketizer import RtpPacketizer
+
+FRAMES = [bytes([i]) * 3000 for i in range(4)]
+
+
+class FakeScheduler:
+    def __init__(self):
+        self.paced = []
+
+    def add(self, session, frameRate):
+        self.paced.append(session)
+
+    def remove(self, session):
+        self.paced.remove(session)
+
+
+class FakeSession:
+    def __init__(self, ssrc, seq_num, thinning=1):
+        self.packetizer = RtpPacketizer(ssrc=ssrc, seq_num=seq_num)
+        self.thinning = thinning
+        self.offered = 0
+        self.received = []
+
+    def wantsFrame(self):
+        self.offered += 1
+        return self.offered % self.thinning == 0
+
+    def sendPackets(self, packets, timer=None):
+        for header, payload in packets:
+            packet = RtpPacket()
+            packet.decode(bytes(header) + bytes(payload))
+            self.received.append(packet)
+
+
+def make_channel(write_movie, registry, session):
+    return registry.join(write_movie(FRAMES), 20, session)
+
+
+def test_fan_out_patches_seq_and_ssrc_per_session(write_movie):
+    registry = ChannelRegistry(FrameStore(), FakeScheduler())
+    first, second = FakeSession(0x1111, 100), FakeSession(0x2222, 65534)
+    channel = make_channel(write_movie, registry, first)
+    channel.subscribe(second)
+
+    channel.sendFrame()
+    assert [p.get_seq_num() for p in first.received] == [100, 101, 102]
+    assert [p.get_seq_num() for p in second.received] == [65534, 65535, 0]
+    assert {p.get_timestamp() for p in first.received + second.received} == {4500}
+    assert b"".join(p.get_payload()[8:] for p in second.received) == FRAMES[0]
+    assert bytes(first.received[0].header[8:12]) == b"\x00\x00\x11\x11"
+    assert bytes(second.received[0].header[8:12]) == b"\x00\x00\x22\x22"
+
+
+def test_late_joiner_starts_at_current_frame(write_movie):
+    registry = ChannelRegistry(FrameStore(), FakeScheduler())
+    first, late = FakeSession(1, 0), FakeSession(2, 0)
+    channel = make_channel(write_movie, registry, first)
+    channel.sendFrame()
+    channel.sendFrame()
+    channel.subscribe(late)
+    channel.sendFrame()
+
+    assert late.received[0].get_payload()[8:] == FRAMES[2][:len(late.received[0].get_payload()) - 8]
+    assert late.packetizer.seq_num == 3
+
+
+def test_channel_closes_when_last_viewer_leaves(write_movie):
+    registry = ChannelRegistry(FrameStore(), FakeScheduler())
+    first, second = FakeSession(1, 0), FakeSession(2, 0)
+    channel = make_channel(write_movie, registry, first)
+    registry.join(channel.filename, 20, second)
+    assert len(registry) == 1
+
+    registry.leave(channel, first)
+    assert len(registry) == 1
+    registry.leave(channel, second)
+    assert len(registry) == 0
+
+
+def test_thinned_session_skips_frames_without_seq_gaps(write_movie):
+    registry = ChannelRegistry(FrameStore(), FakeScheduler())
+    full, thinned = FakeSession(0x1111, 0), FakeSession(0x2222, 0, thinning=2)
+    channel = make_channel(write_movie, registry, full)
+    channel.subscribe(thinned)
+
+    for _ in range(4):
+        channel.sendFrame()
+    assert len({p.get_timestamp() for p in full.received}) == 4
+    assert {p.get_timestamp() for p in thinned.received} == {9000, 18000}
+    seqs = [p.get_seq_num() for p in thinned.received]
+    assert seqs == list(range(len(seqs)))
@@ -0,0 +1,31 @@
+'''
+fixtures shared by the tests: synthetic MJPEG movies in the tmp_path of a test
+
+Picked up by pytest for every module in tests/.
+'''
+import os
+
+import pytest
+
+FRAMES = 100
+
+
+@pytest.fixture
+def write_movie(tmp_path):
+    """
+    Returns write(frames, name="movie.Mjpeg"), which writes frames as an MJPEG file, each after
+    its 5 digit length, to name in tmp_path (or to name itself if it is absolute) and returns the path.
+    """
+    def write(frames, name="movie.Mjpeg"):
+        path = os.path.join(str(tmp_path), str(name))
+        with open(path, "wb") as file:
+            for frame in frames:
+                file.write(b"%05d" % len(frame) + frame)
+        return path
+    return write
+
+
+@pytest.fixture
+def movie(write_movie):
+    """A movie of FRAMES frames, frame i filled with byte i between the JPEG markers."""
+    return write_movie(b"\xff\xd8" + bytes([i]) * 100 + b"\xff\xd9" for i in range(FRAMES))
@@ -0,0 +1,61 @@
+'''
+tests FrameDecoder.py, the client's in-memory JPEG decode worker
+
+Run from src/:  python -m pytest tests/frame_decoder_tests.py
+'''
+import io
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "main"))
+
+from PIL import Image
+
+from FrameDecoder import FrameDecoder
+
+
+def jpeg(size=(320, 240), color=(200, 40, 40)):
+    out = io.BytesIO()
+    Image.new("RGB", size, color).save(out, "JPEG")
+    return out.getvalue()
+
+
+def test_decode_from_memory_at_full_size():
+    decoder = FrameDecoder(None)
+    image = decoder.decode(jpeg())
+    assert image.size == (320, 240)
+
+
+def test_draft_mode_scales_down_to_target():
+    decoder = FrameDecoder(None, size=(80, 80))
+    image = decoder.decode(jpeg())
+    assert image.width <= 80 and image.height <= 80
+    # Aspect ratio is kept
+    assert abs(image.width / image.height - 320 / 240) < 0.1
+
+
+def test_full_queue_drops_oldest_frame():
+    decoder = FrameDecoder(None, queueSize=2)
+    for timestamp in range(5):
+        decoder.submit(timestamp, b"frame")
+    assert decoder.dropped == 3
+    assert [decoder.queue.get_nowait()[0] for _ in range(2)] == [3, 4]
+
+
+def test_worker_delivers_frames_and_skips_corrupt_ones():
+    shown = []
+    done = threading.Event()
+
+    def onFrame(image, timestamp, received):
+        shown.append((timestamp, image.size))
+        done.set()
+
+    decoder = FrameDecoder(onFrame, queueSize=4)
+    decoder.submit(1, b"not a jpeg")
+    decoder.submit(2, jpeg((64, 48)))
+    decoder.start()
+    assert done.wait(5)
+    decoder.stop()
+    assert shown == [(2, (64, 48))]
+    assert decoder.errors == 1
@@ -0,0 +1,63 @@
+'''
+tests FrameIndex.py and VideoStream random access
+
+Run from src/:  python -m pytest tests/frame_index_tests.py
+'''
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "main"))
+
+from FrameIndex import FrameIndex, INDEX_EXT
+from VideoStream import VideoStream
+
+FRAMES = [bytes([i]) * (100 + 37 * i) for i in range(10)]
+
+
+@pytest.fixture
+def movie(write_movie):
+    return write_movie(FRAMES)
+
+
+def test_index_matches_frames(movie):
+    index = FrameIndex.build(movie)
+    assert len(index) == len(FRAMES)
+    with open(movie, "rb") as file:
+        data = file.read()
+    for i, frame in enumerate(FRAMES):
+        assert data[index.offset(i):index.offset(i) + index.length(i)] == frame
+
+
+def test_truncated_trailing_frame_is_ignored(movie):
+    with open(movie, "ab") as file:
+        file.write(b"00500" + b"x" * 10)
+    assert len(FrameIndex.build(movie)) == len(FRAMES)
+
+
+def test_sidecar_reused_until_file_changes(movie):
+    first = FrameIndex.for_file(movie)
+    assert os.path.exists(movie + INDEX_EXT)
+    assert not [name for name in os.listdir(os.path.dirname(movie)) if name.endswith(".tmp")]
+    assert list(FrameIndex.load(movie + INDEX_EXT).offsets) == list(first.offsets)
+
+    with open(movie, "ab") as file:
+        file.write(b"00003abc")
+    assert len(FrameIndex.for_file(movie)) == len(FRAMES) + 1
+
+
+def test_video_stream_seek(movie):
+    stream = VideoStream(movie, frameRate=5)
+    assert stream.frame_count() == 10
+    assert stream.duration() == 2.0
+
+    stream.seek(7)
+    assert stream.nextFrame() == FRAMES[7]
+    assert stream.frameNbr() == 8
+    stream.seek(0)
+    assert stream.nextFrame() == FRAMES[0]
+    stream.seek(10)
+    assert not stream.nextFrame()
+    with pytest.raises(ValueError):
+        stream.seek(11)
@@ -0,0 +1,62 @@
+'''
+tests FrameStore.py and VideoStream reading through it
+
+Run from src/:  python -m pytest tests/frame_store_tests.py
+'''
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "main"))
+
+from FrameStore import FrameStore
+from VideoStream import VideoStream
+
+FRAMES = [bytes([65 + i]) * (50 + i) for i in range(5)]
+
+
+def test_sessions_share_one_mapping(write_movie):
+    movie = write_movie(FRAMES)
+    store = FrameStore()
+    first = VideoStream(movie, store=store)
+    second = VideoStream(movie, store=store)
+
+    assert first.media is second.media
+    assert store.stats() == {"active": 1, "idle": 0, "refs": 2}
+    frame = first.nextFrame()
+    assert isinstance(frame, memoryview)
+    assert bytes(frame) == FRAMES[0]
+    second.seek(3)
+    assert bytes(second.nextFrame()) == FRAMES[3]
+    assert second.frameNbr() == 4
+
+    first.close()
+    second.close()
+    assert store.stats() == {"active": 0, "idle": 1, "refs": 0}
+    assert first.nextFrame() is None
+
+
+def test_empty_files_are_shared_too(write_movie):
+    movie = write_movie([])
+    store = FrameStore()
+    first = store.acquire(movie)
+    assert len(first) == 0
+    assert store.acquire(movie) is first
+    assert store.stats() == {"active": 1, "idle": 0, "refs": 2}
+    store.release(first)
+    store.release(first)
+    assert store.acquire(movie) is first
+
+
+def test_idle_mappings_are_evicted_lru(write_movie):
+    store = FrameStore(max_idle=1)
+    movies = [write_movie(FRAMES, "m%d.Mjpeg" % i) for i in range(3)]
+    medias = [store.acquire(movie) for movie in movies]
+    held = medias[0].frame(1)
+    for media in medias:
+        store.release(media)
+
+    assert store.stats()["idle"] == 1
+    # A view handed out before eviction stays readable.
+    assert bytes(held) == FRAMES[1]
+    again = store.acquire(movies[2])
+    assert again is medias[2]
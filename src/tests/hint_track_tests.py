@@ -0,0 +1,98 @@
+'''
+tests HintTrack.py and sending hinted frames from RtpPacketizer and ServerWorker
+
+Run from src/:  python -m pytest tests/hint_track_tests.py
+'''
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "main"))
+
+from HintTrack import HintTrack, HINT_EXT, main
+from RtpPacketizer import RtpPacketizer, CLOCK_RATE
+from FrameStore import FrameStore
+from ServerWorker import ServerWorker
+from VideoStream import VideoStream
+
+
+@pytest.fixture
+def movie(write_movie):
+    rng = random.Random(1)
+    return write_movie(b"\xff\xd8" + rng.randbytes(size) + b"\xff\xd9" for size in (10, 1380, 1381, 5000, 20000, 3))
+
+
+def frames(path):
+    stream = VideoStream(path)
+    while True:
+        data = stream.nextFrame()
+        if not data:
+            break
+        yield data
+    stream.close()
+
+
+def as_bytes(packets):
+    return [(bytes(header), bytes(fragment)) for header, fragment in packets]
+
+
+def test_hinted_packets_match_packetize(movie):
+    track = HintTrack.build(movie)
+    plain = RtpPacketizer(ssrc=0xDEADBEEF, seq_num=65530, timestamp_offset=0xFFFFFF00)
+    hinted = RtpPacketizer(ssrc=0xDEADBEEF, seq_num=65530, timestamp_offset=0xFFFFFF00)
+    for frame, data in enumerate(frames(movie)):
+        timestamp = track.timestamp(frame)
+        assert timestamp == int((frame + 1) * CLOCK_RATE / 20)
+        expected = as_bytes(plain.packetize(data, timestamp))
+        assert as_bytes(hinted.packetize_hinted(track.templates(frame), track.fragments(frame, data),
+                                                timestamp)) == expected
+    assert hinted.seq_num == plain.seq_num
+
+
+def test_save_load_and_stale_tracks(movie):
+    main([movie, "--frame-rate", "25", "--mtu", "1000"])
+    track = HintTrack.for_file(movie)
+    built = HintTrack.build(movie, 25, 1000)
+    assert (track.frameRate, track.mtu, len(track)) == (25, 1000, 6)
+    assert list(track.firsts) == list(built.firsts) and list(track.timing) == list(built.timing)
+    assert bytes(track.templates(4)) == bytes(built.templates(4))
+    track.close()
+
+    with open(movie, "ab") as file:
+        file.write(b"00004\xff\xd8\xff\xd9")
+    assert HintTrack.for_file(movie) is None
+    with open(movie + HINT_EXT, "r+b") as file:
+        file.write(b"XXXX")
+    assert HintTrack.load(movie + HINT_EXT) is None
+    assert HintTrack.for_file(movie + ".missing") is None
+
+
+def worker_for(movie, store, frameRate=20):
+    worker = ServerWorker({})
+    worker.packetizer = RtpPacketizer(ssrc=7, seq_num=100, timestamp_offset=1000)
+    worker.frameRate = frameRate
+    stream = VideoStream(movie, frameRate, store=store)
+    worker.clientInfo['videoStream'] = stream
+    worker.hints = worker.usableHints(stream)
+    worker.state = worker.PLAYING
+    return worker
+
+
+def test_server_sends_the_same_packets_hinted(movie):
+    plain = worker_for(movie, FrameStore())
+    HintTrack.build(movie).save(movie + HINT_EXT)
+    hinted = worker_for(movie, FrameStore())
+    assert plain.hints is None and hinted.hints is not None
+    # Seeking and trick play keep the same timestamps with the timing table
+    for worker in (plain, hinted):
+        worker.seek("npt=0.05-", movie, 2)
+    for _ in range(3):
+        assert as_bytes(hinted.nextPackets()) == as_bytes(plain.nextPackets())
+
+
+def test_track_for_another_frame_rate_is_not_used(movie):
+    HintTrack.build(movie, frameRate=30).save(movie + HINT_EXT)
+    assert worker_for(movie, FrameStore()).hints is None
+    assert worker_for(movie, FrameStore(), frameRate=30).hints is not None
@@ -0,0 +1,79 @@
+'''
+tests JitterBuffer.py, the client's reordering playout buffer
+
+Run from src/:  python -m pytest tests/jitter_buffer_tests.py
+'''
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "main"))
+
+import pytest
+
+from JitterBuffer import JitterBuffer
+
+RATE = 90000
+STEP = RATE // 20   # 20 fps
+
+
+def make(minDelay=0.1, maxDelay=0.5):
+    return JitterBuffer(minDelay, maxDelay, clock=lambda: 0.0)
+
+
+def test_reorders_and_plays_at_timestamp_plus_delay():
+    jb = make()
+    jb.push(0, b"a", arrival=0.0)
+    jb.push(2 * STEP, b"c", arrival=0.11)
+    jb.push(STEP, b"b", arrival=0.12)
+    assert jb.pop(0.09) is None
+    assert jb.pop(0.1) == (0, b"a")
+    assert jb.pop(0.149) is None
+    assert jb.pop(0.151) == (STEP, b"b")
+    assert jb.pop(1.0) == (2 * STEP, b"c")
+
+
+def test_late_and_duplicate_frames_are_dropped():
+    jb = make()
+    jb.push(0, b"a", arrival=0.0)
+    jb.push(STEP, b"b", arrival=0.05)
+    assert not jb.push(STEP, b"b", arrival=0.06)
+    assert jb.pop(1.0) == (0, b"a")
+    assert jb.pop(1.0) == (STEP, b"b")
+    assert not jb.push(0, b"a", arrival=1.0)
+    stats = jb.stats()
+    assert stats["duplicates"] == 1 and stats["late"] == 1 and stats["played"] == 2
+
+
+def test_underrun_counted_once_per_gap():
+    jb = make()
+    jb.push(0, b"a", arrival=0.0)
+    jb.push(STEP, b"b", arrival=0.05)
+    jb.pop(1.0)
+    jb.pop(1.0)
+    assert jb.pop(1.0) is None and jb.pop(2.0) is None
+    assert jb.stats()["underruns"] == 1
+
+
+def test_delay_adapts_to_jitter_within_bounds():
+    jb = make(minDelay=0.02, maxDelay=0.3)
+    assert jb.delay() == 0.02
+    for i in range(200):
+        # Every other frame is 80 ms late
+        jb.push(i * STEP, b"x", arrival=i * 0.05 + (0.08 if i % 2 else 0.0))
+        jb.pop(1e9)
+    assert 0.02 < jb.delay() <= 0.3
+    assert jb.stats()["jitter_ms"] > 50
+
+
+def test_timestamps_survive_wrap_around():
+    jb = make()
+    start = 0xFFFFFFFF - STEP // 2
+    jb.push(start, b"a", arrival=0.0)
+    jb.push((start + STEP) & 0xFFFFFFFF, b"b", arrival=0.05)
+    assert jb.pop(10.0) == (start, b"a")
+    assert jb.pop(10.0) == ((start + STEP) & 0xFFFFFFFF, b"b")
+
+
+def test_rejects_bad_bounds():
+    with pytest.raises(ValueError):
+        JitterBuffer(0.5, 0.1)
@@ -0,0 +1,148 @@
+'''
+tests LiveSource.py: cutting frames out of a byte stream, the ring buffer and viewer cursors
+
+Run from src/:  python -m pytest tests/live_source_tests.py
+'''
+import io
+import os
+import socket
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "main"))
+
+from LiveSource import JpegScanner, LiveRing, LiveStream, LiveSource, LiveSources, is_live
+
+
+def segment(marker, body):
+    return bytes([0xFF, marker]) + (len(body) + 2).to_bytes(2, "big") + body
+
+
+def jpeg(scan=b"\x12\x34\xff\x00\x56", thumbnail=b""):
+    """A minimal frame: SOI, APP1 (maybe holding a whole JPEG thumbnail), SOS, scan data, EOI."""
+    return (b"\xff\xd8" + segment(0xE1, b"Exif\x00\x00" + thumbnail) + segment(0xDA, b"\x01\x01\x00\x00\x3f\x00")
+            + scan + b"\xff\xd9")
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_frames_split_across_reads_and_between_garbage():
+    frames = [jpeg(bytes([i]) * 50) for i in range(3)]
+    data = b"junk" + frames[0] + frames[1] + b"\x00\xff" + frames[2]
+    scanner = JpegScanner()
+    found = []
+    for start in range(0, len(data), 7):
+        found += scanner.feed(data[start:start + 7])
+    assert found == frames
+    assert scanner.discarded == 6
+
+
+def test_thumbnail_does_not_end_the_frame():
+    frame = jpeg(thumbnail=jpeg(b"\x01\x02"))
+    assert JpegScanner().feed(frame) == [frame]
+
+
+def test_real_jpeg_frames():
+    Image = pytest.importorskip("PIL.Image")
+    frames = []
+    for shade in (0, 128, 255):
+        out = io.BytesIO()
+        Image.new("RGB", (64, 48), (shade, 0, 0)).save(out, "JPEG")
+        frames.append(out.getvalue())
+    assert JpegScanner().feed(b"".join(frames)) == frames
+
+
+def test_truncated_frame_resynchronises():
+    scanner = JpegScanner()
+    # A frame cut off in its header, then a whole one: the bad segment length is only
+    # found out once it points at something that is not a marker
+    frame = jpeg(b"\x07" * 400)
+    assert scanner.feed(jpeg()[:5]) == []
+    assert scanner.feed(frame) == [frame]
+
+
+def test_ring_keeps_seconds_within_the_budget():
+    clock = Clock()
+    ring = LiveRing("cam", seconds=1.0, budget=1000, clock=clock)
+    for _ in range(20):
+        ring.append(bytes(100))
+        clock.now += 0.1
+    # Ten frames fit the budget and the time limit
+    assert ring.edge() == 20 and ring.first == 10 and ring.bytes == 1000
+    ring.append(bytes(5000))
+    assert ring.first == 20 and ring.bytes == 5000
+
+
+def test_cursor_starts_at_the_newest_frame_or_behind_it():
+    clock = Clock()
+    ring = LiveRing("cam", clock=clock)
+    for i in range(50):
+        ring.append(bytes([i]))
+        clock.now += 0.1
+    assert LiveStream(ring, "live:cam", 10).nextFrame() == bytes([49])
+    delayed = LiveStream(ring, "live:cam", 10, delay=1.95)
+    assert delayed.nextFrame() == bytes([30])
+    assert delayed.duration() is None
+    with pytest.raises(ValueError):
+        delayed.seek(0)
+
+
+def test_slow_viewer_skips_ahead_without_holding_the_producer():
+    clock = Clock()
+    ring = LiveRing("cam", budget=1000, clock=clock)
+    viewer = LiveStream(ring, "live:cam", 10)
+    ring.append(b"a")
+    assert viewer.nextFrame() == b"a"
+    assert viewer.nextFrame() is None
+    # The producer runs on while the viewer reads nothing
+    for i in range(30):
+        clock.now += 0.1
+        ring.append(bytes([i]))
+    assert viewer.nextFrame() == bytes([29])
+    assert viewer.skips == 1 and viewer.skipped == 29
+
+    # Frames dropped from the ring are skipped too
+    for i in range(2000):
+        ring.append(bytes([i % 256]))
+    assert viewer.nextFrame() == bytes(((2000 - 1) % 256,))
+
+
+def test_sources_and_names():
+    assert is_live("live:cam") and not is_live("movie.Mjpeg")
+    with pytest.raises(ValueError):
+        LiveSource("cam", "tcp:1234")
+    sources = LiveSources()
+    with pytest.raises(IOError):
+        sources.attach("live:missing", 20)
+
+
+def test_udp_ingest():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    sources = LiveSources()
+    source = sources.add("cam", "udp:127.0.0.1:%d" % port)
+    try:
+        viewer = sources.attach("live:cam", 30)
+        frame = jpeg(bytes(range(256)) * 400)
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sender:
+            # A lost datagram leaves half a frame, the next frame starts over
+            sender.sendto(frame[:30000], ("127.0.0.1", port))
+            sender.sendto(frame[:60000], ("127.0.0.1", port))
+            sender.sendto(frame[60000:], ("127.0.0.1", port))
+        deadline = time.monotonic() + 2.0
+        while source.ring.edge() < 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert viewer.nextFrame() == frame
+        assert source.ring.edge() == 1
+    finally:
+        sources.stop()
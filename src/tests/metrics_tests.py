@@ -0,0 +1,111 @@
+'''
+tests Metrics.py, SampledLogger.py and the session metrics of SessionTable.py
+
+Run from src/:  python -m pytest tests/metrics_tests.py
+'''
+import logging
+import os
+import sys
+import urllib.request
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "main"))
+
+from Metrics import MetricsRegistry, MetricsServer, CONTENT_TYPE
+from SampledLogger import SampledLogger
+from SessionTable import SessionTable
+
+
+def test_counter_and_gauge_render_in_text_format():
+    registry = MetricsRegistry()
+    frames = registry.counter("frames_total", "Frames sent")
+    requests = registry.counter("requests_total", "Requests", ("method",))
+    registry.gauge("sessions", "Sessions", function=lambda: 3)
+    frames.inc()
+    frames.inc(2)
+    requests.inc(labels=("PLAY",))
+    requests.inc(labels=('say "hi"\n',))
+
+    text = registry.render()
+    assert "# HELP frames_total Frames sent\n# TYPE frames_total counter\nframes_total 3\n" in text
+    assert 'requests_total{method="PLAY"} 1\n' in text
+    assert 'requests_total{method="say \\"hi\\"\\n"} 1\n' in text
+    assert "# TYPE sessions gauge\nsessions 3\n" in text
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.observe(value)
+
+    lines = registry.render().splitlines()
+    assert 'latency_seconds_bucket{le="0.1"} 2' in lines
+    assert 'latency_seconds_bucket{le="1"} 3' in lines
+    assert 'latency_seconds_bucket{le="+Inf"} 4' in lines
+    assert "latency_seconds_sum 3.65" in lines
+    assert "latency_seconds_count 4" in lines
+
+
+def test_registering_a_name_twice_returns_the_same_metric():
+    registry = MetricsRegistry()
+    assert registry.counter("x_total", "X") is registry.counter("x_total", "X")
+    try:
+        registry.gauge("x_total", "X")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("a counter was re-registered as a gauge")
+
+
+class FakeSession:
+    def __init__(self, session, state, frames):
+        self.clientInfo = {"session": session}
+        self.state = state
+        self.frames = frames
+
+    def sessionMetrics(self):
+        return {"frames_sent": self.frames, "fraction_lost": 0.25}
+
+
+def test_session_table_publishes_states_and_per_session_samples():
+    registry = MetricsRegistry()
+    sessions = SessionTable()
+    sessions.publish(registry)
+    sessions.add(FakeSession(111111, 2, 40))
+    sessions.add(FakeSession(222222, 1, 0))
+
+    text = registry.render()
+    assert 'rtsp_sessions{state="playing"} 1' in text
+    assert 'rtsp_sessions{state="ready"} 1' in text
+    assert 'rtsp_sessions{state="init"} 0' in text
+    assert 'rtsp_session_frames_sent_total{session="111111"} 40' in text
+    assert 'rtsp_session_fraction_lost{session="222222"} 0.25' in text
+
+
+def test_metrics_server_serves_the_registry():
+    registry = MetricsRegistry()
+    registry.counter("scraped_total", "Scrapes").inc()
+    server = MetricsServer(0, registry=registry).start()
+    try:
+        url = "http://127.0.0.1:%d/metrics" % server.server_address[1]
+        with urllib.request.urlopen(url, timeout=5) as response:
+            assert response.headers["Content-Type"] == CONTENT_TYPE
+            assert b"scraped_total 1\n" in response.read()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_sampled_logger_logs_one_in_every(caplog):
+    sampled = SampledLogger("sampled_test", every=10)
+    with caplog.at_level(logging.DEBUG, logger="sampled_test"):
+        logged = [sampled.debug("seq", "seq %d", seq) for seq in range(25)]
+    assert [seq for seq, was in enumerate(logged) if was] == [0, 10, 20]
+    assert caplog.records[1].getMessage() == "seq 10 (1 in 10 logged)"
+
+
+def test_sampled_logger_is_silent_below_its_level(caplog):
+    sampled = SampledLogger("sampled_quiet", every=1)
+    with caplog.at_level(logging.WARNING, logger="sampled_quiet"):
+        assert not sampled.debug("seq", "seq %d", 1)
+    assert sampled.counts == {}
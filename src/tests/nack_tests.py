@@ -0,0 +1,74 @@
+'''
+tests NACK retransmission: RtcpPacket NACK/APP packing, PacketHistory and NackTracker
+
+Run from src/:  python -m pytest tests/nack_tests.py
+'''
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "main"))
+
+import pytest
+
+from RtcpPacket import GenericNack, pack_nack_request, pack_generic_nack, parse_rtcp, nack_deadline
+from PacketHistory import PacketHistory
+from NackTracker import NackTracker
+
+
+def test_generic_nack_compresses_into_pid_and_blp():
+    lost = [100, 101, 105, 116, 117, 300]
+    data = pack_generic_nack(1, 2, lost)
+    # header + media SSRC + three FCI entries (100+bitmask up to 116, 117, 300)
+    assert len(data) == 12 + 4 * 3
+    assert parse_rtcp(data) == [GenericNack(1, 2, lost)]
+
+
+def test_nack_request_carries_deadline():
+    packets = parse_rtcp(pack_nack_request(1, 2, [65535, 0], 0.2))
+    assert sorted(packets[0].lost) == [0, 65535]
+    assert nack_deadline(packets) == 0.2
+
+
+def test_history_is_bounded_by_bytes():
+    history = PacketHistory(budget=1000)
+    for seq in range(10):
+        history.add(seq, bytes(300))
+    assert len(history) == 3
+    assert history.resend(6, 0.0) is None
+    assert history.resend(9, 0.0) == bytes(300)
+    with pytest.raises(ValueError):
+        PacketHistory(0)
+
+
+def test_history_holds_off_repeated_resends():
+    history = PacketHistory()
+    history.add(5, b"packet")
+    assert history.resend(5, 1.0, holdoff=0.1) == b"packet"
+    assert history.resend(5, 1.05, holdoff=0.1) is None
+    assert history.resend(5, 1.2, holdoff=0.1) == b"packet"
+
+
+def test_tracker_nacks_gaps_after_reorder_delay_and_retries():
+    tracker = NackTracker(reorderDelay=0.01, retryInterval=0.05, maxRetries=2)
+    tracker.received(65534, 0.5, now=0.0)
+    tracker.received(1, 0.5, now=0.0)        # 65535 and 0 are missing
+    assert tracker.due(0.005) == ([], None)
+    lost, deadline = tracker.due(0.02)
+    assert lost == [65535, 0] and deadline == pytest.approx(0.48)
+    assert tracker.due(0.03) == ([], None)
+    assert tracker.due(0.08)[0] == [65535, 0]
+    assert tracker.due(0.2)[0] == []          # out of retries
+    assert tracker.received(0, 0.5, now=0.1)
+    tracker.due(0.6)
+    assert tracker.received(65535, 0.5, now=0.7)
+    stats = tracker.stats()
+    assert stats["nacked"] == 2 and stats["in_time"] == 1
+    assert stats["given_up"] == 1 and stats["late"] == 1
+
+
+def test_tracker_drops_duplicates():
+    tracker = NackTracker()
+    assert tracker.received(10, 0.5, now=0.0)
+    assert tracker.received(11, 0.5, now=0.0)
+    assert not tracker.received(10, 0.5, now=0.0)
+    assert tracker.stats()["duplicates"] == 1
@@ -0,0 +1,84 @@
+'''
+tests PacingScheduler.py
+
+Run from src/:  python -m pytest tests/pacing_scheduler_tests.py
+'''
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "main"))
+
+from PacingScheduler import PacingClock, PacingScheduler, PacingStats, CATCH_UP, DROP
+
+
+def test_deadlines_do_not_drift():
+    clock = PacingClock(20, start=100.0)
+    # Every send takes 10 ms longer than planned, yet deadlines stay on the grid.
+    for n in range(1, 50):
+        assert clock.deadline == pytest.approx(100.0 + n * 0.05)
+        clock.due(clock.deadline + 0.01)
+
+
+def test_catch_up_sends_late_frames_back_to_back():
+    clock = PacingClock(20, start=0.0, policy=CATCH_UP)
+    assert clock.due(0.2) == (pytest.approx(0.15), 0)
+    assert clock.deadline == pytest.approx(0.1)
+
+
+def test_drop_skips_frames_whose_time_has_passed():
+    clock = PacingClock(20, start=0.0, policy=DROP)
+    error, skip = clock.due(0.2)
+    assert skip == 3
+    assert clock.deadline == pytest.approx(0.25)
+
+
+def test_drop_skips_whole_periods_despite_rounding():
+    for start in (0.0, 100.0, 12345.678):
+        clock = PacingClock(20, start=start, policy=DROP)
+        for late in range(8):
+            assert clock.due(clock.deadline + late * clock.period)[1] == late
+
+
+def test_stall_longer_than_max_lag_reanchors():
+    clock = PacingClock(20, start=0.0, max_lag=1.0)
+    clock.due(5.0)
+    assert clock.deadline == pytest.approx(5.05)
+
+
+def test_stats_percentiles():
+    stats = PacingStats()
+    for ms in range(100):
+        stats.record(ms / 1000)
+    snapshot = stats.snapshot()
+    assert snapshot["sends"] == 100
+    assert snapshot["max_ms"] == pytest.approx(99)
+    assert snapshot["p50_ms"] == pytest.approx(50)
+
+
+class CountingSession:
+    def __init__(self):
+        self.sends = 0
+        self.done = threading.Event()
+
+    def sendFrame(self, skip=0):
+        self.sends += 1
+        if self.sends == 5:
+            self.done.set()
+
+
+def test_scheduler_paces_and_removes_sessions():
+    scheduler = PacingScheduler()
+    sessions = [CountingSession() for _ in range(3)]
+    for session in sessions:
+        scheduler.add(session, 100)
+    for session in sessions:
+        assert session.done.wait(2)
+        scheduler.remove(session)
+    sends = [session.sends for session in sessions]
+    time.sleep(0.05)
+    assert [session.sends for session in sessions] == sends
+    assert len(scheduler) == 0
@@ -0,0 +1,135 @@
+'''
+tests Profiler.py
+
+Run from src/:  python -m pytest tests/profiler_tests.py
+'''
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "main"))
+
+from Profiler import Profiler, PROFILER, collapse
+
+
+class FakeSession:
+    clientInfo = {'session': 123456}
+
+
+def test_profiler_is_off_by_default():
+    assert PROFILER.enabled is False
+
+
+def test_one_frame_in_every_n_is_timed_per_session_and_stage():
+    profiler = Profiler(every=4)
+    profiler.start()
+    timers = [profiler.timer(FakeSession()) for _ in range(8)]
+    assert [timer is not None for timer in timers] == [False, False, False, True] * 2
+
+    for timer in filter(None, timers):
+        timer.mark("read")
+        timer.mark("send")
+        timer.finish()
+    totals = profiler.stageTotals()
+    assert totals["read"][0] == 2 and totals["send"][0] == 2
+    assert ("123456", "read") in profiler.stats
+    report = profiler.report()
+    assert report.splitlines()[1].split()[:3] == ["all", "read", "2"]
+
+    profiler.stop()
+    assert not profiler.enabled
+
+
+def test_stage_metrics_for_the_registry():
+    profiler = Profiler(every=1)
+    profiler.start()
+    timer = profiler.timer("channel:movie.Mjpeg")
+    timer.mark("packetize")
+    timer.finish()
+    samples, seconds = profiler.metrics()
+    assert samples.get(("packetize",)) == 1
+    assert seconds.get(("packetize", "wall")) >= seconds.get(("packetize", "cpu")) >= 0
+
+
+def nextFrame(event):
+    event.wait(5)
+
+
+def test_stacks_are_collapsed_with_the_stage_at_the_root():
+    event = threading.Event()
+    thread = threading.Thread(target=nextFrame, args=(event,))
+    thread.start()
+    try:
+        time.sleep(0.05)
+        stack = collapse(sys._current_frames()[thread.ident])
+    finally:
+        event.set()
+        thread.join()
+    parts = stack.split(";")
+    assert parts[0] == "read"
+    assert "profiler_tests.py:nextFrame" in parts
+
+
+def test_cprofile_window_covers_the_sending_thread():
+    profiler = Profiler()
+    done = threading.Event()
+
+    def sender():
+        while not done.is_set():
+            if profiler.enabled:
+                profiler.timer(FakeSession())
+            sum(range(1000))
+            time.sleep(0.005)
+
+    thread = threading.Thread(target=sender)
+    thread.start()
+    try:
+        text = profiler.cprofile(0.2)
+    finally:
+        done.set()
+        thread.join()
+    assert "1 thread(s) profiled" in text
+    assert "function calls" in text
+    assert not profiler.enabled
+
+
+def test_thread_idle_after_the_window_stops_profiling_on_its_next_frame():
+    profiler = Profiler()
+    started, resume, done = threading.Event(), threading.Event(), threading.Event()
+
+    def sender():
+        # One frame inside the window, then nothing until after it (all sessions paused)
+        profiler.timer(FakeSession())
+        started.set()
+        resume.wait()
+        profiler.timer(FakeSession())
+        done.set()
+        time.sleep(0.2)
+
+    while_idle = []
+    thread = threading.Thread(target=sender)
+    with_window = threading.Thread(target=lambda: while_idle.append(profiler.cprofile(0.1)))
+    with_window.start()
+    while not profiler.enabled:
+        time.sleep(0.001)
+    thread.start()
+    started.wait()
+    with_window.join()
+    assert "no frames" in while_idle[0] or "did not finish" in while_idle[0]
+    # The sender's profile is still enabled, so the profiler stays on for it
+    assert profiler.enabled and list(profiler.abandoned) == [thread.ident]
+    resume.set()
+    done.wait()
+    assert not profiler.enabled and not profiler.abandoned
+    thread.join()
+
+
+def test_control_routes():
+    profiler = Profiler()
+    routes = profiler.routes()
+    routes["/profile/start"]({"every": "3"})
+    assert profiler.enabled and profiler.every == 3
+    assert routes["/profile/stages"]({})[1].startswith("session")
+    routes["/profile/stop"]({})
+    assert not profiler.enabled
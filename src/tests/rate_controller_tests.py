@@ -0,0 +1,144 @@
+'''
+tests RateController.py, the variant naming of VariantWriter.py and quality switches in ServerWorker
+
+Run from src/:  python -m pytest tests/rate_controller_tests.py
+'''
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "main"))
+
+from RateController import RateController
+from VariantWriter import variant_filename, find_variants
+from ServerWorker import ServerWorker
+from VideoStream import VideoStream
+from FrameStore import FRAME_STORE
+
+
+def make(levels=3):
+    logged = []
+    return RateController(levels, maxThinning=4, upHoldoff=3, downHoldoff=1, log=logged.append), logged
+
+
+def test_ladder_thins_before_lowering_quality():
+    controller, _ = make()
+    assert controller.ladder == [(1, 0), (2, 0), (4, 0), (4, 1), (4, 2)]
+
+
+def test_loss_steps_down_once_per_holdoff_and_logs():
+    controller, logged = make()
+    assert controller.update(0.2)
+    assert controller.thinning == 2
+    assert not controller.update(0.2)         # wait one report for the step to take effect
+    assert controller.update(0.2)
+    assert controller.thinning == 4
+    assert len(logged) == 2 and "loss 20.0%" in logged[0]
+    assert [controller.wantsFrame(n) for n in range(1, 9)] == [False, False, False, True] * 2
+
+
+def test_ramps_back_up_after_good_reports_quality_first():
+    controller, _ = make()
+    for _ in range(8):
+        controller.update(0.5)
+    assert (controller.thinning, controller.quality) == (4, 2)
+    changes = [controller.update(0.0) for _ in range(6)]
+    assert changes == [False, False, True, False, False, True]
+    assert (controller.thinning, controller.quality) == (4, 0)
+
+
+def test_moderate_loss_holds_and_resets_good_run():
+    controller, _ = make()
+    controller.update(0.2)
+    controller.update(0.0)
+    controller.update(0.0)
+    controller.update(0.05)                   # neither good nor congested
+    controller.update(0.0)
+    assert controller.thinning == 2
+
+
+def test_rising_delay_counts_as_congestion():
+    controller, logged = make()
+    for rtt in [0.02, 0.02, 0.04]:
+        assert not controller.update(0.0, rtt)
+    for rtt in [0.15, 0.3]:
+        controller.update(0.0, rtt)
+    assert controller.thinning == 2 and "delay" in logged[0]
+
+
+def test_variant_names(tmp_path):
+    movie = tmp_path / "movie.Mjpeg"
+    movie.write_bytes(b"")
+    assert variant_filename(str(movie), 0) == str(movie)
+    (tmp_path / "movie.q1.Mjpeg").write_bytes(b"")
+    assert find_variants(str(movie)) == [str(movie), str(tmp_path / "movie.q1.Mjpeg")]
+
+
+def test_drop_qualities_keeps_a_valid_step():
+    controller, _ = make()
+    controller.step = 4
+    controller.dropQualities(1)
+    assert controller.ladder == [(1, 0), (2, 0), (4, 0)]
+    assert (controller.thinning, controller.quality) == (4, 0)
+
+
+def marked(quality, count=20):
+    return [b"\xff\xd8" + bytes([quality, i]) + b"\xff\xd9" for i in range(count)]
+
+
+@pytest.fixture
+def movie(write_movie):
+    """A movie with a .q1 variant, the frames marked with their quality and number."""
+    movie = write_movie(marked(0))
+    write_movie(marked(1), variant_filename(movie, 1))
+    return movie
+
+
+def test_quality_switch_waits_for_the_media_lock(movie):
+    worker = ServerWorker({})
+    worker.variants = find_variants(movie)
+    worker.rateController, _ = make(2)
+    original = VideoStream(movie)
+    original.seek(7)
+    worker.clientInfo['videoStream'] = original
+    with worker.mediaLock:
+        switch = threading.Thread(target=worker.switchQuality, args=(1,))
+        switch.start()
+        switch.join(0.2)
+        # A seek holding the lock still has the stream it started with
+        assert switch.is_alive() and worker.clientInfo['videoStream'] is original
+    switch.join(5)
+    variant = worker.clientInfo['videoStream']
+    assert worker.quality == 1 and variant.filename == variant_filename(movie, 1)
+    assert variant.nextFrame()[2:4] == bytes([1, 7])
+    variant.close()
+
+
+def test_missing_variant_is_dropped_from_the_ladder(movie):
+    worker = ServerWorker({})
+    worker.variants = find_variants(movie)
+    os.remove(variant_filename(movie, 1))
+    worker.rateController, _ = make(2)
+    worker.rateController.step = 3
+    worker.clientInfo['videoStream'] = VideoStream(movie)
+    worker.switchQuality(1)
+    assert worker.quality == 0 and worker.variants == [movie]
+    assert worker.rateController.ladder == [(1, 0), (2, 0), (4, 0)] and worker.rateController.quality == 0
+    worker.clientInfo['videoStream'].close()
+
+
+def test_failed_switch_releases_the_variant(movie, write_movie):
+    worker = ServerWorker({})
+    worker.variants = find_variants(movie)
+    worker.rateController, _ = make(2)
+    # The variant is shorter than the position the switch would seek to
+    write_movie(marked(1, 1), variant_filename(movie, 1))
+    worker.clientInfo['videoStream'] = VideoStream(movie, store=FRAME_STORE)
+    worker.clientInfo['videoStream'].seek(7)
+    before = FRAME_STORE.stats()
+    worker.switchQuality(1)
+    assert worker.quality == 0 and worker.variants == [movie]
+    assert FRAME_STORE.stats()["refs"] == before["refs"]
+    worker.clientInfo['videoStream'].close()
@@ -0,0 +1,71 @@
+'''
+tests RtcpPacket.py, RtpReceiverStats.py and the per-session RTP clock
+
+Run from src/:  python -m pytest tests/rtcp_tests.py
+'''
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "main"))
+
+import pytest
+
+from RtcpPacket import (ReportBlock, SenderReport, ReceiverReport, pack_sender_report,
+                        pack_receiver_report, parse_rtcp, ntp_timestamp, ntp_middle)
+from RtpReceiverStats import RtpReceiverStats
+from RtpPacketizer import RtpPacketizer, header_timestamp
+
+BLOCK = ReportBlock(0xCAFEBABE, 64, -3, 70000, 450, 0x12345678, 65536)
+
+
+def test_sender_report_round_trip():
+    data = pack_sender_report(7, 1000.5, 123456, 10, 12000, [BLOCK])
+    [report] = parse_rtcp(data)
+    assert isinstance(report, SenderReport)
+    assert report.ssrc == 7 and report.rtp_timestamp == 123456
+    assert (report.packets, report.octets) == (10, 12000)
+    assert (report.ntp_sec, report.ntp_frac) == ntp_timestamp(1000.5)
+    assert report.reports == [BLOCK]
+
+
+def test_compound_receiver_reports_and_errors():
+    data = pack_receiver_report(9, [BLOCK]) + pack_receiver_report(10)
+    reports = parse_rtcp(data)
+    assert reports == [ReceiverReport(9, [BLOCK]), ReceiverReport(10, [])]
+    with pytest.raises(ValueError):
+        parse_rtcp(data[:-3])
+
+
+def test_ntp_middle_bits():
+    assert ntp_middle(0x0001ABCD, 0x12340000) == 0xABCD1234
+
+
+def test_receiver_stats_loss_and_wrap():
+    stats = RtpReceiverStats(clock=lambda: 0.0)
+    for seq in [65530, 65531, 65533, 65535, 0, 1, 3]:
+        stats.update(1, seq, 0, arrival=0.0)
+    block = stats.report_block(0.0)
+    assert block.ssrc == 1
+    assert block.highest_seq == 65536 + 3
+    assert stats.expected() == 10 and block.cumulative_lost == 3
+    assert block.fraction_lost == (3 << 8) // 10
+    # Nothing new since the last report: no loss in this interval
+    assert stats.report_block(0.0).fraction_lost == 0
+
+
+def test_receiver_stats_jitter_and_dlsr():
+    stats = RtpReceiverStats(clockRate=1000, clock=lambda: 0.0)
+    # Packets sent every 10 ticks but arriving alternately 0 and 5 ms late
+    for i in range(100):
+        stats.update(1, i, i * 10, arrival=i * 0.010 + (0.005 if i % 2 else 0.0))
+    assert 4 < stats.jitter <= 5
+    stats.on_sender_report(SenderReport(2, 0x00010002, 0x80000000, 0, 0, 0, []), arrival=1.0)
+    block = stats.report_block(1.5)
+    assert block.lsr == 0x00028000 and block.dlsr == 32768
+
+
+def test_session_packetizers_are_randomised():
+    a, b = RtpPacketizer.for_session(), RtpPacketizer.for_session()
+    assert (a.ssrc, a.seq_num, a.timestamp_offset) != (b.ssrc, b.seq_num, b.timestamp_offset)
+    [(header, _)] = a.packetize(b"frame", 4500)
+    assert header_timestamp(header) == (4500 + a.timestamp_offset) & 0xFFFFFFFF
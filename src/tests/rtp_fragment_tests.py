@@ -0,0 +1,93 @@
+'''
+tests RtpPacketizer.py and FrameReassembler.py
+
+Run from src/:  python -m pytest tests/rtp_fragment_tests.py
+'''
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "main"))
+
+from RtpPacket import RtpPacket
+from RtpPacketizer import RtpPacketizer
+from FrameReassembler import FrameReassembler
+
+FRAME = bytes(random.Random(7).getrandbits(8) for _ in range(5000))
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def decode(packet):
+    header, payload = packet
+    rtpPacket = RtpPacket()
+    rtpPacket.decode(bytes(header) + bytes(payload))
+    return rtpPacket
+
+
+def test_fragments_fit_mtu_and_mark_last():
+    packets = RtpPacketizer(seq_num=65534, mtu=1000).packetize(FRAME, 4500)
+    decoded = [decode(p) for p in packets]
+
+    assert len(packets) == 6
+    assert all(len(header) + len(payload) <= 1000 for header, payload in packets)
+    assert [p.get_marker() for p in decoded] == [0, 0, 0, 0, 0, 1]
+    assert [p.get_seq_num() for p in decoded] == [65534, 65535, 0, 1, 2, 3]
+    assert {p.get_timestamp() for p in decoded} == {4500}
+
+
+def test_payloads_are_views_of_the_frame():
+    packets = RtpPacketizer(mtu=1000).packetize(FRAME, 4500)
+    assert all(isinstance(payload, memoryview) for _, payload in packets)
+    assert b"".join(payload for _, payload in packets) == FRAME
+
+
+def test_header_buffers_are_reused_across_frames():
+    packetizer = RtpPacketizer(mtu=1000)
+    first = [header for header, _ in packetizer.packetize(FRAME, 4500)]
+    second = [header for header, _ in packetizer.packetize(FRAME[:1500], 9000)]
+    assert all(a is b for a, b in zip(first, second))
+
+
+def test_out_of_order_reassembly():
+    packets = [decode(p) for p in RtpPacketizer(mtu=1000).packetize(FRAME, 4500)]
+    random.Random(3).shuffle(packets)
+    reassembler = FrameReassembler()
+
+    results = [reassembler.add(p) for p in packets]
+    assert results[:-1] == [None] * (len(packets) - 1)
+    assert results[-1] == (4500, FRAME)
+    assert reassembler.completed == 1
+
+
+def test_incomplete_frame_dropped_when_newer_completes():
+    packetizer = RtpPacketizer(mtu=1000)
+    first = [decode(p) for p in packetizer.packetize(FRAME, 4500)]
+    second = [decode(p) for p in packetizer.packetize(b"small", 9000)]
+    reassembler = FrameReassembler()
+
+    for packet in first[1:]:
+        assert reassembler.add(packet) is None
+    assert reassembler.add(second[0]) == (9000, b"small")
+    assert reassembler.dropped == 1
+    # The missing fragment of the older frame is now late
+    assert reassembler.add(first[0]) is None
+    assert reassembler.late == 1
+
+
+def test_partial_frame_times_out():
+    clock = FakeClock()
+    packets = RtpPacketizer(mtu=1000).packetize(FRAME, 4500)
+    reassembler = FrameReassembler(timeout=0.5, clock=clock)
+
+    reassembler.add(decode(packets[0]))
+    clock.now = 1.0
+    for packet in packets[1:]:
+        assert reassembler.add(decode(packet)) is None
+    assert reassembler.dropped == 1
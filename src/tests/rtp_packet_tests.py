@@ -0,0 +1,71 @@
+'''
+tests RtpPacket.py
+
+Run from src/:  python -m pytest tests/rtp_packet_tests.py
+'''
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "main"))
+
+from RtpPacket import RtpPacket, HEADER_SIZE
+
+
+def test_header_bytes():
+    packet = RtpPacket()
+    packet.encapsulate(2, 1, 0, 3, 1, 26, 0x1234, 0xCAFEBABE, b"jpeg")
+    header = packet.get_packet()[:HEADER_SIZE]
+
+    assert header[0] == 0b10100011
+    assert header[1] == 0b10011010
+    assert header[2:4] == b"\x12\x34"
+    assert int.from_bytes(header[4:8], "big") == packet.timestamp
+    assert header[8:12] == b"\xca\xfe\xba\xbe"
+    assert packet.get_packet()[HEADER_SIZE:] == b"jpeg"
+
+
+def test_encode_decode_round_trip():
+    sent = RtpPacket()
+    sent.encapsulate(2, 0, 0, 0, 0, 26, 65535, 0, b"frame")
+
+    received = RtpPacket()
+    received.decode(bytes(sent.get_packet()))
+    assert received.get_version() == 2
+    assert received.get_payload_type() == 26
+    assert received.get_seq_num() == 65535
+    assert received.get_timestamp() == sent.timestamp
+    assert received.get_payload() == b"frame"
+
+
+def test_header_buffer_is_reused():
+    packet = RtpPacket()
+    packet.encapsulate(2, 0, 0, 0, 0, 26, 1, 0, b"a")
+    header = packet.header
+    first = packet.get_packet()
+    packet.encapsulate(2, 0, 0, 0, 0, 26, 2, 0, b"b")
+
+    assert packet.header is header
+    assert first[2:4] == b"\x00\x01"
+    assert packet.get_seq_num() == 2
+
+
+@pytest.mark.parametrize("field, value", [
+    (0, 4), (1, 2), (2, 2), (3, 16), (4, 2), (5, 128), (6, 65536), (7, 1 << 32), (6, -1),
+])
+def test_out_of_range_fields_rejected(field, value):
+    fields = [2, 0, 0, 0, 0, 26, 1, 0]
+    fields[field] = value
+    with pytest.raises(ValueError):
+        RtpPacket().encapsulate(*fields, b"")
+
+
+def test_get_buffers_does_not_join():
+    payload = memoryview(b"frame-bytes")
+    packet = RtpPacket()
+    packet.encapsulate(2, 0, 0, 0, 0, 26, 9, 0, payload)
+    header, body = packet.get_buffers()
+    assert header is packet.header
+    assert body is payload
+    assert bytes(header) + bytes(body) == bytes(packet.get_packet())
@@ -0,0 +1,121 @@
+'''
+tests RtspClient.py and the RTP checks of LoadGenerator.py
+
+Run from src/:  python -m pytest tests/rtsp_client_tests.py
+'''
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "main"))
+
+from RtspClient import RtspClient
+from RtspCodec import RtspMessage
+from LoadGenerator import LoadSession, LoadGenerator, percentiles
+from RtpPacketizer import RtpPacketizer
+
+
+def reply(cseq, session=42, status=200, **headers):
+    headers.update({"CSeq": str(cseq), "Session": str(session)})
+    return RtspMessage(status=status, reason="OK" if status == 200 else "Error", headers=headers)
+
+
+def test_requests_follow_the_state_machine():
+    client = RtspClient("movie.Mjpeg", 1025)
+    assert client.makeRequest(client.PLAY) is None
+    setup = client.makeRequest(client.SETUP)
+    assert setup.seqNum == 1 and client.requestSent == client.SETUP
+
+    assert client.processReply(reply(1, Transport="RTP/AVP;unicast;client_port=1025-1026;server_port=5000-5001")) == client.SETUP
+    assert client.state == client.READY and client.sessionId == 42
+    assert client.serverPorts == (5000, 5001)
+
+    play = client.makeRequest(client.PLAY)
+    assert play.session == 42
+    assert client.processReply(reply(2)) == client.PLAY and client.state == client.PLAYING
+    assert client.makeRequest(client.SETUP) is None
+    client.makeRequest(client.TEARDOWN)
+    assert client.processReply(reply(3)) == client.TEARDOWN and client.state == client.INIT
+    # A new SETUP on the connection gets a new session id
+    assert client.sessionId == 0 and client.makeRequest(client.SETUP).session is None
+    assert client.processReply(reply(4, session=77)) == client.SETUP and client.sessionId == 77
+
+
+def test_stale_foreign_and_error_replies_change_nothing():
+    client = RtspClient("movie.Mjpeg", 1025)
+    client.makeRequest(client.SETUP)
+    client.processReply(reply(1))
+    client.makeRequest(client.PLAY)
+
+    assert client.processReply(reply(1)) is None
+    assert client.processReply(reply(2, session=7)) is None
+    assert client.processReply(reply(2, status=454)) is None
+    assert client.state == client.READY
+
+
+def test_setup_headers_are_only_sent_with_setup():
+    client = RtspClient("movie.Mjpeg", 1025)
+    client.setupHeaders["X-FEC"] = "xor;group=5;depth=1;pt=127"
+    assert client.makeRequest(client.SETUP).headers["X-FEC"] == "xor;group=5;depth=1;pt=127"
+    client.processReply(reply(1))
+    assert "X-FEC" not in client.makeRequest(client.PLAY).headers
+
+
+def test_load_session_counts_loss_reordering_and_duplicates():
+    session = LoadSession(LoadGenerator("localhost", 8000, "movie.Mjpeg", 1), 0, "movie.Mjpeg")
+    session.setupSent = 0.0
+    frame = b"\xff\xd8" + b"x" * 500 + b"\xff\xd9"
+    packetizer = RtpPacketizer(ssrc=9, seq_num=0, mtu=146)
+    packets = [bytes(header) + bytes(payload) for header, payload in packetizer.packetize(frame, 0)]
+    packets += [bytes(header) + bytes(payload) for header, payload in packetizer.packetize(frame, 3000)]
+    assert len(packets) == 8
+
+    for index in (0, 2, 1, 1, 3, 6, 7):
+        session.receiveRtp(packets[index])
+    summary = session.summary()
+    assert (summary["reordered"], summary["duplicates"]) == (1, 1)
+    assert (summary["frames"], summary["bad_frames"]) == (1, 0)
+    assert (summary["lost"], summary["packets"]) == (2, 7)
+    assert session.generator.latencies["first_frame"]
+
+
+def test_seek_sends_range_and_tracks_position():
+    client = RtspClient("movie.Mjpeg", 1025)
+    client.makeRequest(client.SETUP)
+    client.processReply(reply(1))
+    client.makeRequest(client.PLAY)
+    client.processReply(reply(2, Range="npt=0.000-10.000"))
+    # Without a Range, PLAY is not allowed while playing
+    assert client.makeRequest(client.PLAY) is None
+
+    client.seek(4.0)
+    play = client.makeRequest(client.PLAY)
+    assert play.headers["Range"] == "npt=4.000-"
+    assert client.processReply(reply(3, Range="npt=3.950-10.000")) == client.PLAY
+    assert client.state == client.PLAYING and client.position == 3.95
+
+    client.makeRequest(client.PAUSE)
+    client.processReply(reply(4, Range="npt=5.200-10.000"))
+    assert client.state == client.READY and client.position == 5.2
+    assert "Range" not in client.makeRequest(client.PLAY).headers
+
+
+def test_scale_changes_speed_while_playing():
+    client = RtspClient("movie.Mjpeg", 1025)
+    client.makeRequest(client.SETUP)
+    client.processReply(reply(1))
+    client.setScale(8)
+    assert client.makeRequest(client.PLAY).headers["Scale"] == "8"
+    client.processReply(reply(2, Scale="8"))
+    assert client.scale == 8.0
+
+    client.setScale(-1)
+    assert client.makeRequest(client.PLAY).headers["Scale"] == "-1"
+    client.processReply(reply(3, Scale="-1"))
+    assert client.state == client.PLAYING and client.scale == -1.0
+
+
+def test_percentiles():
+    result = percentiles([0.001 * i for i in range(1, 101)])
+    assert result["count"] == 100
+    assert round(result["p50_ms"]) == 51 and round(result["max_ms"]) == 100
+    assert percentiles([])["p99_ms"] == 0.0
@@ -0,0 +1,106 @@
+'''
+tests RtspCodec.py and RtspRequest on the wire
+
+Run from src/:  python -m pytest tests/rtsp_codec_tests.py
+'''
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "main"))
+
+from RtspCodec import RtspParser, RtspMessage, RtspError, InterleavedFrame
+import RtspRequest as rq
+
+SETUP = (b"SETUP rtsp://127.0.0.1:8000/./movie.Mjpeg RTSP/1.0\r\n"
+         b"CSeq: 1\r\nTransport: RTP/AVP;unicast;client_port=1025-1026\r\n\r\n")
+
+
+def test_request_round_trip():
+    request = rq.RtspRequest("PLAY", 7, "/media/my movie.Mjpeg", 1025, session=123456,
+                             headers={"Range": "npt=10-"})
+    message = RtspParser().feed(request.encode("host:8000"))[0]
+    parsed = rq.RtspRequest.fromMessage(message)
+
+    assert message.uri == "rtsp://host:8000//media/my%20movie.Mjpeg"
+    assert (parsed.reqType, parsed.seqNum, parsed.fileName, parsed.rtpPort) == \
+        ("PLAY", 7, "/media/my movie.Mjpeg", 1025)
+    assert parsed.session == 123456
+    assert parsed.headers == {"Range": "npt=10-"}
+
+
+def test_byte_at_a_time_and_coalesced():
+    data = SETUP + SETUP.replace(b"CSeq: 1", b"CSeq: 2")
+    parser = RtspParser()
+    messages = []
+    for i in range(len(data)):
+        messages += parser.feed(data[i:i + 1])
+    assert [m.header("cseq") for m in messages] == ["1", "2"]
+    assert [m.header("CSeq") for m in RtspParser().feed(data)] == ["1", "2"]
+
+
+def test_content_length_body_and_interleaved():
+    reply = RtspMessage(status=200, reason="OK", headers={"CSeq": "3"}, body=b"v=0\r\n")
+    frame = InterleavedFrame(1, b"\x80\x1a")
+    data = reply.encode() + frame.encode() + SETUP
+    parser = RtspParser()
+
+    first = parser.feed(data[:30])
+    rest = parser.feed(data[30:])
+    messages = first + rest
+    assert messages[0].status == 200 and messages[0].body == b"v=0\r\n"
+    assert (messages[1].channel, messages[1].data) == (1, b"\x80\x1a")
+    assert messages[2].method == "SETUP"
+
+
+@pytest.mark.parametrize("data", [
+    b"HELLO\r\n\r\n",
+    b"RTSP/1.0 abc OK\r\n\r\n",
+    b"PLAY x RTSP/1.0\r\nno colon\r\n\r\n",
+    b"PLAY x RTSP/1.0\r\nContent-Length: -1\r\n\r\n",
+    b"PLAY x RTSP/1.0\r\n" + b"X: y\r\n" * 2000,
+])
+def test_malformed_input_raises(data):
+    with pytest.raises(RtspError):
+        RtspParser().feed(data)
+
+
+@pytest.mark.parametrize("data", [
+    b"OPTIONS * RTSP/1.0\r\nCSeq: 1\r\n\r\n",
+    b"PLAY x RTSP/1.0\r\nCSeq: zero\r\n\r\n",
+    b"PLAY x RTSP/1.0\r\n\r\n",
+])
+def test_invalid_requests_rejected(data):
+    with pytest.raises(RtspError):
+        rq.RtspRequest.fromMessage(RtspParser().feed(data)[0])
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("npt=10-", (10.0, None)),
+    ("npt=-20", (0.0, 20.0)),
+    ("npt=now-", (None, None)),
+    ("npt=0:01:00-0:02:00.5", (60.0, 120.5)),
+    ("npt = 2.5-4;time=19970123T143720Z", (2.5, 4.0)),
+])
+def test_parse_range(value, expected):
+    assert rq.parse_range(value) == expected
+
+
+@pytest.mark.parametrize("value", ["smpte=0:10:00-", "npt=10", "npt=5-2", "npt=abc-", "npt=-1-", "npt=1::2-"])
+def test_invalid_range_raises(value):
+    with pytest.raises(ValueError):
+        rq.parse_range(value)
+
+
+def test_format_range_round_trip():
+    assert rq.format_range(12.5) == "npt=12.500-"
+    assert rq.parse_range(rq.format_range(1.25, 30)) == (1.25, 30.0)
+
+
+def test_scale_header():
+    assert rq.parse_scale("-2") == -2.0 and rq.parse_scale(" 0.5") == 0.5
+    assert rq.format_scale(4) == "4" and rq.format_scale(-1.5) == "-1.5"
+    for value in ("0", "x", "inf"):
+        with pytest.raises(ValueError):
+            rq.parse_scale(value)
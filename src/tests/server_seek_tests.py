@@ -0,0 +1,141 @@
+'''
+tests PLAY with a Range or a Scale in ServerWorker: seeking, trick play, timestamps and live streams
+
+Run from src/:  python -m pytest tests/server_seek_tests.py
+'''
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "main"))
+
+from ServerWorker import ServerWorker
+from RateController import RateController
+from VideoStream import VideoStream
+from RtpPacketizer import CLOCK_RATE, header_timestamp
+
+FRAME_RATE = 20
+
+
+@pytest.fixture
+def worker(movie):
+    worker = ServerWorker({})
+    worker.frameRate = FRAME_RATE
+    worker.clientInfo['videoStream'] = VideoStream(movie, FRAME_RATE)
+    worker.state = worker.PLAYING
+    yield worker
+    worker.clientInfo['videoStream'].close()
+
+
+def frame_of(packets):
+    # The payload after the 8-byte JPEG header holds the frame's marker byte
+    return packets[0][1][10]
+
+
+def timestamp_of(worker, packets):
+    return (header_timestamp(packets[0][0]) - worker.packetizer.timestamp_offset) & 0xFFFFFFFF
+
+
+def test_seek_starts_at_the_requested_frame(worker):
+    headers = worker.seek("npt=2.5-", "movie.Mjpeg")
+    assert headers["Range"] == "npt=2.500-5.000"
+    assert "seq=%d" % worker.packetizer.seq_num in headers["RTP-Info"]
+    assert frame_of(worker.nextPackets()) == 50
+
+
+def test_timestamps_stay_monotonic_across_seeks(worker):
+    first = [timestamp_of(worker, worker.nextPackets()) for _ in range(10)]
+    worker.seek("npt=0-", "movie.Mjpeg")
+    after = timestamp_of(worker, worker.nextPackets())
+    assert after == first[-1] + CLOCK_RATE // FRAME_RATE
+
+
+def test_range_end_and_pause_stop_at_a_frame(worker):
+    worker.seek("npt=1-1.1", "movie.Mjpeg")
+    assert frame_of(worker.nextPackets()) == 20
+    assert frame_of(worker.nextPackets()) == 21
+    assert worker.nextPackets() == []
+    worker.state = worker.READY
+    assert worker.position()["Range"] == "npt=1.100-5.000"
+    assert worker.nextPackets() == []
+
+
+@pytest.mark.parametrize("value", ["npt=5-", "npt=9-", "clock=19961108T142300Z-", "npt=3-1"])
+def test_invalid_ranges_raise(worker, value):
+    with pytest.raises(ValueError):
+        worker.seek(value, "movie.Mjpeg")
+
+
+def play(worker, count):
+    frames, timestamps = [], []
+    for _ in range(count):
+        packets = worker.nextPackets()
+        if not packets:
+            break
+        frames.append(frame_of(packets))
+        timestamps.append(timestamp_of(worker, packets))
+    return frames, timestamps
+
+
+def test_fast_forward_sends_every_nth_frame(worker):
+    worker.seek("npt=1-", "movie.Mjpeg", worker.chooseScale("4"))
+    frames, timestamps = play(worker, 4)
+    assert frames == [20, 24, 28, 32]
+    # One frame period apart, as at 1x
+    assert [b - a for a, b in zip(timestamps, timestamps[1:])] == [CLOCK_RATE // FRAME_RATE] * 3
+
+
+def test_thinning_applies_to_the_frames_a_fast_forward_reads(worker):
+    worker.rateController = RateController(maxThinning=2, log=lambda message: None)
+    worker.rateController.update(0.5)
+    assert worker.rateController.thinning == 2
+    worker.seek("npt=1-", "movie.Mjpeg", worker.chooseScale("4"))
+    # At Scale 4 the frame numbers are all odd, but every other frame read still goes out
+    sent = [frame_of(packets) for packets in (worker.nextPackets() for _ in range(8)) if packets]
+    assert sent == [24, 32, 40, 48]
+
+
+def test_rewind_runs_back_to_the_start_with_rising_timestamps(worker):
+    play(worker, 10)
+    worker.seek(None, "movie.Mjpeg", worker.chooseScale("-2"))
+    frames, timestamps = play(worker, 10)
+    assert frames == [7, 5, 3, 1]
+    assert timestamps == sorted(timestamps) and len(set(timestamps)) == 4
+    # Back at 1x from where the rewind stopped
+    worker.seek(None, "movie.Mjpeg")
+    assert frame_of(worker.nextPackets()) == 2
+
+
+def test_late_frame_periods_are_skipped_in_steps(worker):
+    worker.seek("npt=0-", "movie.Mjpeg", worker.chooseScale("2"))
+    first = timestamp_of(worker, worker.nextPackets())
+    packets = worker.nextPackets(skip=1)
+    assert frame_of(packets) == 4
+    assert timestamp_of(worker, packets) == first + 2 * CLOCK_RATE // FRAME_RATE
+
+
+@pytest.mark.parametrize("value, scale", [("2", 2), ("-1", -1), ("0.5", 1), ("3.6", 4), ("1000", 16)])
+def test_scale_is_rounded_to_a_supported_speed(worker, value, scale):
+    assert worker.chooseScale(value) == scale
+    assert worker.seek(None, "movie.Mjpeg", scale)["Scale"] == str(scale)
+
+
+@pytest.mark.parametrize("value", ["0", "fast", "nan"])
+def test_invalid_scale_raises(worker, value):
+    with pytest.raises(ValueError):
+        worker.chooseScale(value)
+
+
+def test_live_streams_only_play_from_now():
+    from LiveSource import LiveRing, LiveStream
+
+    ring = LiveRing("cam")
+    ring.append(b"\xff\xd8" + bytes(10) + b"\xff\xd9")
+    worker = ServerWorker({'videoStream': LiveStream(ring, "live:cam", FRAME_RATE)})
+    worker.state = worker.PLAYING
+    assert worker.chooseScale("4") == 1
+    assert worker.seek("npt=now-", "live:cam")["Range"] == "npt=now-"
+    with pytest.raises(ValueError):
+        worker.seek("npt=10-", "live:cam")
+    assert worker.nextPackets() and worker.nextPackets() == []
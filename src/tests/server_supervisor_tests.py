@@ -0,0 +1,60 @@
+'''
+tests ServerSupervisor.py: worker processes publishing session counts and being restarted after a crash
+
+Run from src/:  python -m pytest tests/server_supervisor_tests.py
+'''
+import os
+import signal
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "main"))
+
+from ServerSupervisor import ServerSupervisor
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "fork"), reason="the supervisor forks its workers")
+
+SESSIONS = 3
+
+
+class Launcher:
+    """Stands in for ServerLauncher: every worker reports SESSIONS sessions and idles."""
+
+    def bindRtspSocket(self, host, port, reusePort=False):
+        return None
+
+    def serve(self, args, rtspSocket, onSessionsChange=None):
+        onSessionsChange(SESSIONS)
+        while True:
+            time.sleep(1)
+
+
+def until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_crashed_worker_is_restarted():
+    supervisor = ServerSupervisor(Launcher(), SimpleNamespace(host="127.0.0.1", port=0, metrics_port=None), 2)
+    supervisor.start()
+    try:
+        assert until(lambda: supervisor.sessionCounts() == [SESSIONS, SESSIONS])
+        crashed = supervisor.processes[0]
+        os.kill(crashed.pid, signal.SIGKILL)
+        crashed.join(5.0)
+        supervisor.poll()
+        assert supervisor.restarts == 1
+        assert supervisor.processes[0] is not crashed and supervisor.processes[0].is_alive()
+        assert supervisor.processes[1].is_alive()
+        # The new worker publishes its own count into the slot
+        assert until(lambda: supervisor.sessionCounts() == [SESSIONS, SESSIONS])
+        supervisor.poll()
+        assert supervisor.restarts == 1
+    finally:
+        supervisor.stop()
+    assert not any(process.is_alive() for process in supervisor.processes)
@@ -0,0 +1,85 @@
+'''
+tests the RTSP state machine in ServerWorker: requests after TEARDOWN, a new SETUP and failed requests
+
+Run from src/:  python -m pytest tests/server_worker_tests.py
+'''
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "main"))
+
+from ServerWorker import ServerWorker
+from SessionTable import SessionTable
+from RtspCodec import RtspParser
+from RtspRequest import RtspRequest
+
+
+class Connection:
+    """The client end of a socket pair, with a ServerWorker serving the other end in its thread."""
+
+    def __init__(self):
+        self.sessions = SessionTable()
+        self.client, server = socket.socketpair()
+        self.client.settimeout(5.0)
+        self.worker = ServerWorker({'rtspSocket': (server, ('127.0.0.1', 0)), 'sessions': self.sessions})
+        self.worker.run()
+        self.parser = RtspParser()
+        self.seq = 0
+
+    def request(self, method, movie):
+        """Returns the status code of the reply."""
+        self.seq += 1
+        self.client.sendall(RtspRequest(method, self.seq, movie, None).encode())
+        while True:
+            messages = self.parser.feed(self.client.recv(4096))
+            if messages:
+                assert messages[0].header("CSeq") == str(self.seq)
+                return messages[0].status
+
+
+def until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_requests_after_teardown(movie):
+    connection = Connection()
+    assert connection.request("SETUP", movie) == 200
+    assert connection.request("PLAY", movie) == 200
+    worker = connection.worker
+    ssrc = worker.packetizer.ssrc
+    worker.rtpFrames = worker.rtpPackets = 5
+    worker.retransmitStats['requested'] = 2
+    assert connection.request("TEARDOWN", movie) == 200
+    # No stream to play or pause any more, but the connection is still served
+    assert connection.request("PLAY", movie) == 455
+    assert worker.state == ServerWorker.INIT
+    assert worker.packetizer.ssrc != ssrc and worker.rtpFrames == worker.rtpPackets == 0
+    assert worker.retransmitStats['requested'] == 0 and 'session' not in worker.clientInfo
+    assert connection.request("PAUSE", movie) == 455
+    assert connection.request("SETUP", movie) == 200
+    assert connection.request("SETUP", movie) == 455
+    assert connection.request("PLAY", movie) == 200
+    assert connection.request("PAUSE", movie) == 200
+    connection.client.close()
+    assert until(lambda: len(connection.sessions) == 0)
+    assert 'videoStream' not in connection.worker.clientInfo
+
+
+def test_failed_request_gets_500_and_the_session_is_cleaned_up(movie):
+    connection = Connection()
+    assert connection.request("SETUP", movie) == 200
+
+    def fail(*args):
+        raise RuntimeError("seek failed")
+    connection.worker.seek = fail
+    assert connection.request("PLAY", movie) == 500
+    assert connection.request("TEARDOWN", movie) == 200
+    assert connection.request("SETUP", movie) == 200
+    connection.client.close()
+    assert until(lambda: len(connection.sessions) == 0)
+    assert 'videoStream' not in connection.worker.clientInfo
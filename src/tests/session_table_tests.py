@@ -0,0 +1,51 @@
+'''
+tests SessionTable.py: session counts, counts by RTSP state and the per-session metrics
+
+Run from src/:  python -m pytest tests/session_table_tests.py
+'''
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "main"))
+
+from SessionTable import SessionTable
+from Metrics import MetricsRegistry
+
+
+class Session:
+
+    def __init__(self, number, state, metrics=None):
+        self.clientInfo = {'session': number}
+        self.state = state
+        self.metrics = metrics or {}
+
+    def sessionMetrics(self):
+        return self.metrics
+
+
+def test_counts_follow_adds_and_removes():
+    changes = []
+    table = SessionTable(changes.append)
+    sessions = [Session(1, 0), Session(2, 2), Session(3, 2)]
+    for session in sessions:
+        table.add(session)
+    table.add(sessions[0])
+    table.remove(sessions[1])
+    table.remove(sessions[1])
+    assert changes == [1, 2, 3, 3, 2, 2]
+    assert len(table) == 2 and set(table.snapshot()) == {sessions[0], sessions[2]}
+    assert table.countByState() == {("init",): 1, ("ready",): 0, ("playing",): 1}
+
+
+def test_publish_exports_states_and_session_metrics():
+    table = SessionTable()
+    table.add(Session(111111, 2, {'frames_sent': 40, 'rtt': 0.02}))
+    table.add(Session(222222, 1, {'frames_sent': 7}))
+    registry = MetricsRegistry()
+    table.publish(registry)
+    text = registry.render()
+    assert 'rtsp_sessions{state="playing"} 1' in text
+    assert 'rtsp_sessions{state="ready"} 1' in text
+    assert 'rtsp_session_frames_sent_total{session="111111"} 40' in text
+    assert 'rtsp_session_frames_sent_total{session="222222"} 7' in text
+    assert 'rtsp_session_rtt_seconds{session="111111"} 0.02' in text
@@ -0,0 +1,184 @@
+'''
+tests VariantCache.py: tiers, the shared LRU, transcoding in the pool, the cache directory and X-Tier at SETUP
+
+Run from src/:  python -m pytest tests/variant_cache_tests.py
+'''
+import io
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "main"))
+
+Image = pytest.importorskip("PIL.Image")
+
+from VariantCache import (VariantCache, Tier, parse_tier, TIER_HEADER, VARIANT_TRANSCODED, VARIANT_DISK_READS,
+                          CHUNK_FRAMES)
+from VideoStream import VideoStream
+from FrameStore import FrameStore
+from RtspRequest import RtspRequest
+from ServerWorker import ServerWorker
+
+TINY = Tier("tiny", 32, 32, 50)
+
+
+def jpeg(shade):
+    out = io.BytesIO()
+    Image.new("RGB", (128, 96), (shade * 20, 0, 0)).save(out, "JPEG")
+    return out.getvalue()
+
+
+@pytest.fixture
+def movie(write_movie):
+    return write_movie(jpeg(shade) for shade in range(12))
+
+
+def settle(cache, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while cache.stats()["pending"] and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert not cache.stats()["pending"]
+
+
+def size_of(data):
+    return Image.open(io.BytesIO(bytes(data))).size
+
+
+def test_parse_tier():
+    assert parse_tier("small=320x240@60") == Tier("small", 320, 240, 60)
+    for value in ("small", "small=320@60", "=320x240@60", "small=320x240@0", "small=axb@c"):
+        with pytest.raises(ValueError):
+            parse_tier(value)
+
+
+def test_lru_stays_within_the_budget():
+    cache = VariantCache([TINY], budget=300)
+    for frame in range(3):
+        cache.put(("movie", TINY, frame), bytes(100))
+    # Frame 0 is used again (as get() does on a hit), so frame 1 is the one dropped
+    cache.entries.move_to_end(("movie", TINY, 0))
+    cache.put(("movie", TINY, 3), bytes(100))
+    assert list(cache.entries) == [("movie", TINY, frame) for frame in (2, 0, 3)]
+    cache.put(("movie", TINY, 4), bytes(1000))
+    assert cache.stats() == {"frames": 3, "bytes": 300, "pending": 0}
+
+
+def test_sessions_share_transcoded_frames(movie):
+    cache = VariantCache([TINY], workers=1)
+    store = FrameStore()
+    try:
+        first = cache.open(VideoStream(movie, store=store), TINY)
+        # Nothing is ready yet: the original frame goes out
+        assert size_of(first.nextFrame()) == (128, 96)
+        settle(cache)
+        before = VARIANT_TRANSCODED.get((TINY.name,))
+        second = cache.open(VideoStream(movie, store=store), TINY)
+        assert size_of(second.nextFrame()) == (32, 24)
+        assert size_of(first.nextFrame()) == (32, 24)
+        assert first.hints is None and second.frame_count() == 12
+        settle(cache)
+        # Every frame was transcoded once, for both sessions
+        assert VARIANT_TRANSCODED.get((TINY.name,)) == before
+        assert cache.stats()["frames"] == 12
+        first.close()
+        second.close()
+    finally:
+        cache.close()
+
+
+def test_evicted_frames_are_transcoded_again(movie):
+    cache = VariantCache([TINY], workers=1)
+    try:
+        stream = cache.open(VideoStream(movie), TINY)
+        settle(cache)
+        # The LRU dropped the later frames of the first chunk, but kept its first
+        for frame in range(1, CHUNK_FRAMES):
+            del cache.entries[(stream.key, TINY, frame)]
+        assert (stream.key, TINY, 0) in cache.entries
+        before = VARIANT_TRANSCODED.get((TINY.name,))
+        assert cache.get(stream, 3) is None
+        settle(cache)
+        assert size_of(cache.get(stream, 3)) == (32, 24)
+        assert VARIANT_TRANSCODED.get((TINY.name,)) == before + CHUNK_FRAMES
+        stream.close()
+    finally:
+        cache.close()
+
+
+def test_pool_starts_with_the_first_transcode(movie):
+    cache = VariantCache([TINY], workers=1)
+    try:
+        assert cache.pool is None
+        cache.open(VideoStream(movie), TINY).close()
+        assert cache.pool is not None
+        settle(cache)
+    finally:
+        cache.close()
+
+
+def test_undecodable_frames_are_not_disk_reads(write_movie, tmp_path):
+    movie = write_movie([b"\xff\xd8" + b"not a jpeg" + b"\xff\xd9"] * 3, "broken.Mjpeg")
+    cache = VariantCache([TINY], workers=1, directory=str(tmp_path / "variants"))
+    try:
+        reads = VARIANT_DISK_READS.get((TINY.name,))
+        stream = cache.open(VideoStream(movie), TINY)
+        settle(cache)
+        assert len(cache.failed) == 3
+        assert VARIANT_DISK_READS.get((TINY.name,)) == reads
+        stream.close()
+    finally:
+        cache.close()
+
+
+def test_cache_directory_survives_a_restart(movie, tmp_path):
+    directory = str(tmp_path / "variants")
+    cache = VariantCache([TINY], workers=1, directory=directory)
+    cache.open(VideoStream(movie), TINY).close()
+    settle(cache)
+    cache.close()
+
+    transcoded = VARIANT_TRANSCODED.get((TINY.name,))
+    restarted = VariantCache([TINY], workers=1, directory=directory)
+    try:
+        stream = VideoStream(movie)
+        stream.seek(5)
+        assert size_of(restarted.open(stream, TINY).nextFrame()) == (32, 24)
+        settle(restarted)
+        assert VARIANT_TRANSCODED.get((TINY.name,)) == transcoded
+    finally:
+        restarted.close()
+
+
+def test_setup_negotiates_an_offered_tier(movie):
+    cache = VariantCache([TINY], workers=1)
+    try:
+        for offer, accepted in (("tiny", "tiny"), ("huge", None), (None, None)):
+            worker = ServerWorker({'variantCache': cache})
+            worker.clientInfo['videoStream'] = VideoStream(movie)
+            headers = {} if offer is None else {TIER_HEADER: offer}
+            request = RtspRequest("SETUP", 1, movie, 1025, headers=headers)
+            assert worker.negotiateTier(request, movie) == accepted
+            assert (worker.tier is TINY) == (accepted is not None)
+            worker.clientInfo['videoStream'].close()
+        assert ServerWorker({'variantCache': cache}).negotiateTier(
+            RtspRequest("SETUP", 1, "live:cam", 1025, headers={TIER_HEADER: "tiny"}), "live:cam") is None
+    finally:
+        cache.close()
+
+
+def test_setup_sends_the_original_if_the_cache_directory_fails(movie, tmp_path):
+    # A file where the cache directory should be: the tier's directory cannot be made
+    blocked = tmp_path / "variants"
+    blocked.write_bytes(b"")
+    cache = VariantCache([TINY], workers=1, directory=str(blocked))
+    try:
+        worker = ServerWorker({'variantCache': cache})
+        original = worker.clientInfo['videoStream'] = VideoStream(movie)
+        request = RtspRequest("SETUP", 1, movie, 1025, headers={TIER_HEADER: "tiny"})
+        assert worker.negotiateTier(request, movie) is None
+        assert worker.tier is None and worker.clientInfo['videoStream'] is original
+        original.close()
+    finally:
+        cache.close()
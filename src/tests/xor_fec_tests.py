@@ -0,0 +1,79 @@
+'''
+tests XorFec.py: parity generation, interleaving and single-loss recovery
+
+Run from src/:  python -m pytest tests/xor_fec_tests.py
+'''
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "main"))
+
+import pytest
+
+from RtpPacketizer import RtpPacketizer
+from XorFec import FecEncoder, FecDecoder, format_fec_params, parse_fec_params, FEC_PT
+
+
+def send(group, depth, frames=3, mtu=200):
+    """ Returns (media packets as bytes, FEC packets as bytes) for a few frames."""
+    packetizer = RtpPacketizer(ssrc=0x1234, seq_num=65530, mtu=mtu)
+    encoder = FecEncoder(group, depth, seq_num=7)
+    media, fec = [], []
+    for i in range(frames):
+        frame = bytes((i * 31 + n) % 256 for n in range(500 + 37 * i))
+        for header, payload in packetizer.packetize(frame, i * 4500):
+            media.append(bytes(header) + bytes(payload))
+            fec.extend(bytes(h) + bytes(p) for h, p in encoder.add(header, payload))
+    return media, fec
+
+
+def test_params_round_trip_and_validation():
+    assert parse_fec_params(format_fec_params(5, 2)) == (5, 2, FEC_PT)
+    assert parse_fec_params("xor;group=4") == (4, 1, FEC_PT)
+    for bad in ["rs;group=4", "xor;depth=2", "xor;group=1", "xor;group=20;depth=3", "xor;group=4;pt=26"]:
+        with pytest.raises(ValueError):
+            parse_fec_params(bad)
+
+
+def test_one_fec_packet_per_group():
+    media, fec = send(4, 2)
+    assert len(fec) == len(media) // 4
+    decoder = FecDecoder()
+    assert all(decoder.is_fec(packet) for packet in fec)
+    assert not any(decoder.is_fec(packet) for packet in media)
+
+
+def test_recovers_single_loss_across_sequence_wrap():
+    media, fec = send(4, 1)
+    lost = media[5]
+    decoder = FecDecoder()
+    recovered = []
+    for packet in media[:8]:
+        if packet is not lost:
+            recovered += decoder.add_media(packet)
+    for packet in fec[:2]:
+        recovered += decoder.add_fec(packet)
+    assert recovered == [lost]
+    assert decoder.recovered == 1
+
+
+def test_interleaving_repairs_a_burst():
+    media, fec = send(3, 2)
+    block = media[:6]
+    decoder = FecDecoder()
+    recovered = []
+    # Two consecutive losses land in different groups
+    for packet in block[:2] + block[4:]:
+        recovered += decoder.add_media(packet)
+    for packet in fec[:2]:
+        recovered += decoder.add_fec(packet)
+    assert sorted(recovered) == sorted(block[2:4])
+
+
+def test_late_media_packet_completes_a_pending_group():
+    media, fec = send(4, 1)
+    decoder = FecDecoder()
+    for packet in media[:2]:
+        decoder.add_media(packet)
+    assert decoder.add_fec(fec[0]) == []      # two of the group still missing
+    assert decoder.add_media(media[2]) == [media[3]]